@@ -1,7 +1,8 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, after_this_request
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, abort
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import os
 import json
 from dotenv import load_dotenv
@@ -18,7 +19,9 @@ from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from io import BytesIO
 import random
 import re
-from midterm_bank import create_randomized_midterm, grade_randomized_midterm, get_task_bank
+import math
+import uuid
+from midterm_bank import grade_randomized_midterm, get_task_bank, CURRENT_BANK_VERSION, RUBRIC_VERSION as MIDTERM_RUBRIC_VERSION
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -121,13 +124,19 @@ class Student(db.Model):
 
 
 class Attendance(db.Model):
+    # One attendance row per student per day
+    __table_args__ = (db.Index('uq_attendance_student_date', 'student_id', 'date', unique=True),)
+
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False)
-    date = db.Column(db.Date, nullable=False)
+    date = db.Column(db.Date, nullable=False, index=True)
     check_in_time = db.Column(db.Time)
     check_out_time = db.Column(db.Time)
     check_in_location = db.Column(db.String(100))  # Latitude,Longitude for check-in
     check_out_location = db.Column(db.String(100))  # Latitude,Longitude for check-out
+    check_in_address = db.Column(db.String(500))  # Filled in later by attendance_geocoder
+    check_out_address = db.Column(db.String(500))
+    geocode_attempts = db.Column(db.Integer, default=0)  # failed address lookups; '' is stored after GEOCODE_MAX_ATTEMPTS
     status = db.Column(db.String(20), default='absent')  # present, absent, late
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -142,6 +151,7 @@ class Quiz(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     due_date = db.Column(db.DateTime)
     is_active = db.Column(db.Boolean, default=True)
+    revision = db.Column(db.Integer, default=0)  # Bumped on every edit; stamps the quiz_cache entry
 
     # Relationship to admin who created the quiz
     admin = db.relationship('Admin', backref=db.backref('quizzes', lazy=True))
@@ -149,7 +159,7 @@ class Quiz(db.Model):
 
 class QuizQuestion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False, index=True)
     question_text = db.Column(db.Text, nullable=False)
     question_number = db.Column(db.Integer, nullable=False)  # Order of the question
 
@@ -159,7 +169,7 @@ class QuizQuestion(db.Model):
 
 class QuizOption(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    question_id = db.Column(db.Integer, db.ForeignKey('quiz_question.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('quiz_question.id'), nullable=False, index=True)
     option_text = db.Column(db.Text, nullable=False)
     is_correct = db.Column(db.Boolean, default=False)  # Only one option should be correct
 
@@ -169,9 +179,11 @@ class QuizOption(db.Model):
 
 class QuizSubmission(db.Model):
     """Stores student's answers to quiz questions"""
+    __table_args__ = (db.Index('uq_quiz_submission_quiz_student', 'quiz_id', 'student_id', unique=True),)
+
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
-    student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False)
+    student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False, index=True)
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
     score = db.Column(db.Integer)  # Total score for the quiz
 
@@ -183,7 +195,7 @@ class QuizSubmission(db.Model):
 class QuizAnswer(db.Model):
     """Stores individual answers to quiz questions"""
     id = db.Column(db.Integer, primary_key=True)
-    submission_id = db.Column(db.Integer, db.ForeignKey('quiz_submission.id'), nullable=False)
+    submission_id = db.Column(db.Integer, db.ForeignKey('quiz_submission.id'), nullable=False, index=True)
     question_id = db.Column(db.Integer, db.ForeignKey('quiz_question.id'), nullable=False)
     selected_option_id = db.Column(db.Integer, db.ForeignKey('quiz_option.id'), nullable=False)  # Student's answer
     is_correct = db.Column(db.Boolean, default=False)  # Whether the answer was correct
@@ -210,9 +222,11 @@ class Assignment(db.Model):
 
 class QuizAssignment(db.Model):
     """Link table to assign quizzes to students"""
+    __table_args__ = (db.Index('uq_quiz_assignment_quiz_student', 'quiz_id', 'student_id', unique=True),)
+
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
-    student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False)
+    student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False, index=True)
     assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='assigned')  # assigned, submitted, graded
     grade = db.Column(db.Float)  # Numeric grade for the quiz
@@ -234,6 +248,7 @@ class MidTerm(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     due_date = db.Column(db.DateTime)
     is_active = db.Column(db.Boolean, default=True)
+    rubric_version = db.Column(db.Integer, default=0)  # Bump to drop memoized grades
 
     # Relationship to admin who created the mid-term
     admin = db.relationship('Admin', backref=db.backref('mid_terms', lazy=True))
@@ -248,13 +263,16 @@ class ExcelSkillsAssignment(db.Model):
     deadline = db.Column(db.DateTime)
     max_marks = db.Column(db.Integer, default=10)
     is_active = db.Column(db.Boolean, default=True)
+    rubric_version = db.Column(db.Integer, default=0)  # Bump to drop memoized grades
 
 
 class ExcelSubmission(db.Model):
     """Track Excel assignment submissions"""
+    __table_args__ = (db.Index('uq_excel_submission_assignment_student', 'assignment_id', 'student_id', unique=True),)
+
     id = db.Column(db.Integer, primary_key=True)
     assignment_id = db.Column(db.Integer, db.ForeignKey('excel_skills_assignment.id'), nullable=False)
-    student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False)
+    student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False, index=True)
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
     score = db.Column(db.Float)  # Auto-graded score out of 10
     percentage = db.Column(db.Float)
@@ -279,17 +297,21 @@ class SQLSkillsAssignment(db.Model):
     deadline = db.Column(db.DateTime)
     max_marks = db.Column(db.Integer, default=10)
     is_active = db.Column(db.Boolean, default=True)
+    rubric_version = db.Column(db.Integer, default=0)  # Bump to drop memoized grades
 
 
 class SQLSubmission(db.Model):
     """Track SQL assignment submissions"""
+    __table_args__ = (db.Index('uq_sql_submission_assignment_student', 'assignment_id', 'student_id', unique=True),)
+
     id = db.Column(db.Integer, primary_key=True)
     assignment_id = db.Column(db.Integer, db.ForeignKey('sql_skills_assignment.id'), nullable=False)
-    student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False)
+    student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False, index=True)
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
     score = db.Column(db.Float)  # Auto-graded score out of 10
     percentage = db.Column(db.Float)
     grade_details = db.Column(db.Text)  # JSON with detailed breakdown (which queries were correct)
+    queries_json = db.Column(db.Text)  # JSON list of the student's queries, kept for re-grading
     status = db.Column(db.String(20), default='submitted')  # submitted, graded
 
     # Relationships
@@ -297,16 +319,42 @@ class SQLSubmission(db.Model):
     student = db.relationship('Student', backref=db.backref('sql_submissions', lazy=True))
 
 
+class SQLRegradeRun(db.Model):
+    """One bulk re-grade of an SQL assignment's stored submissions"""
+    id = db.Column(db.String(32), primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('sql_skills_assignment.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), default='running')  # running, done, failed
+    total = db.Column(db.Integer, default=0)  # submissions being re-graded
+    skipped = db.Column(db.Integer, default=0)  # submissions without stored queries
+    chunks = db.Column(db.Integer, default=0)
+    chunks_done = db.Column(db.Integer, default=0)
+    changed = db.Column(db.Integer)  # scores changed, once applied
+    error = db.Column(db.Text)
+    results_json = db.Column(db.Text)  # {submission id: result} of finished chunks until the run is applied
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime)  # a run still 'running' after this was lost with its process
+    finished_at = db.Column(db.DateTime)
+
+    @property
+    def is_running(self):
+        return self.status == 'running' and self.expires_at > datetime.utcnow()
+
+
 class MidTermAssignment(db.Model):
     """Link table to assign mid-term sheets to students"""
+    __table_args__ = (db.Index('uq_mid_term_assignment_mid_term_student', 'mid_term_id', 'student_id', unique=True),)
+
     id = db.Column(db.Integer, primary_key=True)
     mid_term_id = db.Column(db.Integer, db.ForeignKey('mid_term.id'), nullable=False)
-    student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False)
+    student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False, index=True)
     assigned_sheets = db.Column(db.Text)  # Comma-separated list of sheet numbers assigned
+    bank_version = db.Column(db.Integer)  # midterm_bank version the tasks came from (NULL = 1)
     assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='assigned')  # assigned, submitted, graded
     grade = db.Column(db.Float)  # Numeric grade for the mid-term
     submission_file_path = db.Column(db.String(500))  # Path to submitted file
+    workbook_fingerprint = db.Column(db.String(200))  # midterm_cache fingerprint of the pre-generated workbook
+    workbook_ready_at = db.Column(db.DateTime)  # When the pre-generated workbook was stored
 
     # Relationships
     mid_term = db.relationship('MidTerm', backref=db.backref('mid_term_assignments', lazy=True))
@@ -315,9 +363,11 @@ class MidTermAssignment(db.Model):
 
 class AssignmentSubmission(db.Model):
     """Link table to track assignment submissions"""
+    __table_args__ = (db.Index('uq_assignment_submission_assignment_student', 'assignment_id', 'student_id', unique=True),)
+
     id = db.Column(db.Integer, primary_key=True)
     assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
-    student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False)
+    student_id = db.Column(db.String(50), db.ForeignKey('student.student_id'), nullable=False, index=True)
     submission_url = db.Column(db.String(500))  # Google Drive submission URL
     submitted_at = db.Column(db.DateTime)
     assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -346,133 +396,114 @@ class CourseOutline(db.Model):
     admin = db.relationship('Admin', backref=db.backref('course_outlines', lazy=True))
 
 
+class SyncOutbox(db.Model):
+    """Pending Google Sheets sync events, drained by the background dispatcher"""
+    __table_args__ = (db.Index('ix_sync_outbox_status_next_attempt', 'status', 'next_attempt_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)  # attendance, quiz, assignment, midterm_grade, excel_grade, sql_grade, student
+    payload = db.Column(db.Text, nullable=False)  # JSON keyword arguments for the sync handler
+    status = db.Column(db.String(20), default='pending')  # pending, processing, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    locked_by = db.Column(db.String(32), index=True)  # claim token of the dispatcher running it
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+
+
+class GradingMemo(db.Model):
+    """Grading results keyed by submission content, grader and rubric version"""
+    __table_args__ = (db.Index('uq_grading_memo_key', 'content_hash', 'grader', 'rubric_version', unique=True),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of the upload / queries
+    grader = db.Column(db.String(50), nullable=False)  # excel, sql, midterm
+    rubric_version = db.Column(db.String(200), nullable=False)
+    result_json = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 # Google Sheets Integration - CLEAN SYNC MODULE
 from clean_sheets_sync import (
+    sync_to_sheets,
+    get_sheet_metadata,
+    ensure_sheet_exists,
+    invalidate_row_index,
     sync_student,
     sync_attendance,
     sync_quiz,
     sync_assignment,
     sync_midterm,
     get_sheets_service,
-    get_address_from_coordinates
+    get_address_from_coordinates,
+    SheetsBatch
 )
 
 # Excel assignment module
 from excel_assignment import (
-    create_excel_exercise_workbook,
-    grade_excel_submission
+    grade_excel_submission,
+    RUBRIC_VERSION as EXCEL_RUBRIC_VERSION
 )
 
+# Background Google Sheets sync queue
+from sync_outbox import register_handler, enqueue_sync, start_dispatcher, get_outbox_stats
+from attendance_geocoder import start_geocoder, wake_geocoder
+from quiz_cache import get_compiled_quiz, bump_quiz_revision, invalidate_quiz
+from grading_pool import (
+    register_finisher, submit_job, submit_jobs, free_slots, get_job, GradingQueueFull, GRADING_WORKERS, GRADING_TIMEOUT
+)
+from grading_memo import content_hash, rubric_key, get_memo, store_memo
+from exercise_cache import get_exercise_workbook
+from midterm_cache import (
+    get_midterm_workbook, midterm_spec, midterm_fingerprint, pregenerate_midterm_workbooks, PREGEN_SECONDS_PER_WORKBOOK
+)
+
+register_handler('student')(sync_student)
+
+
+@app.before_request
+def ensure_sync_dispatcher():
+    """Make sure the background sync threads run in this worker (gunicorn never calls __main__)"""
+    start_dispatcher()
+    start_geocoder()
+
+
+@register_handler('excel_grade')
 def sync_excel_grade(student_id, name, assignment_title, score, percentage, submitted_at, is_cheating=False):
     """Sync Excel grade to Google Sheets - Updates row if exists, otherwise appends"""
-    try:
-        service, sheet_id = get_sheets_service()
-        if not service:
-            return False
-        
-        sheet_name = 'Excel Assignments'
-        
-        # Ensure sheet exists
-        try:
-            spreadsheet = service.spreadsheets().get(spreadsheetId=sheet_id).execute()
-            sheets = [s['properties']['title'] for s in spreadsheet.get('sheets', [])]
-            if sheet_name not in sheets:
-                service.spreadsheets().batchUpdate(
-                    spreadsheetId=sheet_id,
-                    body={'requests': [{'addSheet': {'properties': {'title': sheet_name}}}]}
-                ).execute()
-                service.spreadsheets().values().update(
-                    spreadsheetId=sheet_id,
-                    range=f'{sheet_name}!A1',
-                    valueInputOption='USER_ENTERED',
-                    body={'values': [['Student ID', 'Name', 'Assignment', 'Score', 'Percentage', 'Status', 'Submitted At', 'Sync Time']]}
-                ).execute()
-        except Exception as e:
-            print(f"⚠️ Error creating sheet: {e}")
-        
-        # Status column
-        status = "CHEATING DETECTED" if is_cheating else "CLEAN"
-        
-        # Prepare data
-        from datetime import datetime
-        now_str = str(datetime.now())
-        values = [[student_id, name, assignment_title, f"{score}/10", f"{percentage}%", status, str(submitted_at), now_str]]
-        
-        # Check if student already has a row for this assignment
-        try:
-            result = service.spreadsheets().values().get(
-                spreadsheetId=sheet_id,
-                range=f'{sheet_name}!A:C'
-            ).execute()
-            rows = result.get('values', [])
-            
-            row_index = -1
-            for i, row in enumerate(rows):
-                if len(row) >= 3:
-                    # Match Student ID (col A) and Assignment Title (col C)
-                    if str(row[0]).strip() == str(student_id).strip() and str(row[2]).strip() == str(assignment_title).strip():
-                        row_index = i + 1 # 1-based index
-                        break
-            
-            if row_index > 0:
-                # Update existing row
-                service.spreadsheets().values().update(
-                    spreadsheetId=sheet_id,
-                    range=f'{sheet_name}!A{row_index}',
-                    valueInputOption='USER_ENTERED',
-                    body={'values': values}
-                ).execute()
-                print(f"✅ Excel grade UPDATED: {student_id} - {score}/10")
-            else:
-                # Append new row
-                service.spreadsheets().values().append(
-                    spreadsheetId=sheet_id,
-                    range=f'{sheet_name}!A2',
-                    valueInputOption='USER_ENTERED',
-                    body={'values': values}
-                ).execute()
-                print(f"✅ Excel grade APPENDED: {student_id} - {score}/10")
-                
-            return True
-        except Exception as e:
-            print(f"⚠️ Error checking/updating existing row: {e}")
-            # Fallback to append if something goes wrong
-            service.spreadsheets().values().append(
-                spreadsheetId=sheet_id,
-                range=f'{sheet_name}!A2',
-                valueInputOption='USER_ENTERED',
-                body={'values': values}
-            ).execute()
-            return True
-
-    except Exception as e:
-        print(f"❌ Excel grade sync FAILED: {e}")
-        return False
+    # Status column
+    status = "CHEATING DETECTED" if is_cheating else "CLEAN"
+    return sync_to_sheets('Excel Assignments', [
+        student_id,
+        name,
+        assignment_title,
+        f"{score}/10",
+        f"{percentage}%",
+        status,
+        str(submitted_at)
+    ])
 
 # Backward compatibility - keep old function names
-def add_attendance_to_sheet(student_id, name, date, check_in, check_out, status, check_in_location=None, check_out_location=None):
-    """Backward compatible wrapper - extracts address from coordinates"""
-    # Extract address from check_in_location if present
-    address = None
-    if check_in_location:
-        try:
-            parts = str(check_in_location).split(',')
-            if len(parts) == 2:
-                # Call get_address_from_coordinates directly (defined later in this file)
-                address = get_address_from_coordinates(parts[0].strip(), parts[1].strip())
-        except Exception as e:
-            print(f"⚠️ Address extraction error: {e}")
-    
-    return sync_attendance(student_id, name, date, check_in, check_out, status, check_in_location, check_out_location, address)
-
+@register_handler('attendance')
+def add_attendance_to_sheet(student_id, name, date, check_in, check_out, status, check_in_location=None, check_out_location=None,
+                            check_in_address=None, check_out_address=None):
+    """Backward compatible wrapper - addresses are patched in later by attendance_geocoder"""
+    return sync_attendance(student_id, name, date, check_in, check_out, status, check_in_location, check_out_location,
+                           check_in_address, check_out_address)
+
+@register_handler('assignment')
 def add_assignment_submission_to_sheet(student_id, name, assignment_title, submission_url, submitted_at, grade=None):
     """Backward compatible wrapper"""
     return sync_assignment(student_id, name, assignment_title, submission_url, grade, submitted_at)
 
+@register_handler('quiz')
 def add_quiz_submission_to_sheet(student_id, name, quiz_title, score, total_questions, submitted_at):
     """Backward compatible wrapper"""
     return sync_quiz(student_id, name, quiz_title, score, total_questions, submitted_at)
 
+@register_handler('midterm_grade')
 def add_midterm_grade_to_sheet(student_id, name, midterm_title, grade, graded_at):
     """Backward compatible wrapper"""
     return sync_midterm(student_id, name, midterm_title, grade, graded_at)
@@ -614,15 +645,11 @@ def export_to_sheets():
                 # Prepare sheet name
                 sheet_name = table_name.replace('_', ' ').title()
                 
-                # Create sheet if not exists
-                spreadsheet = service.spreadsheets().get(spreadsheetId=SPREADSHEET_ID).execute()
-                sheet_exists = any(s['properties']['title'] == sheet_name for s in spreadsheet.get('sheets', []))
+                # Create sheet if not exists (tab list comes from the shared metadata cache)
+                sheet_exists = sheet_name in get_sheet_metadata(service, SPREADSHEET_ID)['tabs']
                 
                 if not sheet_exists:
-                    service.spreadsheets().batchUpdate(
-                        spreadsheetId=SPREADSHEET_ID,
-                        body={'requests': [{'addSheet': {'properties': {'title': sheet_name}}}]}
-                    ).execute()
+                    ensure_sheet_exists(service, SPREADSHEET_ID, sheet_name, headers=[])
                 else:
                     # Clear existing
                     service.spreadsheets().values().clear(
@@ -643,6 +670,9 @@ def export_to_sheets():
                     body={'values': values}
                 ).execute()
                 
+                # Rows were rewritten - cached row positions for this tab are stale
+                invalidate_row_index(sheet_name)
+                
                 success_count += 1
                 total_rows += len(rows)
                 print(f"✅ Exported {table_name}: {len(rows)} rows")
@@ -670,10 +700,17 @@ def sync_status():
     creds_json = os.getenv('GOOGLE_SHEETS_CREDENTIALS_JSON')
     
     is_configured = bool(google_sheet_id and creds_json)
-    
+
+    try:
+        outbox = get_outbox_stats()
+    except Exception as e:
+        print(f"⚠️ Could not read sync outbox stats: {e}")
+        outbox = None
+
     return render_template('sync_status.html', 
                           google_sheet_id=google_sheet_id,
-                          is_configured=is_configured)
+                          is_configured=is_configured,
+                          outbox=outbox)
 
 
 @app.route('/admin/add_student', methods=['GET', 'POST'])
@@ -696,53 +733,15 @@ def add_student():
         student = Student(student_id=student_id, name=name)
         student.set_password(password)
         db.session.add(student)
-        db.session.commit()
 
-        # Sync to Google Sheets
+        # Queue for Google Sheets - committed together with the student
         try:
-            from google.oauth2.service_account import Credentials
-            from googleapiclient.discovery import build
-            
-            SPREADSHEET_ID = os.getenv('GOOGLE_SHEET_ID')
-            creds_json = os.getenv('GOOGLE_SHEETS_CREDENTIALS_JSON')
-            
-            if SPREADSHEET_ID and creds_json:
-                creds_dict = json.loads(creds_json)
-                SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-                creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-                service = build('sheets', 'v4', credentials=creds)
-                
-                # Create/get Students sheet
-                sheet_name = 'Students'
-                spreadsheet = service.spreadsheets().get(spreadsheetId=SPREADSHEET_ID).execute()
-                sheet_exists = any(s['properties']['title'] == sheet_name for s in spreadsheet.get('sheets', []))
-                
-                if not sheet_exists:
-                    service.spreadsheets().batchUpdate(
-                        spreadsheetId=SPREADSHEET_ID,
-                        body={'requests': [{'addSheet': {'properties': {'title': sheet_name}}}]}
-                    ).execute()
-                    # Add headers
-                    service.spreadsheets().values().update(
-                        spreadsheetId=SPREADSHEET_ID,
-                        range='Students!A1',
-                        valueInputOption='RAW',
-                        body={'values': [['Student ID', 'Name', 'Created At']]}
-                    ).execute()
-                
-                # Append student data
-                service.spreadsheets().values().append(
-                    spreadsheetId=SPREADSHEET_ID,
-                    range='Students!A2',
-                    valueInputOption='RAW',
-                    body={'values': [[student_id, name, str(datetime.now())]]}
-                ).execute()
-                
-                print(f"✅ Student synced to Google Sheets: {student_id}")
+            enqueue_sync('student', student_id=student_id, name=name)
         except Exception as e:
-            print(f"❌ Google Sheets sync error: {e}")
+            print(f"❌ Could not queue Google Sheets sync: {e}")
+        db.session.commit()
 
-        flash('Student added successfully and synced to Google Sheets')
+        flash('Student added successfully. Google Sheets will update shortly.')
         return redirect(url_for('admin_dashboard'))
     
     return render_template('add_student.html')
@@ -866,15 +865,16 @@ def attendance_action():
             flash('Check in first or already checked out')
             return redirect(url_for('student_dashboard'))
 
-    db.session.commit()
-
     # Get student info for Google Sheets
-    student = Student.query.filter_by(student_id=student_id).first()
+    with db.session.no_autoflush:
+        student = Student.query.filter_by(student_id=student_id).first()
 
+    queued = False
     if student:
         try:
-            # Add to Google Sheets
-            success = add_attendance_to_sheet(
+            # Queue for Google Sheets in the same transaction as the attendance row
+            enqueue_sync(
+                'attendance',
                 student_id=student.student_id,
                 name=student.name,
                 date=attendance.date,
@@ -882,19 +882,31 @@ def attendance_action():
                 check_out=attendance.check_out_time,
                 status=attendance.status,
                 check_in_location=attendance.check_in_location,
-                check_out_location=attendance.check_out_location
+                check_out_location=attendance.check_out_location,
+                check_in_address=attendance.check_in_address,
+                check_out_address=attendance.check_out_address
             )
-
-            if not success:
-                flash('Attendance recorded locally but failed to sync to Google Sheets')
-            else:
-                flash(f'Successfully {action.replace("_", " ")}d and synced to Google Sheets')
+            queued = True
         except Exception as e:
-            # Even if Google Sheets sync throws an exception, still confirm local recording
-            print(f"Exception during Google Sheets sync: {e}")
-            flash('Attendance recorded locally but failed to sync to Google Sheets due to an error')
-    else:
+            # Even if queueing the sync fails, still record attendance locally
+            print(f"Exception while queueing Google Sheets sync: {e}")
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request (e.g. double click) already created today's row
+        db.session.rollback()
+        flash('Attendance already recorded for today')
+        return redirect(url_for('student_dashboard'))
+
+    if not student:
         flash('Attendance recorded locally but student info not found for Google Sheets sync')
+    elif queued:
+        # Addresses are resolved in the background so check-in never waits on the geocoder
+        wake_geocoder()
+        flash(f'Successfully {action.replace("_", " ")}d. Google Sheets will update shortly.')
+    else:
+        flash('Attendance recorded locally but failed to queue Google Sheets sync')
 
     return redirect(url_for('student_dashboard'))
 
@@ -1190,7 +1202,8 @@ def upload_quiz_from_excel():
                 flash('No valid questions found in the Excel file', 'error')
                 return redirect(request.url)
             
-            # Commit everything
+            # Commit everything (the revision bump also drops any cache entry left under a reused quiz id)
+            bump_quiz_revision(quiz)
             db.session.commit()
             
             flash(f'Quiz created successfully with {questions_added} questions!', 'success')
@@ -1271,6 +1284,7 @@ def edit_quiz(quiz_id):
         else:
             quiz.due_date = None
 
+        bump_quiz_revision(quiz)
         db.session.commit()
         flash('Quiz updated successfully!')
         return redirect(url_for('admin_quizzes'))
@@ -1296,6 +1310,7 @@ def delete_quiz(quiz_id):
 
     db.session.delete(quiz)
     db.session.commit()
+    invalidate_quiz(quiz_id)
 
     flash('Quiz deleted successfully!')
     return redirect(url_for('admin_quizzes'))
@@ -1308,31 +1323,49 @@ def quiz_report(quiz_id):
 
     quiz = Quiz.query.get_or_404(quiz_id)
 
-    # Get all submissions for this quiz
-    submissions = QuizSubmission.query.filter_by(quiz_id=quiz_id).all()
-
-    # Calculate statistics
-    total_submissions = len(submissions)
-    if total_submissions > 0:
-        average_score = sum([sub.score for sub in submissions]) / total_submissions
-    else:
-        average_score = 0
-
-    # Get detailed submission data
-    submission_details = []
-    for submission in submissions:
-        student = Student.query.filter_by(student_id=submission.student_id).first()
-        submission_details.append({
-            'student': student,
-            'submission': submission,
-            'percentage': (submission.score / len(quiz.questions)) * 100 if len(quiz.questions) > 0 else 0
-        })
+    # Question count from the per-quiz cache, bound into the queries below
+    question_count = get_compiled_quiz(quiz).question_count
+    percentage = db.func.coalesce(QuizSubmission.score * 100.0 / db.func.nullif(db.literal(question_count), 0), 0)
+
+    # One joined query for the table: submission + student + percentage
+    rows = db.session.query(QuizSubmission, Student, percentage.label('percentage')) \
+        .outerjoin(Student, Student.student_id == QuizSubmission.student_id) \
+        .filter(QuizSubmission.quiz_id == quiz_id) \
+        .order_by(QuizSubmission.id).all()
+
+    submission_details = [{
+        'student': student,
+        'submission': submission,
+        'percentage': pct
+    } for submission, student, pct in rows]
+
+    # Statistics computed by the database
+    total_submissions, average_score, min_score, max_score = db.session.query(
+        db.func.count(QuizSubmission.id),
+        db.func.avg(QuizSubmission.score),
+        db.func.min(QuizSubmission.score),
+        db.func.max(QuizSubmission.score)
+    ).filter(QuizSubmission.quiz_id == quiz_id).one()
+
+    # Score distribution in 10% buckets (0-9%, 10-19% ... 90-100%)
+    bucket = db.case(*[(percentage >= low, low) for low in range(90, 0, -10)], else_=0)
+    bucket_counts = dict(db.session.query(bucket, db.func.count(QuizSubmission.id))
+                         .filter(QuizSubmission.quiz_id == quiz_id)
+                         .group_by(bucket).all())
+    distribution = [{
+        'label': f"{low}-{low + 9 if low < 90 else 100}%",
+        'count': bucket_counts.get(low, 0)
+    } for low in range(0, 100, 10)]
 
     return render_template('quiz_report.html',
                           quiz=quiz,
                           submissions=submission_details,
                           total_submissions=total_submissions,
-                          average_score=average_score)
+                          average_score=float(average_score or 0),
+                          min_score=min_score,
+                          max_score=max_score,
+                          total_questions=question_count,
+                          distribution=distribution)
 
 
 @app.route('/admin/quizzes/<int:quiz_id>/manage_questions')
@@ -1384,6 +1417,7 @@ def add_quiz_question(quiz_id):
                 )
                 db.session.add(option)
 
+        bump_quiz_revision(quiz)
         db.session.commit()
         flash('Question added successfully!')
         return redirect(url_for('manage_quiz_questions', quiz_id=quiz_id))
@@ -1408,6 +1442,7 @@ def edit_quiz_question(quiz_id, question_id):
             option.option_text = request.form.get(f'option_{i}', '')
             option.is_correct = request.form.get(f'correct_option') == str(i)
 
+        bump_quiz_revision(quiz)
         db.session.commit()
         flash('Question updated successfully!')
         return redirect(url_for('manage_quiz_questions', quiz_id=quiz_id))
@@ -1426,6 +1461,7 @@ def delete_quiz_question(quiz_id, question_id):
     for option in question.options:
         db.session.delete(option)
 
+    bump_quiz_revision(question.quiz)
     db.session.delete(question)
     db.session.commit()
 
@@ -1572,7 +1608,16 @@ def admin_midterms():
         return redirect(url_for('login'))
 
     midterms = MidTerm.query.order_by(MidTerm.created_at.desc()).all()
-    return render_template('admin_midterms.html', midterms=midterms)
+    # Pre-generated workbooks per mid-term: {midterm id: (ready, assigned)}
+    workbook_counts = {
+        midterm_id: (ready or 0, assigned)
+        for midterm_id, ready, assigned in db.session.query(
+            MidTermAssignment.mid_term_id,
+            db.func.count(MidTermAssignment.workbook_ready_at),
+            db.func.count(MidTermAssignment.id)
+        ).group_by(MidTermAssignment.mid_term_id).all()
+    }
+    return render_template('admin_midterms.html', midterms=midterms, workbook_counts=workbook_counts)
 
 
 @app.route('/admin/midterms/create', methods=['GET', 'POST'])
@@ -1656,7 +1701,8 @@ def assign_midterm(midterm_id):
                     assignment = MidTermAssignment(
                         mid_term_id=midterm_id,
                         student_id=student.student_id,
-                        assigned_sheets=','.join(map(str, sorted(assigned_sheets)))
+                        assigned_sheets=','.join(map(str, sorted(assigned_sheets))),
+                        bank_version=CURRENT_BANK_VERSION
                     )
                     db.session.add(assignment)
         else:
@@ -1678,17 +1724,82 @@ def assign_midterm(midterm_id):
                     assignment = MidTermAssignment(
                         mid_term_id=midterm_id,
                         student_id=student_id,
-                        assigned_sheets=','.join(map(str, sorted(assigned_sheets)))
+                        assigned_sheets=','.join(map(str, sorted(assigned_sheets))),
+                        bank_version=CURRENT_BANK_VERSION
                     )
                     db.session.add(assignment)
 
         db.session.commit()
-        flash('Mid-term assigned successfully!')
+        skipped = start_midterm_pregeneration(midterm) if is_randomized_midterm(midterm) else []
+        if skipped:
+            flash(f'Mid-term assigned, but the grading queue is busy: workbooks for {len(skipped)} students '
+                  f'({", ".join(skipped[:10])}{", ..." if len(skipped) > 10 else ""}) will be built when they download.', 'warning')
+        else:
+            flash('Mid-term assigned successfully!')
         return redirect(url_for('admin_midterms'))
 
     return render_template('assign_midterm.html', midterm=midterm, students=students)
 
 
+def is_randomized_midterm(midterm):
+    """Mid-terms whose workbooks are generated per student from the task bank"""
+    return not midterm.file_url or "Randomized" in midterm.title or midterm.total_sheets >= 100
+
+
+def start_midterm_pregeneration(midterm):
+    """Build every assigned student's workbook in the grading pool ahead of the exam.
+
+    The class is split into at most GRADING_WORKERS jobs, and into no more
+    than half the free queue slots, so the builds run in parallel while
+    student grading can still queue. Returns the student ids whose
+    workbooks could not be queued (they are built on download instead).
+    """
+    specs = [
+        midterm_spec(a) for a in MidTermAssignment.query.filter_by(mid_term_id=midterm.id).all()
+        if a.assigned_sheets and a.workbook_fingerprint != midterm_fingerprint(midterm_spec(a))
+    ]
+    if not specs:
+        return []
+    job_count = max(1, min(GRADING_WORKERS, free_slots() // 2, len(specs)))
+    chunk_size = math.ceil(len(specs) / job_count)
+    chunks = [specs[i:i + chunk_size] for i in range(0, len(specs), chunk_size)]
+    try:
+        submit_jobs('midterm_pregen', pregenerate_midterm_workbooks, [(chunk,) for chunk in chunks], None,
+                    timeout=max(GRADING_TIMEOUT, chunk_size * PREGEN_SECONDS_PER_WORKBOOK),
+                    contexts=[{'midterm_id': midterm.id, 'students': {spec[2]: spec[1] for spec in chunk}}
+                              for chunk in chunks])
+    except GradingQueueFull:
+        # Downloads still build on demand
+        print(f"⚠️ Grading queue full, {len(specs)} mid-term workbooks will be built on download")
+        return [spec[1] for spec in specs]
+    print(f"✅ Pre-generating {len(specs)} workbooks for mid-term {midterm.id} in {len(chunks)} jobs")
+    return []
+
+
+@register_finisher('midterm_pregen')
+def finish_midterm_pregeneration(context, result, error):
+    """Record which pre-generated mid-term workbooks are ready"""
+    if error is not None:
+        return f'Mid-term workbook pre-generation failed: {error}', 'error'
+
+    ready = dict(result)
+    now = datetime.utcnow()
+    for assignment in MidTermAssignment.query.filter(MidTermAssignment.id.in_(list(ready))).all():
+        # Skip workbooks whose tasks were reassigned while they were being built
+        if midterm_fingerprint(midterm_spec(assignment)) == ready[assignment.id]:
+            assignment.workbook_fingerprint = ready[assignment.id]
+            assignment.workbook_ready_at = now
+    db.session.commit()
+
+    skipped = sorted(student_id for assignment_id, student_id in context['students'].items()
+                     if assignment_id not in ready)
+    if skipped:
+        print(f"⚠️ Mid-term {context['midterm_id']}: {len(skipped)} workbooks not pre-generated "
+              f"(built on download): {', '.join(skipped)}")
+        return f'{len(ready)} mid-term workbooks ready, {len(skipped)} will be built on download', 'warning'
+    return f'{len(ready)} mid-term workbooks ready', 'success'
+
+
 @app.route('/admin/midterms/<int:midterm_id>/edit', methods=['GET', 'POST'])
 def edit_midterm(midterm_id):
     if 'admin_id' not in session:
@@ -1777,26 +1888,28 @@ def grade_midterm_submission(midterm_id, student_id):
         grade = float(request.form['grade'])
         submission.grade = grade
         submission.status = 'graded'
-        db.session.commit()
 
-        # Add the grade to Google Sheets
+        # Queue the grade for Google Sheets - committed together with the grade
         try:
-            success = add_midterm_grade_to_sheet(
+            enqueue_sync(
+                'midterm_grade',
                 student_id=submission.student.student_id,
                 name=submission.student.name,
                 midterm_title=submission.mid_term.title,
                 grade=grade,
                 graded_at=datetime.now()
             )
+            success = True
         except Exception as e:
-            # Even if Google Sheets sync throws an exception, still confirm local grading
-            print(f"Exception during Google Sheets midterm grade sync: {e}")
+            # Even if queueing the sync fails, still confirm local grading
+            print(f"Exception while queueing Google Sheets midterm grade sync: {e}")
             success = False
+        db.session.commit()
 
         if success:
-            flash(f'Mid-term submission for {submission.student.name} graded successfully and recorded in Google Sheets!')
+            flash(f'Mid-term submission for {submission.student.name} graded successfully and queued for Google Sheets!')
         else:
-            flash(f'Mid-term submission for {submission.student.name} graded successfully, but failed to record in Google Sheets.')
+            flash(f'Mid-term submission for {submission.student.name} graded successfully, but failed to queue for Google Sheets.')
 
         return redirect(url_for('midterm_submissions', midterm_id=midterm_id))
 
@@ -1838,40 +1951,27 @@ def download_midterm_workbook(midterm_id):
     midterm = MidTerm.query.get_or_404(midterm_id)
 
     # DYNAMIC RANDOMIZED MIDTERM LOGIC
-    if not midterm.file_url or "Randomized" in midterm.title or midterm.total_sheets >= 100:
+    if is_randomized_midterm(midterm):
         if not assignment.assigned_sheets:
             flash('Your randomized tasks have not been generated. Please contact your instructor.', 'error')
             return redirect(url_for('student_midterms'))
             
         try:
-            # Parse assigned task IDs
-            task_ids = [int(tid.strip()) for tid in assignment.assigned_sheets.split(',') if tid.strip()]
-            
-            # Create the dynamic workbook
-            wb = create_randomized_midterm(task_ids)
-            
-            # Save to a temporary file for robust download
-            import tempfile
-            temp_dir = tempfile.gettempdir()
-            temp_path = os.path.join(temp_dir, f"midterm_{midterm_id}_{student_id}.xlsm")
-            
-            wb.save(temp_path)
-            
-            @after_this_request
-            def cleanup(response):
-                try:
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-                except Exception as e:
-                    print(f"Error cleaning up temp file: {e}")
-                return response
+            # Built in memory from cached task sheets and kept per (midterm, student);
+            # the seed keeps each student's data stable across downloads
+            data, etag = get_midterm_workbook(assignment)
 
-            return send_file(
-                temp_path,
+            response = send_file(
+                BytesIO(data),
                 as_attachment=True,
                 download_name=f"midterm_{midterm_id}_{student_id}.xlsm",
-                mimetype='application/vnd.ms-excel.sheet.macroEnabled.12'
+                mimetype='application/vnd.ms-excel.sheet.macroEnabled.12',
+                etag=etag,
+                conditional=True
             )
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
         except Exception as e:
             print(f"Error generating dynamic midterm: {e}")
             import traceback
@@ -1927,46 +2027,89 @@ def submit_midterm(midterm_id):
             # Create a unique filename using student_id and midterm_id
             unique_filename = f"midterm_{midterm_id}_student_{student_id}_{filename}"
             file_path = os.path.join(upload_folder, unique_filename)
-            file.save(file_path)
+            data = file.read()
+            with open(file_path, 'wb') as f:
+                f.write(data)
 
             # Update the assignment record with the submission file path
             assignment.submission_file_path = f"/static/submissions/{unique_filename}"
             assignment.status = 'submitted'
             assignment.submitted_at = datetime.now()
             
-            # AUTO-GRADING FOR DYNAMIC MIDTERM
-            if not midterm.file_url or "Randomized" in midterm.title or midterm.total_sheets >= 100:
+            db.session.commit()
+
+            # AUTO-GRADING FOR DYNAMIC MIDTERM (in the grading pool; the status page polls the job)
+            if is_randomized_midterm(midterm):
                 try:
                     task_ids = [int(tid.strip()) for tid in assignment.assigned_sheets.split(',') if tid.strip()]
-                    score, details = grade_randomized_midterm(file_path, task_ids)
-                    
-                    assignment.grade = float(score)
-                    assignment.status = 'graded'
-                    
-                    # Sync to Google Sheets
-                    student = Student.query.filter_by(student_id=student_id).first()
-                    if student:
-                        add_midterm_grade_to_sheet(
-                            student_id=student.student_id,
-                            name=student.name,
-                            midterm_title=midterm.title,
-                            grade=assignment.grade,
-                            graded_at=datetime.now()
-                        )
-                    
-                    flash(f'Mid-term submitted and AI graded! Score: {assignment.grade}', 'success')
+                    context = {'midterm_id': midterm_id, 'student_id': student_id}
+
+                    # Identical re-upload under the same rubric: reuse the stored grade
+                    digest = content_hash(data)
+                    bank_version = assignment.bank_version or 1
+                    rubric = rubric_key(midterm, MIDTERM_RUBRIC_VERSION, f'b{bank_version}', 't' + '-'.join(map(str, task_ids)))
+                    cached = get_memo(digest, 'midterm', rubric)
+                    if cached is not None:
+                        message, category = finish_midterm_grading(context, cached, None)
+                        flash(message, category)
+                        return redirect(url_for('student_midterms'))
+
+                    context['memo'] = [digest, rubric]
+                    job_id = submit_job(
+                        'midterm', grade_randomized_midterm, (file_path, task_ids, bank_version),
+                        context=context,
+                        owner=student_id,
+                        next_url=url_for('student_midterms')
+                    )
+                    return redirect(url_for('grading_status', job_id=job_id))
                 except Exception as e:
                     print(f"Auto-grading error: {e}")
                     flash('Mid-term submitted successfully! (Auto-grading failed, admin will grade manually)', 'warning')
             else:
                 flash('Mid-term submitted successfully!', 'success')
-                
-            db.session.commit()
+
             return redirect(url_for('student_midterms'))
 
     return render_template('submit_midterm.html', midterm=midterm, assignment=assignment)
 
 
+@register_finisher('midterm')
+def finish_midterm_grading(context, result, error):
+    """Store a randomized mid-term grade computed by the grading pool (or taken from the memo)"""
+    if error is not None:
+        return 'Mid-term submitted successfully! (Auto-grading failed, admin will grade manually)', 'warning'
+
+    score, details = result
+    if context.get('memo') and details != "Error":  # "Error" = workbook could not be opened
+        store_memo(context['memo'][0], 'midterm', context['memo'][1], [score, details])
+    midterm = MidTerm.query.get(context['midterm_id'])
+    assignment = MidTermAssignment.query.filter_by(
+        mid_term_id=context['midterm_id'],
+        student_id=context['student_id']
+    ).first()
+
+    assignment.grade = float(score)
+    assignment.status = 'graded'
+
+    # Queue for Google Sheets - committed together with the grade
+    student = Student.query.filter_by(student_id=context['student_id']).first()
+    if student:
+        try:
+            enqueue_sync(
+                'midterm_grade',
+                student_id=student.student_id,
+                name=student.name,
+                midterm_title=midterm.title,
+                grade=assignment.grade,
+                graded_at=datetime.now()
+            )
+        except Exception as e:
+            print(f"⚠️ Could not queue Google Sheets sync: {e}")
+    db.session.commit()
+
+    return f'Mid-term submitted and AI graded! Score: {assignment.grade}', 'success'
+
+
 @app.route('/student/quizzes')
 def student_quizzes():
     if 'student_id' not in session:
@@ -2012,13 +2155,18 @@ def take_quiz(quiz_id):
         flash('You have already taken this quiz.', 'info')
         return redirect(url_for('view_quiz_result', quiz_id=quiz_id))
 
-    questions = QuizQuestion.query.filter_by(quiz_id=quiz_id).order_by(QuizQuestion.question_number).all()
+    # Questions, options and answer key come from the per-quiz cache
+    compiled = get_compiled_quiz(quiz)
+    questions = compiled.questions
 
     if request.method == 'POST':
         # Process the quiz submission
         correct_answers = 0
         total_questions = len(questions)
 
+        # Answer key for the whole quiz: option id -> (question id, is_correct)
+        answer_key = compiled.answer_key
+
         # Create a new submission
         submission = QuizSubmission(
             quiz_id=quiz_id,
@@ -2026,48 +2174,55 @@ def take_quiz(quiz_id):
             score=0  # Will be calculated after processing answers
         )
         db.session.add(submission)
-        db.session.flush()  # Get the submission ID
+        try:
+            db.session.flush()  # Get the submission ID
+        except IntegrityError:
+            # Same quiz submitted twice at once (double click) - the first one wins
+            db.session.rollback()
+            flash('You have already taken this quiz.', 'info')
+            return redirect(url_for('view_quiz_result', quiz_id=quiz_id))
 
-        # Process each question
+        # Grade every question with dict lookups
+        answers = []
         for question in questions:
-            selected_option_id = request.form.get(f'question_{question.id}')
-
-            if selected_option_id:
-                # Find the selected option
-                selected_option = QuizOption.query.get(selected_option_id)
-
-                # Determine if the answer is correct
-                is_correct_answer = selected_option.is_correct if selected_option else False
-
-                # Create the answer record
-                answer = QuizAnswer(
-                    submission_id=submission.id,
-                    question_id=question.id,
-                    selected_option_id=selected_option_id,
-                    is_correct=is_correct_answer
-                )
-                db.session.add(answer)
+            try:
+                selected_option_id = int(request.form.get(f'question_{question.id}', ''))
+            except ValueError:
+                continue  # Not answered
+
+            key = answer_key.get(selected_option_id)
+            if key is None or key[0] != question.id:
+                continue  # Option does not belong to this question
+
+            is_correct_answer = bool(key[1])
+            answers.append({
+                'submission_id': submission.id,
+                'question_id': question.id,
+                'selected_option_id': selected_option_id,
+                'is_correct': is_correct_answer
+            })
+            if is_correct_answer:
+                correct_answers += 1
 
-                # Increment correct answers if the answer is correct
-                if is_correct_answer:
-                    correct_answers += 1
+        # All answers in one bulk insert
+        if answers:
+            db.session.execute(db.insert(QuizAnswer), answers)
 
         # Update the submission score
         submission.score = correct_answers
-        db.session.commit()
 
         # Update the quiz assignment status and grade
         quiz_assignment.status = 'graded'  # Since scoring is automatic, mark as graded
         quiz_assignment.grade = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
-        db.session.commit()
 
         # Get student info for Google Sheets
         student = Student.query.filter_by(student_id=student_id).first()
 
         if student:
             try:
-                # Add to Google Sheets
-                success = add_quiz_submission_to_sheet(
+                # Queue for Google Sheets
+                enqueue_sync(
+                    'quiz',
                     student_id=student.student_id,
                     name=student.name,
                     quiz_title=quiz.title,
@@ -2075,57 +2230,25 @@ def take_quiz(quiz_id):
                     total_questions=total_questions,
                     submitted_at=submission.submitted_at
                 )
+                success = True
             except Exception as e:
-                # Even if Google Sheets sync throws an exception, still confirm local recording
-                print(f"Exception during Google Sheets quiz sync: {e}")
+                # Even if queueing the sync fails, still confirm local recording
+                print(f"Exception while queueing Google Sheets quiz sync: {e}")
                 success = False
         else:
             success = False  # Skip Google Sheets sync if student not found
 
-        # Also save detailed answers to Google Sheets
-        # We need to get the questions and answers data for the detailed report
-        questions_data = []
-        for question in questions:
-            # Find the answer for this question in this submission
-            answer = next((ans for ans in submission.answers if ans.question_id == question.id), None)
-
-            selected_option = None
-            is_correct = False
-            if answer:
-                selected_option = answer.selected_option
-                is_correct = answer.is_correct
-
-            # Get the correct option for this question
-            correct_option = QuizOption.query.filter_by(question_id=question.id, is_correct=True).first()
-
-            questions_data.append({
-                'question': question,
-                'selected_option': selected_option,
-                'correct_option': correct_option,
-                'is_correct': is_correct
-            })
-
-        # Save detailed answers to Google Sheets
+        # One transaction for submission, answers, grade and the sync event
         try:
-            detailed_success = add_detailed_quiz_answers_to_sheet(
-                student_id=student.student_id,
-                name=student.name,
-                quiz_title=quiz.title,
-                questions_data=questions_data,
-                submitted_at=submission.submitted_at
-            )
-        except Exception as e:
-            # Even if Google Sheets sync throws an exception, still confirm local recording
-            print(f"Exception during Google Sheets detailed quiz answers sync: {e}")
-            detailed_success = False
-
-        if not success or not detailed_success:
-            if not success and not detailed_success:
-                flash('Quiz submitted locally but failed to sync to Google Sheets', 'warning')
-            elif not success:
-                flash('Quiz submitted but summary failed to sync to Google Sheets', 'warning')
-            else:
-                flash('Quiz submitted but detailed answers failed to sync to Google Sheets', 'warning')
+            db.session.commit()
+        except IntegrityError:
+            # Same quiz submitted twice at once (double click) - the first one wins
+            db.session.rollback()
+            flash('You have already taken this quiz.', 'info')
+            return redirect(url_for('view_quiz_result', quiz_id=quiz_id))
+
+        if not success:
+            flash('Quiz submitted locally but failed to queue Google Sheets sync', 'warning')
         else:
             flash(f'Quiz submitted successfully! You scored {correct_answers}/{total_questions}.', 'success')
 
@@ -2164,28 +2287,28 @@ def view_quiz_result(quiz_id):
         else:
             return redirect(url_for('student_quizzes'))
 
-    # Get questions and answers
-    # Get all questions for this quiz
-    questions = QuizQuestion.query.filter_by(quiz_id=quiz.id).order_by(QuizQuestion.question_number).all()
+    # Questions and options from the per-quiz cache; only the student's answers hit the DB
+    compiled = get_compiled_quiz(quiz)
+    answers = {
+        question_id: (selected_option_id, is_correct)
+        for question_id, selected_option_id, is_correct in db.session.query(
+            QuizAnswer.question_id, QuizAnswer.selected_option_id, QuizAnswer.is_correct
+        ).filter(QuizAnswer.submission_id == submission.id).all()
+    }
 
     questions_data = []
-    for question in questions:
+    for question in compiled.questions:
         # Find the answer for this question in this submission
-        answer = next((ans for ans in submission.answers if ans.question_id == question.id), None)
-
         selected_option = None
         is_correct = False
-        if answer:
-            selected_option = answer.selected_option
-            is_correct = answer.is_correct
-
-        # Get the correct option for this question
-        correct_option = QuizOption.query.filter_by(question_id=question.id, is_correct=True).first()
+        if question.id in answers:
+            selected_option_id, is_correct = answers[question.id]
+            selected_option = compiled.options_by_id.get(selected_option_id)
 
         questions_data.append({
             'question': question,
             'selected_option': selected_option,
-            'correct_option': correct_option,
+            'correct_option': compiled.correct_options.get(question.id),
             'is_correct': is_correct
         })
 
@@ -2235,32 +2358,35 @@ def submit_assignment(assignment_id):
         submission.status = 'submitted'
         submission.submitted_at = datetime.now()
 
-        db.session.commit()
-
         # Get student info for Google Sheets
         student = Student.query.filter_by(student_id=student_id).first()
 
         if student:
             try:
-                # Add to Google Sheets
-                success = add_assignment_submission_to_sheet(
+                # Queue for Google Sheets
+                enqueue_sync(
+                    'assignment',
                     student_id=student.student_id,
                     name=student.name,
                     assignment_title=assignment.title,
                     submission_url=submission_url,
                     submitted_at=submission.submitted_at
                 )
+                success = True
             except Exception as e:
-                # Even if Google Sheets sync throws an exception, still confirm local recording
-                print(f"Exception during Google Sheets assignment sync: {e}")
+                # Even if queueing the sync fails, still confirm local recording
+                print(f"Exception while queueing Google Sheets assignment sync: {e}")
                 success = False
         else:
             success = False  # Skip Google Sheets sync if student not found
 
+        # The submission and its sync event are committed together
+        db.session.commit()
+
         if not success:
-            flash('Assignment submitted locally but failed to sync to Google Sheets', 'warning')
+            flash('Assignment submitted locally but failed to queue Google Sheets sync', 'warning')
         else:
-            flash('Assignment submitted successfully and synced to Google Sheets!', 'success')
+            flash('Assignment submitted successfully! Google Sheets will update shortly.', 'success')
 
         return redirect(url_for('student_assignments'))
 
@@ -2402,6 +2528,29 @@ def create_excel_assignment():
     return render_template('create_excel_assignment.html')
 
 
+@app.route('/admin/grading/<kind>/<int:assignment_id>/bump-rubric', methods=['POST'])
+def bump_rubric_version(kind, assignment_id):
+    """Invalidate memoized grades for one assignment after its rubric changed"""
+    if 'admin_id' not in session:
+        return redirect(url_for('login'))
+
+    models = {'excel': ExcelSkillsAssignment, 'sql': SQLSkillsAssignment, 'midterm': MidTerm}
+    if kind not in models:
+        abort(404)
+    assignment = models[kind].query.get_or_404(assignment_id)
+
+    assignment.rubric_version = (assignment.rubric_version or 0) + 1
+    # Old memo rows can never match again
+    GradingMemo.query.filter(
+        GradingMemo.grader == kind,
+        GradingMemo.rubric_version.like(f'v%.a{assignment.id}.r%')
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+    flash(f'✅ Rubric version for "{assignment.title}" is now {assignment.rubric_version}. Resubmissions will be graded again.')
+    return redirect(request.referrer or url_for('admin_dashboard'))
+
+
 @app.route('/admin/excel-assignments/<int:assignment_id>/submissions')
 def view_excel_submissions(assignment_id):
     """View all submissions for an assignment"""
@@ -2458,21 +2607,21 @@ def download_excel_exercise(assignment_id):
     
     assignment = ExcelSkillsAssignment.query.get_or_404(assignment_id)
     
-    # Generate workbook with exercises
-    wb = create_excel_exercise_workbook(assignment_title=assignment.title)
-
-    # Save to BytesIO
-    output = BytesIO()
-    # Save as .xlsm if it was loaded from a template with VBA
-    wb.save(output)
-    output.seek(0)
+    # Pre-built workbook bytes (generated once per exercise variant/template/version)
+    data, etag = get_exercise_workbook(assignment.title)
 
-    return send_file(
-        output,
+    response = send_file(
+        BytesIO(data),
         mimetype='application/vnd.ms-excel.sheet.macroEnabled.12',
         as_attachment=True,
-        download_name=f'Excel_Exercises_{assignment.title.replace(" ", "_")}.xlsm'
+        download_name=f'Excel_Exercises_{assignment.title.replace(" ", "_")}.xlsm',
+        etag=etag,
+        conditional=True
     )
+    # Per-student page behind a login: let the browser revalidate, never share
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 @app.route('/student/excel/submit/<int:assignment_id>', methods=['GET', 'POST'])
 def submit_excel_assignment(assignment_id):
@@ -2503,71 +2652,152 @@ def submit_excel_assignment(assignment_id):
             flash('❌ Only Excel files (.xlsx, .xlsm) allowed!')
             return redirect(request.url)
         
-        # Save file temporarily
+        data = file.read()
+        context = {'assignment_id': assignment_id, 'student_id': student_id}
+
+        # Identical re-upload under the same rubric: reuse the stored grade
+        digest = content_hash(data)
+        rubric = rubric_key(assignment, EXCEL_RUBRIC_VERSION, content_hash(assignment.title)[:12])  # The title picks the skill
+        cached = get_memo(digest, 'excel', rubric)
+        if cached is not None:
+            message, _ = finish_excel_grading(context, cached, None)
+            flash(message)
+            return redirect(url_for('student_excel_assignments'))
+
+        # Save the upload for the grading worker (the finisher deletes it)
         import tempfile
         # Check original extension
         ext = '.xlsm' if file.filename.endswith('.xlsm') else '.xlsx'
         with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            file.save(tmp.name)
-            
-            # Auto-grade
-            result = grade_excel_submission(tmp.name, assignment_title=assignment.title)
-            
-            if 'macros_disabled' in result and result['macros_disabled']:
-                flash('❌ MARKS: 0 - Macros were NOT enabled. You MUST enable macros to complete the assignment!')
-                # We still record it as 0
-            
-            if result.get('cheating_detected'):
-                flash('🚨 MARKS: 0 - CHEATING DETECTED! Other windows or files were opened.')
-            
-            if 'error' in result:
-                flash(f'❌ Error grading file: {result["error"]}')
-                return redirect(request.url)
-            
-            # Create or update submission
-            if existing:
-                existing.score = result['score']
-                existing.percentage = result['percentage']
-                existing.grade_details = json.dumps(result['details'])
-                existing.status = 'graded'
-                existing.submitted_at = datetime.now()
-                existing.is_cheating = result.get('cheating_detected', False)
-                existing.macros_disabled = result.get('macros_disabled', False)
-            else:
-                submission = ExcelSubmission(
-                    assignment_id=assignment_id,
-                    student_id=student_id,
+            tmp.write(data)
+        context.update(file_path=tmp.name, memo=[digest, rubric])
+
+        # Auto-grade in the grading pool; the status page polls the job
+        try:
+            job_id = submit_job(
+                'excel', grade_excel_submission, (tmp.name, assignment.title),
+                context=context,
+                owner=student_id,
+                next_url=url_for('student_excel_assignments')
+            )
+        except GradingQueueFull:
+            os.unlink(tmp.name)
+            flash('⏳ The auto-grader is busy right now. Please submit again in a minute.')
+            return redirect(request.url)
+
+        return redirect(url_for('grading_status', job_id=job_id))
+
+    return render_template('submit_excel.html', assignment=assignment, existing=existing)
+
+
+@register_finisher('excel')
+def finish_excel_grading(context, result, error):
+    """Store an Excel grade computed by the grading pool (or taken from the memo)"""
+    if context.get('file_path'):
+        try:
+            os.unlink(context['file_path'])
+        except OSError:
+            pass
+
+    if error is not None:
+        return f'❌ Error grading file: {error}', 'error'
+    if 'error' in result:
+        return f'❌ Error grading file: {result["error"]}', 'error'
+    if context.get('memo'):
+        store_memo(context['memo'][0], 'excel', context['memo'][1], result)
+
+    messages = []
+    if result.get('macros_disabled'):
+        # We still record it as 0
+        messages.append('❌ MARKS: 0 - Macros were NOT enabled. You MUST enable macros to complete the assignment!')
+    if result.get('cheating_detected'):
+        messages.append('🚨 MARKS: 0 - CHEATING DETECTED! Other windows or files were opened.')
+
+    assignment = ExcelSkillsAssignment.query.get(context['assignment_id'])
+    student_id = context['student_id']
+
+    student = Student.query.filter_by(student_id=student_id).first()
+
+    # Create or update submission
+    for attempt in range(2):
+        existing = ExcelSubmission.query.filter_by(
+            assignment_id=assignment.id,
+            student_id=student_id
+        ).first()
+        if existing:
+            existing.score = result['score']
+            existing.percentage = result['percentage']
+            existing.grade_details = json.dumps(result['details'])
+            existing.status = 'graded'
+            existing.submitted_at = datetime.now()
+            existing.is_cheating = result.get('cheating_detected', False)
+            existing.macros_disabled = result.get('macros_disabled', False)
+        else:
+            submission = ExcelSubmission(
+                assignment_id=assignment.id,
+                student_id=student_id,
+                score=result['score'],
+                percentage=result['percentage'],
+                grade_details=json.dumps(result['details']),
+                status='graded',
+                is_cheating=result.get('cheating_detected', False),
+                macros_disabled=result.get('macros_disabled', False)
+            )
+            db.session.add(submission)
+
+        # Queue for Google Sheets - committed together with the grade
+        if student:
+            try:
+                enqueue_sync(
+                    'excel_grade',
+                    student_id=student.student_id,
+                    name=student.name,
+                    assignment_title=assignment.title,
                     score=result['score'],
                     percentage=result['percentage'],
-                    grade_details=json.dumps(result['details']),
-                    status='graded',
-                    is_cheating=result.get('cheating_detected', False),
-                    macros_disabled=result.get('macros_disabled', False)
+                    submitted_at=datetime.now(),
+                    is_cheating=result.get('cheating_detected', False)
                 )
-                db.session.add(submission)
-            
+            except Exception as e:
+                print(f"⚠️ Could not queue Google Sheets sync: {e}")
+        try:
             db.session.commit()
-            
-            # Sync to Google Sheets
-            student = Student.query.filter_by(student_id=student_id).first()
-            if student:
-                try:
-                    sync_excel_grade(
-                        student_id=student.student_id,
-                        name=student.name,
-                        assignment_title=assignment.title,
-                        score=result['score'],
-                        percentage=result['percentage'],
-                        submitted_at=datetime.now(),
-                        is_cheating=result.get('cheating_detected', False)
-                    )
-                except Exception as e:
-                    print(f"⚠️ Google Sheets sync failed: {e}")
-            
-            flash(f'✅ Submitted! Score: {result["score"]}/10 ({result["percentage"]}%)')
-            return redirect(url_for('student_excel_assignments'))
+            break
+        except IntegrityError:
+            # Another upload from the same student was stored first; update that row instead
+            db.session.rollback()
+            if attempt:
+                raise
 
-    return render_template('submit_excel.html', assignment=assignment, existing=existing)
+    messages.append(f'✅ Submitted! Score: {result["score"]}/10 ({result["percentage"]}%)')
+    return ' '.join(messages), 'warning' if len(messages) > 1 else 'success'
+
+
+@app.route('/grading/<job_id>')
+def grading_status(job_id):
+    """Result page for a submission that is being graded in the background"""
+    if 'student_id' not in session:
+        return redirect(url_for('login'))
+
+    job = get_job(job_id)
+    if not job or job['owner'] != session['student_id']:
+        flash('Grading job not found.', 'error')
+        return redirect(url_for('student_dashboard'))
+
+    return render_template('grading_status.html', job=job)
+
+
+@app.route('/grading/<job_id>/status')
+def grading_job_status(job_id):
+    """Polled by grading_status.html"""
+    if 'student_id' not in session:
+        return {'error': 'not logged in'}, 401
+
+    job = get_job(job_id)
+    if not job or job['owner'] != session['student_id']:
+        return {'error': 'not found'}, 404
+
+    return {'status': job['status'], 'message': job['message'], 'category': job['category']}
 
 
 # ============================================
@@ -2616,8 +2846,14 @@ def take_sql_assignment(assignment_id):
             query = request.form.get(f'query_{i}', '').strip()
             student_queries.append(query)
         
-        # Auto-grade
-        result = grade_sql_submission(student_queries, questions, assignment.sample_sql)
+        # Auto-grade (identical queries under the same rubric reuse the stored result)
+        digest = content_hash(json.dumps(student_queries))
+        rubric = rubric_key(assignment, SQL_RUBRIC_VERSION, content_hash(assignment.questions_json + (assignment.sample_sql or ''))[:12])
+        result = get_memo(digest, 'sql', rubric)
+        if result is None:
+            result = grade_sql_submission(student_queries, questions, assignment.sample_sql)
+            if not result.get('timed_out'):  # a time limit hit under load may pass next time
+                store_memo(digest, 'sql', rubric, result)
         
         # Create submission (update is no longer allowed based on the logic above)
         submission = SQLSubmission(
@@ -2626,26 +2862,36 @@ def take_sql_assignment(assignment_id):
             score=result['score'],
             percentage=result['percentage'],
             grade_details=json.dumps(result['details']),
+            queries_json=json.dumps(student_queries),
             status='graded'
         )
         db.session.add(submission)
         
-        db.session.commit()
+        # Queue for Google Sheets - committed together with the submission
+        # (no autoflush: a duplicate insert must surface at the commit below)
+        with db.session.no_autoflush:
+            student = Student.query.filter_by(student_id=student_id).first()
+            if student:
+                try:
+                    enqueue_sync(
+                        'sql_grade',
+                        student_id=student.student_id,
+                        name=student.name,
+                        assignment_title=assignment.title,
+                        score=result['score'],
+                        percentage=result['percentage'],
+                        submitted_at=datetime.now()
+                    )
+                except Exception as e:
+                    print(f"⚠️ Could not queue Google Sheets SQL sync: {e}")
         
-        # Sync to Google Sheets
-        student = Student.query.filter_by(student_id=student_id).first()
-        if student:
-            try:
-                sync_sql_grade(
-                    student_id=student.student_id,
-                    name=student.name,
-                    assignment_title=assignment.title,
-                    score=result['score'],
-                    percentage=result['percentage'],
-                    submitted_at=datetime.now()
-                )
-            except Exception as e:
-                print(f"⚠️ Google Sheets SQL sync failed: {e}")
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Same assignment submitted twice at once (double click) - the first one wins
+            db.session.rollback()
+            flash('⚠️ You have already submitted this assignment. Retakes are not allowed.', 'danger')
+            return redirect(url_for('student_sql_assignments'))
         
         flash(f'✅ SQL Assignment Submitted! Score: {result["score"]}/10 ({result["percentage"]}%)')
         return redirect(url_for('student_sql_assignments'))
@@ -2662,7 +2908,177 @@ def admin_sql_assignments():
     assignments = SQLSkillsAssignment.query.all()
     submissions = SQLSubmission.query.all()
     
-    return render_template('admin_sql_assignments.html', assignments=assignments, submissions=submissions)
+    return render_template('admin_sql_assignments.html', assignments=assignments, submissions=submissions,
+                           regrade_runs=get_sql_regrade_runs())
+
+
+def get_sql_regrade_runs():
+    """Latest re-grade run per SQL assignment"""
+    latest = db.session.query(
+        SQLRegradeRun.assignment_id, db.func.max(SQLRegradeRun.started_at).label('started_at')
+    ).group_by(SQLRegradeRun.assignment_id).subquery()
+    runs = SQLRegradeRun.query.join(latest, db.and_(
+        SQLRegradeRun.assignment_id == latest.c.assignment_id,
+        SQLRegradeRun.started_at == latest.c.started_at
+    )).all()
+    return {run.assignment_id: run for run in runs}
+
+
+@app.route('/admin/sql-assignments/<int:assignment_id>/regrade', methods=['POST'])
+def regrade_sql_assignment(assignment_id):
+    """Re-grade every stored submission of an assignment with its current questions"""
+    if 'admin_id' not in session:
+        return redirect(url_for('login'))
+
+    assignment = SQLSkillsAssignment.query.get_or_404(assignment_id)
+    latest = get_sql_regrade_runs().get(assignment_id)
+    if latest and latest.is_running:
+        flash('⚠️ A re-grade of this assignment is already running.', 'warning')
+        return redirect(url_for('admin_sql_assignments'))
+
+    submissions = SQLSubmission.query.filter_by(assignment_id=assignment_id).all()
+    items = [(s.id, json.loads(s.queries_json)) for s in submissions if s.queries_json]
+    skipped = len(submissions) - len(items)  # submitted before queries were stored
+    if not items:
+        flash('No submissions with stored queries to re-grade.', 'warning')
+        return redirect(url_for('admin_sql_assignments'))
+
+    # Two chunks per worker so a slow chunk does not leave the others idle, if the queue has room
+    slots = free_slots()
+    if not slots:
+        flash('❌ The grading queue is full, try the re-grade again in a few minutes.', 'error')
+        return redirect(url_for('admin_sql_assignments'))
+    chunk_size = -(-len(items) // min(GRADING_WORKERS * 2, slots))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    # A chunk grades its submissions one after another, each within SQL_SUBMISSION_TIMEOUT
+    chunk_timeout = max(GRADING_TIMEOUT, math.ceil(chunk_size * SQL_SUBMISSION_TIMEOUT))
+
+    # One reference result set for every worker
+    questions = json.loads(assignment.questions_json)
+    references = get_reference_results(questions, assignment.sample_sql)
+
+    now = datetime.utcnow()
+    run = SQLRegradeRun(
+        id=uuid.uuid4().hex,
+        assignment_id=assignment_id,
+        total=len(items),
+        skipped=skipped,
+        chunks=len(chunks),
+        results_json='{}',
+        started_at=now,
+        expires_at=now + timedelta(seconds=2 * chunk_timeout * -(-len(chunks) // GRADING_WORKERS))
+    )
+    db.session.add(run)
+    db.session.commit()
+
+    try:
+        submit_jobs('sql_regrade', regrade_sql_batch,
+                    [(chunk, questions, assignment.sample_sql, references) for chunk in chunks],
+                    context={'run_id': run.id}, timeout=chunk_timeout)
+    except GradingQueueFull:
+        # Another request took the free slots in between; nothing was queued
+        run.status = 'failed'
+        run.error = 'The grading queue is full, try again in a few minutes.'
+        run.finished_at = datetime.utcnow()
+        db.session.commit()
+        flash('❌ The grading queue is full, try the re-grade again in a few minutes.', 'error')
+        return redirect(url_for('admin_sql_assignments'))
+
+    flash(f'🔄 Re-grading {len(items)} submissions of "{assignment.title}" in the background.'
+          + (f' {skipped} older submissions have no stored queries and were skipped.' if skipped else ''))
+    return redirect(url_for('admin_sql_assignments'))
+
+
+@register_finisher('sql_regrade')
+def finish_sql_regrade(context, result, error):
+    """Collect one chunk of a re-grade run; the last chunk applies the whole run"""
+    run = SQLRegradeRun.query.get(context['run_id'])
+    if run is None or run.status != 'running':
+        return 'Re-grade run was cancelled', 'warning'
+    if error is not None:
+        # Nothing is applied: a run updates all of its submissions or none
+        run.status = 'failed'
+        run.error = str(error)
+        run.results_json = None
+        run.finished_at = datetime.utcnow()
+        db.session.commit()
+        return f'Re-grade failed: {error}', 'error'
+
+    # Chunks of one run finish on this process's pool thread, one at a time
+    results = json.loads(run.results_json or '{}')
+    results.update((str(submission_id), graded) for submission_id, graded in result)
+    run.chunks_done += 1
+    if run.chunks_done < run.chunks:
+        run.results_json = json.dumps(results)
+        db.session.commit()
+        return 'Re-grade chunk done', 'info'
+
+    # Scores and run status in one commit: a run is never left 'running' after its scores changed
+    changed = apply_sql_regrade(run.assignment_id, {int(k): v for k, v in results.items()})
+    run.status = 'done'
+    run.changed = len(changed)
+    run.results_json = None
+    run.finished_at = datetime.utcnow()
+    db.session.commit()
+    print(f"✅ Re-graded SQL assignment {run.assignment_id}: {len(changed)} scores changed")
+
+    try:
+        push_sql_regrade(run.assignment_id, changed)
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Could not push re-graded SQL scores to Google Sheets: {e}")
+    return f'Re-grade done: {len(changed)} scores changed', 'success'
+
+
+def apply_sql_regrade(assignment_id, results):
+    """Stage re-grade results as one bulk update (the caller commits).
+
+    Returns [(student id, submitted at, result)] for the submissions whose score changed.
+    """
+    mappings, changed = [], []
+    for submission in SQLSubmission.query.filter(SQLSubmission.id.in_(list(results))).all():
+        result = results[submission.id]
+        details = json.dumps(result['details'])
+        if (submission.score, submission.percentage, submission.grade_details) == \
+                (result['score'], result['percentage'], details):
+            continue
+        mappings.append({'id': submission.id, 'score': result['score'], 'percentage': result['percentage'],
+                         'grade_details': details, 'status': 'graded'})
+        if (submission.score, submission.percentage) != (result['score'], result['percentage']):
+            changed.append((submission.student_id, submission.submitted_at, result))
+
+    if mappings:
+        db.session.bulk_update_mappings(SQLSubmission, mappings)
+    return changed
+
+
+def push_sql_regrade(assignment_id, changed):
+    """Push re-graded scores to Sheets in one batch, or queue them in the outbox"""
+    if not changed:
+        return
+    assignment = SQLSkillsAssignment.query.get(assignment_id)
+    names = dict(db.session.query(Student.student_id, Student.name)
+                 .filter(Student.student_id.in_({student_id for student_id, _, _ in changed})).all())
+    rows = [dict(student_id=student_id, name=names.get(student_id, ''), assignment_title=assignment.title,
+                 score=result['score'], percentage=result['percentage'], submitted_at=submitted_at)
+            for student_id, submitted_at, result in changed]
+
+    pushed = False
+    service, _ = get_sheets_service()
+    if service:
+        batch = SheetsBatch(max_rows=len(rows) + 1)
+        with batch.collecting():
+            for row in rows:
+                sync_sql_grade(**row)
+        pushed = batch.flush()
+    if not pushed:
+        # Sheets unavailable: the outbox retries the rows one by one
+        for row in rows:
+            try:
+                enqueue_sync('sql_grade', **row)
+            except Exception as e:
+                print(f"⚠️ Could not queue Google Sheets SQL sync: {e}")
+        db.session.commit()
 
 
 @app.route('/admin/sql/init-data')
@@ -2681,84 +3097,18 @@ def admin_sql_init_data():
     return redirect(url_for('admin_sql_assignments'))
 
 
+@register_handler('sql_grade')
 def sync_sql_grade(student_id, name, assignment_title, score, percentage, submitted_at):
     """Sync SQL grade to Google Sheets - Updates row if exists, otherwise appends"""
-    try:
-        service, sheet_id = get_sheets_service()
-        if not service:
-            return False
-        
-        sheet_name = 'SQL Assignments'
-        
-        # Ensure sheet exists
-        try:
-            spreadsheet = service.spreadsheets().get(spreadsheetId=sheet_id).execute()
-            sheets = [s['properties']['title'] for s in spreadsheet.get('sheets', [])]
-            if sheet_name not in sheets:
-                service.spreadsheets().batchUpdate(
-                    spreadsheetId=sheet_id,
-                    body={'requests': [{'addSheet': {'properties': {'title': sheet_name}}}]}
-                ).execute()
-                service.spreadsheets().values().update(
-                    spreadsheetId=sheet_id,
-                    range=f'{sheet_name}!A1',
-                    valueInputOption='USER_ENTERED',
-                    body={'values': [['Student ID', 'Name', 'Assignment', 'Score', 'Percentage', 'Status', 'Submitted At', 'Sync Time']]}
-                ).execute()
-        except Exception as e:
-            print(f"⚠️ Error creating SQL sheet: {e}")
-        
-        # Prepare data
-        from datetime import datetime
-        now_str = str(datetime.now())
-        values = [[student_id, name, assignment_title, f"{score}/10", f"{percentage}%", "CLEAN", str(submitted_at), now_str]]
-        
-        # Check if student already has a row for this assignment
-        try:
-            result = service.spreadsheets().values().get(
-                spreadsheetId=sheet_id,
-                range=f'{sheet_name}!A:C'
-            ).execute()
-            rows = result.get('values', [])
-            
-            row_index = -1
-            for i, row in enumerate(rows):
-                if len(row) >= 3:
-                    if str(row[0]).strip() == str(student_id).strip() and str(row[2]).strip() == str(assignment_title).strip():
-                        row_index = i + 1
-                        break
-            
-            if row_index > 0:
-                service.spreadsheets().values().update(
-                    spreadsheetId=sheet_id,
-                    range=f'{sheet_name}!A{row_index}',
-                    valueInputOption='USER_ENTERED',
-                    body={'values': values}
-                ).execute()
-                print(f"✅ SQL grade UPDATED: {student_id} - {score}/10")
-            else:
-                service.spreadsheets().values().append(
-                    spreadsheetId=sheet_id,
-                    range=f'{sheet_name}!A2',
-                    valueInputOption='USER_ENTERED',
-                    body={'values': values}
-                ).execute()
-                print(f"✅ SQL grade APPENDED: {student_id} - {score}/10")
-                
-            return True
-        except Exception as e:
-            print(f"⚠️ Error updating SQL row: {e}")
-            service.spreadsheets().values().append(
-                spreadsheetId=sheet_id,
-                range=f'{sheet_name}!A2',
-                valueInputOption='USER_ENTERED',
-                body={'values': values}
-            ).execute()
-            return True
-
-    except Exception as e:
-        print(f"❌ SQL grade sync FAILED: {e}")
-        return False
+    return sync_to_sheets('SQL Assignments', [
+        student_id,
+        name,
+        assignment_title,
+        f"{score}/10",
+        f"{percentage}%",
+        "CLEAN",
+        str(submitted_at)
+    ])
 
 
 def get_students_needing_email():
@@ -3121,7 +3471,10 @@ def admin_export_final_marks():
 # APP INITIALIZATION
 # ============================================
 
-from sql_grader import grade_sql_submission, get_sql_assignment_questions, get_sample_data_as_excel
+from sql_grader import (
+    grade_sql_submission, get_sql_assignment_questions, get_sample_data_as_excel, get_reference_results,
+    regrade_sql_batch, SQL_SUBMISSION_TIMEOUT, RUBRIC_VERSION as SQL_RUBRIC_VERSION
+)
 
 @app.route('/student/sql/download-sample')
 @app.route('/student/sql/download-sample/<int:assignment_id>')
@@ -3152,6 +3505,12 @@ def init_app_data():
     with app.app_context():
         db.create_all()
 
+        # Existing databases: add columns and indexes introduced since they were created
+        from migrate_schema import add_missing_columns, add_missing_indexes
+        for name in add_missing_columns(db):
+            print(f"✅ Added column {name}")
+        add_missing_indexes(db)
+
         # Create default admin if not exists
         admin = Admin.query.filter_by(username='admin').first()
         if not admin:
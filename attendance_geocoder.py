@@ -0,0 +1,195 @@
+"""
+Deferred reverse geocoding for attendance
+attendance_action only stores coordinates. This background stage resolves
+the Check-In/Check-Out addresses at Nominatim's pace (token bucket, 1
+request per second by default), writes them to the Attendance rows in one
+commit and patches the matching sheet rows in one batch.
+"""
+import os
+import time
+import threading
+import traceback
+
+GEOCODE_RATE = float(os.getenv('GEOCODE_RATE_PER_SECOND', '1'))  # Nominatim policy: max 1 req/s
+GEOCODE_BURST = int(os.getenv('GEOCODE_BURST', '1'))
+GEOCODE_BATCH = int(os.getenv('GEOCODE_BATCH', '100'))  # attendance rows per pass
+POLL_INTERVAL = int(os.getenv('GEOCODE_POLL_SECONDS', '30'))
+FAILED_RETRY_SECONDS = 600  # don't hammer the geocoder for coordinates that just failed
+GEOCODE_MAX_ATTEMPTS = int(os.getenv('GEOCODE_MAX_ATTEMPTS', '5'))  # then the address is left blank for good
+GEOCODE_BACKFILL_DAYS = int(os.getenv('GEOCODE_BACKFILL_DAYS', '7'))  # older rows are skipped; 0 = no limit
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Block until a token is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_bucket = TokenBucket(GEOCODE_RATE, GEOCODE_BURST)
+_failed_until = {}  # quantized coordinates -> time.time() when they may be retried
+_wake = threading.Event()
+_geocoder_thread = None
+_geocoder_lock = threading.Lock()
+
+
+def _split_location(location):
+    parts = str(location).split(',')
+    if len(parts) != 2:
+        return None
+    return parts[0].strip(), parts[1].strip()
+
+
+def _cooling_down(lat, lng):
+    """True while these coordinates are waiting out FAILED_RETRY_SECONDS"""
+    from geocode_cache import quantize
+    return _failed_until.get(quantize(lat, lng), 0) > time.time()
+
+
+def _resolve(lat, lng):
+    """Cached address, or a rate-limited Nominatim lookup. None if it failed."""
+    from geocode_cache import get_cached_address, quantize
+    from clean_sheets_sync import reverse_geocode
+
+    cached = get_cached_address(lat, lng)
+    if cached:
+        return cached
+
+    key = quantize(lat, lng)
+    if _failed_until.get(key, 0) > time.time():
+        return None
+
+    _bucket.take()
+    address = reverse_geocode(lat, lng)
+    if address:
+        _failed_until.pop(key, None)
+    else:
+        _failed_until[key] = time.time() + FAILED_RETRY_SECONDS
+    return address
+
+
+def geocode_pending(limit=GEOCODE_BATCH):
+    """Fill missing attendance addresses. Must be called inside an app context.
+    Returns the number of attendance rows patched."""
+    from datetime import date, timedelta
+    from app import db, Attendance, Student
+    from clean_sheets_sync import get_sheets_service, sync_attendance, SheetsBatch
+
+    missing_in = db.and_(Attendance.check_in_location.isnot(None),
+                         Attendance.check_in_location != '',
+                         Attendance.check_in_address.is_(None))
+    missing_out = db.and_(Attendance.check_out_location.isnot(None),
+                          Attendance.check_out_location != '',
+                          Attendance.check_out_address.is_(None))
+    query = Attendance.query.filter(db.or_(missing_in, missing_out))
+    if GEOCODE_BACKFILL_DAYS > 0:
+        # Old rows without addresses are not worth a rate-limited lookup each
+        query = query.filter(Attendance.date >= date.today() - timedelta(days=GEOCODE_BACKFILL_DAYS))
+    # Untried rows first, then newest first, so today's check-ins never wait behind failing ones
+    rows = query.order_by(db.func.coalesce(Attendance.geocode_attempts, 0),
+                          Attendance.id.desc()).limit(limit).all()
+
+    patched = []
+    dirty = False
+    for attendance in rows:
+        changed = False
+        for location_attr, address_attr in (('check_in_location', 'check_in_address'),
+                                            ('check_out_location', 'check_out_address')):
+            location = getattr(attendance, location_attr)
+            if not location or getattr(attendance, address_attr) is not None:
+                continue
+            coords = _split_location(location)
+            if coords is None:
+                # Not lat,lng - nothing to resolve, don't pick it up again
+                setattr(attendance, address_attr, '')
+                changed = True
+                continue
+            if _cooling_down(*coords):
+                continue  # Not an attempt - the lookup is skipped until the retry window ends
+            address = _resolve(*coords)
+            if address:
+                setattr(attendance, address_attr, address)
+                changed = True
+                continue
+            attendance.geocode_attempts = (attendance.geocode_attempts or 0) + 1
+            dirty = True
+            if attendance.geocode_attempts >= GEOCODE_MAX_ATTEMPTS:
+                # Give up: the blank address stops the row from being selected again
+                setattr(attendance, address_attr, '')
+        if changed:
+            patched.append(attendance)
+
+    if not patched and not dirty:
+        return 0
+    db.session.commit()  # One transaction for the whole pass
+    if not patched:
+        return 0
+
+    service, _ = get_sheets_service()
+    if service:
+        student_ids = {a.student_id for a in patched}
+        names = dict(db.session.query(Student.student_id, Student.name)
+                     .filter(Student.student_id.in_(student_ids)).all())
+        batch = SheetsBatch(max_rows=len(patched) + 1)
+        with batch.collecting():
+            for a in patched:
+                sync_attendance(a.student_id, names.get(a.student_id, ''), a.date,
+                                a.check_in_time, a.check_out_time, a.status,
+                                a.check_in_location, a.check_out_location,
+                                a.check_in_address, a.check_out_address)
+        if not batch.flush():
+            # Addresses are saved in the DB and geocode cache; the next sync of these rows carries them
+            print("⚠️ Could not patch addresses into the Attendance sheet")
+
+    print(f"✅ Geocoded addresses for {len(patched)} attendance rows")
+    return len(patched)
+
+
+def _geocoder_loop():
+    from app import app
+
+    while True:
+        _wake.wait(POLL_INTERVAL)
+        _wake.clear()
+        try:
+            with app.app_context():
+                geocode_pending()
+        except Exception as e:
+            print(f"❌ Attendance geocoder error: {e}")
+            traceback.print_exc()
+
+
+def wake_geocoder():
+    """Ask the geocoder to run now instead of at its next poll"""
+    start_geocoder()
+    _wake.set()
+
+
+def start_geocoder():
+    """Start the background geocoder thread once per process"""
+    global _geocoder_thread
+    if _geocoder_thread is not None and _geocoder_thread.is_alive():
+        return
+    with _geocoder_lock:
+        if _geocoder_thread is not None and _geocoder_thread.is_alive():
+            return
+        _geocoder_thread = threading.Thread(target=_geocoder_loop, name='attendance-geocoder', daemon=True)
+        _geocoder_thread.start()
+        print("✅ Attendance geocoder started")
@@ -3,14 +3,44 @@ Clean Google Sheets Sync - ALL DATA TYPES
 Proper columns, proper sheets, proper sync!
 """
 import os
+import re
 import json
+import time
+import threading
 import requests
 from datetime import datetime
+from contextlib import ExitStack
 
 # Cache for service
 _google_service = None
 _google_sheet_id = None
 
+# Row index cache: {sheet_id: {sheet_name: {'keys': {key: row_number}, 'last_row': n, 'warmed_at': ts}}}
+# Lets sync_to_sheets find the row for a unique key without downloading the whole sheet.
+_row_index = {}
+_row_index_lock = threading.Lock()
+_row_index_loaded = False
+ROW_INDEX_TTL = int(os.getenv('SHEETS_ROW_INDEX_TTL', '1800'))  # seconds before re-warming from the sheet
+ROW_INDEX_FILE = os.getenv('SHEETS_ROW_INDEX_FILE')  # optional on-disk copy, e.g. instance/sheets_row_index.json
+
+# Batched writes: while a SheetsBatch is collecting on this thread, sync_to_sheets queues rows instead
+BATCH_MAX_ROWS = int(os.getenv('SHEETS_BATCH_MAX_ROWS', '50'))
+BATCH_MAX_AGE = float(os.getenv('SHEETS_BATCH_MAX_AGE', '2'))  # seconds
+_batch_state = threading.local()
+
+# Lookup -> append must not interleave for one sheet, or two writers (outbox dispatcher,
+# geocoder) both miss the key and append the same row twice
+_sheet_write_locks = {}
+_sheet_write_locks_lock = threading.Lock()
+
+# Spreadsheet metadata cache: {sheet_id: {'tabs': {title: sheetId}, 'headers': {title: [...]}, 'fetched_at': ts}}
+# Saves a spreadsheets().get() on every write just to check that a tab exists.
+_sheet_meta = {}
+_sheet_meta_lock = threading.Lock()
+SHEET_META_TTL = int(os.getenv('SHEETS_META_TTL', '3600'))  # seconds
+
+GEOCODE_TIMEOUT = float(os.getenv('GEOCODE_TIMEOUT', '5'))  # seconds per Nominatim request
+
 SHEET_HEADERS = {
     'Students': ['Student ID', 'Name', 'Created At', 'Sync Time'],
     'Attendance': ['Date', 'Student ID', 'Name', 'Check-In Time', 'Check-Out Time', 'Status', 
@@ -20,23 +50,38 @@ SHEET_HEADERS = {
     'Quiz Results': ['Student ID', 'Name', 'Quiz Title', 'Score', 'Percentage', 'Submitted At', 'Sync Time'],
     'Assignments': ['Student ID', 'Name', 'Assignment Title', 'Submission URL', 'Grade', 'Submitted At', 'Sync Time'],
     'Midterm Grades': ['Student ID', 'Name', 'Midterm Title', 'Grade', 'Graded At', 'Sync Time'],
-    'Course Outlines': ['Course Title', 'Created At', 'Sync Time']
+    'Course Outlines': ['Course Title', 'Created At', 'Sync Time'],
+    'Excel Assignments': ['Student ID', 'Name', 'Assignment', 'Score', 'Percentage', 'Status', 'Submitted At', 'Sync Time'],
+    'SQL Assignments': ['Student ID', 'Name', 'Assignment', 'Score', 'Percentage', 'Status', 'Submitted At', 'Sync Time']
 }
 
-def get_address_from_coordinates(lat, lng):
-    """Convert GPS coordinates to human-readable address using OpenStreetMap API"""
+def reverse_geocode(lat, lng):
+    """Address for GPS coordinates via OpenStreetMap (cached), or None if it could not be resolved"""
+    from geocode_cache import get_cached_address, store_address
+
+    cached = get_cached_address(lat, lng)
+    if cached:
+        return cached
+
     try:
         url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lng}&addressdetails=1"
         headers = {'User-Agent': 'ERP-System-Attendance-Tracker/1.0'}
-        response = requests.get(url, headers=headers)
+        response = requests.get(url, headers=headers, timeout=GEOCODE_TIMEOUT)
         
         if response.status_code == 200:
-            data = response.json()
-            return data.get('display_name', f"Coordinates: {lat}, {lng}")
-        return f"Coordinates: {lat}, {lng}"
+            address = response.json().get('display_name')
+            if address:
+                store_address(lat, lng, address)
+                return address
+        # Failures are not cached so the next attempt tries again
+        return None
     except Exception as e:
         print(f"⚠️ Reverse geocoding error: {e}")
-        return f"Coordinates: {lat}, {lng}"
+        return None
+
+def get_address_from_coordinates(lat, lng):
+    """Convert GPS coordinates to human-readable address using OpenStreetMap API"""
+    return reverse_geocode(lat, lng) or f"Coordinates: {lat}, {lng}"
 
 def get_sheets_service():
     """Get Google Sheets service"""
@@ -72,33 +117,352 @@ def get_sheets_service():
         print(f"❌ Google Sheets init failed: {e}")
         return None, None
 
-def ensure_sheet_exists(service, sheet_id, sheet_name):
+# ============================================
+# SPREADSHEET METADATA CACHE
+# ============================================
+
+def get_sheet_metadata(service, sheet_id, refresh=False):
+    """Tab titles -> sheetId (plus known header rows), fetched at most once per TTL"""
+    with _sheet_meta_lock:
+        meta = _sheet_meta.get(sheet_id)
+        if meta and not refresh and time.time() - meta['fetched_at'] < SHEET_META_TTL:
+            return meta
+
+    spreadsheet = service.spreadsheets().get(
+        spreadsheetId=sheet_id,
+        fields='sheets.properties(sheetId,title)'
+    ).execute()
+    tabs = {s['properties']['title']: s['properties'].get('sheetId') for s in spreadsheet.get('sheets', [])}
+
+    with _sheet_meta_lock:
+        old = _sheet_meta.get(sheet_id, {})
+        meta = {
+            'tabs': tabs,
+            'headers': {t: h for t, h in old.get('headers', {}).items() if t in tabs},
+            'fetched_at': time.time()
+        }
+        _sheet_meta[sheet_id] = meta
+    return meta
+
+def invalidate_sheet_metadata(sheet_id=None):
+    """Forget cached tab metadata (all spreadsheets, or just one)"""
+    with _sheet_meta_lock:
+        if sheet_id is None:
+            _sheet_meta.clear()
+        else:
+            _sheet_meta.pop(sheet_id, None)
+
+def is_missing_tab_error(error):
+    """True when a Sheets API error means the tab named in the range does not exist"""
+    return 'Unable to parse range' in str(error)
+
+def ensure_sheet_exists(service, sheet_id, sheet_name, headers=None):
     """Create sheet if not exists and add headers"""
     try:
-        spreadsheet = service.spreadsheets().get(spreadsheetId=sheet_id).execute()
-        sheets = [s['properties']['title'] for s in spreadsheet.get('sheets', [])]
-        
-        if sheet_name not in sheets:
-            service.spreadsheets().batchUpdate(
+        started = time.time()
+        meta = get_sheet_metadata(service, sheet_id)
+        if sheet_name in meta['tabs']:
+            return True
+
+        if meta['fetched_at'] < started:
+            # Cached copy says missing - make sure before creating (someone may have added it by hand)
+            meta = get_sheet_metadata(service, sheet_id, refresh=True)
+            if sheet_name in meta['tabs']:
+                return True
+
+        result = service.spreadsheets().batchUpdate(
+            spreadsheetId=sheet_id,
+            body={'requests': [{'addSheet': {'properties': {'title': sheet_name}}}]}
+        ).execute()
+        new_tab_id = result.get('replies', [{}])[0].get('addSheet', {}).get('properties', {}).get('sheetId')
+
+        # Add headers
+        if headers is None:
+            headers = SHEET_HEADERS.get(sheet_name, [])
+        if headers:
+            service.spreadsheets().values().update(
                 spreadsheetId=sheet_id,
-                body={'requests': [{'addSheet': {'properties': {'title': sheet_name}}}]}
+                range=f"'{sheet_name}'!A1",
+                valueInputOption='USER_ENTERED',
+                body={'values': [headers]}
             ).execute()
-            
-            # Add headers
-            headers = SHEET_HEADERS.get(sheet_name, [])
-            if headers:
-                service.spreadsheets().values().update(
-                    spreadsheetId=sheet_id,
-                    range=f'{sheet_name}!A1',
-                    valueInputOption='USER_ENTERED',
-                    body={'values': [headers]}
-                ).execute()
-            print(f"✅ Created sheet: {sheet_name}")
+
+        with _sheet_meta_lock:
+            meta['tabs'][sheet_name] = new_tab_id
+            meta['headers'][sheet_name] = list(headers)
+        print(f"✅ Created sheet: {sheet_name}")
         return True
     except Exception as e:
         print(f"❌ Error creating sheet {sheet_name}: {e}")
         return False
 
+# ============================================
+# ROW INDEX CACHE
+# ============================================
+
+def get_unique_key_indices(sheet_name):
+    """Column indices that must match to consider a row the same entry"""
+    if sheet_name == 'Students':
+        return [0]
+    if sheet_name in ['Quiz Results', 'Assignments', 'Midterm Grades', 'SQL Assignments', 'Excel Assignments']:
+        return [0, 2]  # Student ID and Title
+    if sheet_name == 'Attendance':
+        return [0, 1]  # Date and Student ID
+    return [0, 1]  # Default: first two columns
+
+def _make_row_key(row, key_indices):
+    """Build the lookup key for a row, or None if the row is too short"""
+    if len(row) <= max(key_indices):
+        return None
+    return '\x1f'.join(str(row[idx]).strip() for idx in key_indices)
+
+def _column_letter(index):
+    """0-based column index -> sheet column letter (0 -> A)"""
+    letters = ''
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+def _row_from_updated_range(updated_range):
+    """Extract the first row number from a range like 'Attendance'!A57:O57"""
+    if not updated_range:
+        return None
+    match = re.search(r'![A-Z]+(\d+)', updated_range)
+    return int(match.group(1)) if match else None
+
+def _load_row_index_file():
+    """Load the on-disk row index once per process (if configured)"""
+    global _row_index_loaded
+    if _row_index_loaded:
+        return
+    _row_index_loaded = True
+    if not ROW_INDEX_FILE or not os.path.exists(ROW_INDEX_FILE):
+        return
+    try:
+        with open(ROW_INDEX_FILE, 'r') as f:
+            _row_index.update(json.load(f))
+        print(f"✅ Loaded sheet row index from {ROW_INDEX_FILE}")
+    except Exception as e:
+        print(f"⚠️ Could not load sheet row index: {e}")
+
+def _save_row_index_file():
+    """Persist the row index to disk (caller holds _row_index_lock)"""
+    if not ROW_INDEX_FILE:
+        return
+    try:
+        tmp_path = f"{ROW_INDEX_FILE}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(_row_index, f)
+        os.replace(tmp_path, ROW_INDEX_FILE)
+    except Exception as e:
+        print(f"⚠️ Could not save sheet row index: {e}")
+
+def warm_row_index(service, sheet_id, sheet_name):
+    """Download only the key columns of a sheet once and index key -> row number"""
+    key_indices = get_unique_key_indices(sheet_name)
+    result = service.spreadsheets().values().get(
+        spreadsheetId=sheet_id,
+        range=f"'{sheet_name}'!A:{_column_letter(max(key_indices))}"
+    ).execute()
+    rows = result.get('values', [])
+
+    keys = {}
+    for i, row in enumerate(rows):
+        key = _make_row_key(row, key_indices)
+        if key is not None and key not in keys:
+            keys[key] = i + 1  # 1-based, first match wins like the old linear scan
+
+    entry = {'keys': keys, 'last_row': len(rows), 'warmed_at': time.time()}
+    with _row_index_lock:
+        _row_index.setdefault(sheet_id, {})[sheet_name] = entry
+        _save_row_index_file()
+    print(f"✅ Indexed {len(keys)} rows in {sheet_name}")
+    return entry
+
+def get_row_index(service, sheet_id, sheet_name):
+    """Return the cached row index for a sheet, warming it if missing or expired"""
+    with _row_index_lock:
+        _load_row_index_file()
+        entry = _row_index.get(sheet_id, {}).get(sheet_name)
+    if entry and time.time() - entry.get('warmed_at', 0) < ROW_INDEX_TTL:
+        return entry
+    return warm_row_index(service, sheet_id, sheet_name)
+
+def remember_row(sheet_id, sheet_name, key, row_number):
+    """Record where a key was appended so the next upsert updates it in place"""
+    with _row_index_lock:
+        entry = _row_index.get(sheet_id, {}).get(sheet_name)
+        if entry is None:
+            return
+        if row_number != entry['last_row'] + 1:
+            # Rows were added or removed outside this process - rebuild on next use
+            print(f"⚠️ Row index mismatch in {sheet_name} (expected row {entry['last_row'] + 1}, got {row_number}), invalidating")
+            _row_index[sheet_id].pop(sheet_name, None)
+        else:
+            entry['keys'][key] = row_number
+            entry['last_row'] = row_number
+        _save_row_index_file()
+
+def invalidate_row_index(sheet_name=None):
+    """Drop cached row positions for one sheet (or all sheets)"""
+    with _row_index_lock:
+        _load_row_index_file()
+        for sheets in _row_index.values():
+            if sheet_name is None:
+                sheets.clear()
+            else:
+                sheets.pop(sheet_name, None)
+        _save_row_index_file()
+
+# ============================================
+# BATCHED WRITES
+# ============================================
+
+class SheetsBatch:
+    """Coalesces row upserts across sheets and writes them in as few API calls as possible.
+
+    Usage:
+        batch = SheetsBatch()
+        with batch.collecting():
+            sync_quiz(...)        # queued, not sent
+            sync_attendance(...)
+        batch.flush()             # one values.batchUpdate + one append per sheet
+    """
+
+    def __init__(self, max_rows=BATCH_MAX_ROWS, max_age=BATCH_MAX_AGE):
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.pending = {}  # sheet_name -> {row_key: data_row}, last write for a key wins
+        self.started_at = None
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self.pending = {}
+        self._count = 0
+        self.started_at = None
+
+    def add(self, sheet_name, data_row):
+        if self.started_at is None:
+            self.started_at = time.time()
+        rows = self.pending.setdefault(sheet_name, {})
+        key = _make_row_key(data_row, get_unique_key_indices(sheet_name))
+        if key is None:
+            key = ('unkeyed', len(rows))  # Too short to dedupe - always appended
+        if key not in rows:
+            self._count += 1
+        rows[key] = data_row
+
+    def savepoint(self):
+        """State to roll back to if the next caller fails halfway through its rows"""
+        return {sheet: dict(rows) for sheet, rows in self.pending.items()}, self._count, self.started_at
+
+    def rollback(self, savepoint):
+        """Drop every row added (or overwritten) since savepoint()"""
+        pending, self._count, self.started_at = savepoint
+        self.pending = {sheet: dict(rows) for sheet, rows in pending.items()}
+
+    def should_flush(self):
+        """Size-or-time trigger"""
+        if not self._count:
+            return False
+        return self._count >= self.max_rows or time.time() - self.started_at >= self.max_age
+
+    def collecting(self):
+        """Context manager routing sync_to_sheets on this thread into the batch"""
+        batch = self
+
+        class _Collecting:
+            def __enter__(self):
+                _batch_state.active = batch
+                return batch
+
+            def __exit__(self, *exc):
+                _batch_state.active = None
+                return False
+
+        return _Collecting()
+
+    def flush(self):
+        """Write all queued rows. Returns True if everything was written."""
+        if not self._count:
+            return True
+
+        service, sheet_id = get_sheets_service()
+        if not service:
+            return False
+
+        for attempt in range(2):
+            try:
+                self._write(service, sheet_id)
+                self.clear()
+                return True
+            except Exception as e:
+                print(f"❌ Batch flush FAILED: {e}")
+                for sheet_name in self.pending:
+                    invalidate_row_index(sheet_name)
+                if attempt == 0 and is_missing_tab_error(e):
+                    # A tab disappeared since the metadata was cached - refresh and retry once
+                    invalidate_sheet_metadata(sheet_id)
+                    continue
+                return False
+
+    def _write(self, service, sheet_id):
+        # Sorted so two batches never wait on each other's locks
+        with ExitStack() as locks:
+            for sheet_name in sorted(self.pending):
+                locks.enter_context(_sheet_write_lock(sheet_name))
+            self._write_locked(service, sheet_id)
+
+    def _write_locked(self, service, sheet_id):
+        updates = []
+        appends = {}
+        for sheet_name, rows in self.pending.items():
+            ensure_sheet_exists(service, sheet_id, sheet_name)
+            index = get_row_index(service, sheet_id, sheet_name)
+            for key, data_row in rows.items():
+                row_number = index['keys'].get(key) if isinstance(key, str) else None
+                if row_number:
+                    updates.append({'range': f"'{sheet_name}'!A{row_number}", 'values': [data_row]})
+                else:
+                    appends.setdefault(sheet_name, []).append((key, data_row))
+
+        if updates:
+            service.spreadsheets().values().batchUpdate(
+                spreadsheetId=sheet_id,
+                body={'valueInputOption': 'USER_ENTERED', 'data': updates}
+            ).execute()
+
+        for sheet_name, items in appends.items():
+            result = service.spreadsheets().values().append(
+                spreadsheetId=sheet_id,
+                range=f"'{sheet_name}'!A2",
+                valueInputOption='USER_ENTERED',
+                body={'values': [data_row for _, data_row in items]}
+            ).execute()
+            first_row = _row_from_updated_range(result.get('updates', {}).get('updatedRange'))
+            if first_row:
+                for offset, (key, _) in enumerate(items):
+                    if isinstance(key, str):
+                        remember_row(sheet_id, sheet_name, key, first_row + offset)
+            else:
+                invalidate_row_index(sheet_name)
+
+        print(f"✅ Batch flushed {self._count} rows: {len(updates)} updated, "
+              f"{sum(len(items) for items in appends.values())} appended across {len(self.pending)} sheets")
+
+def _sheet_write_lock(sheet_name):
+    with _sheet_write_locks_lock:
+        lock = _sheet_write_locks.get(sheet_name)
+        if lock is None:
+            lock = _sheet_write_locks[sheet_name] = threading.RLock()
+        return lock
+
+
 def sync_to_sheets(sheet_name, data_row):
     """Generic sync function - updates row if exists, otherwise appends"""
     # Import here to avoid circular dependencies
@@ -151,74 +515,71 @@ def sync_to_sheets(sheet_name, data_row):
                     store_failed_sync(data_type, data_dict)
             return False
         
-        # Ensure sheet exists with headers
-        ensure_sheet_exists(service, sheet_id, sheet_name)
-        
         # Add sync timestamp
         now_str = str(datetime.now())
         data_row.append(now_str)
-        
+
+        # Inside a batch: queue the row, SheetsBatch.flush() writes it
+        batch = getattr(_batch_state, 'active', None)
+        if batch is not None:
+            batch.add(sheet_name, data_row)
+            return True
+
+        # Ensure sheet exists with headers
+        ensure_sheet_exists(service, sheet_id, sheet_name)
+
         # Determine unique keys for this sheet
         # (Column indices that must match to consider it the same entry)
-        unique_key_indices = [0, 1] # Default: first two columns
-        if sheet_name == 'Students':
-            unique_key_indices = [0]
-        elif sheet_name in ['Quiz Results', 'Assignments', 'Midterm Grades', 'SQL Assignments', 'Excel Assignments']:
-            unique_key_indices = [0, 2] # Student ID and Title
-        elif sheet_name == 'Attendance':
-            unique_key_indices = [0, 1] # Date and Student ID
-            
-        try:
-            # Get existing data to check for duplicates
-            result = service.spreadsheets().values().get(
-                spreadsheetId=sheet_id,
-                range=f"'{sheet_name}'!A:Z"
-            ).execute()
-            rows = result.get('values', [])
-            
-            row_index = -1
-            if rows:
-                for i, row in enumerate(rows):
-                    if len(row) > max(unique_key_indices):
-                        match = True
-                        for idx in unique_key_indices:
-                            if str(row[idx]).strip() != str(data_row[idx]).strip():
-                                match = False
-                                break
-                        if match:
-                            row_index = i + 1
-                            break
-            
-            if row_index > 0:
-                # Update existing row
-                service.spreadsheets().values().update(
-                    spreadsheetId=sheet_id,
-                    range=f"'{sheet_name}'!A{row_index}",
-                    valueInputOption='USER_ENTERED',
-                    body={'values': [data_row]}
-                ).execute()
-                print(f"✅ Updated {sheet_name}: {data_row[0]}")
-            else:
-                # Append new row
+        unique_key_indices = get_unique_key_indices(sheet_name)
+        row_key = _make_row_key(data_row, unique_key_indices)
+
+        with _sheet_write_lock(sheet_name):
+            try:
+                # Look up the row in the cached key index instead of downloading the sheet
+                index = get_row_index(service, sheet_id, sheet_name)
+                row_index = index['keys'].get(row_key, -1)
+
+                if row_index > 0:
+                    # Update existing row
+                    service.spreadsheets().values().update(
+                        spreadsheetId=sheet_id,
+                        range=f"'{sheet_name}'!A{row_index}",
+                        valueInputOption='USER_ENTERED',
+                        body={'values': [data_row]}
+                    ).execute()
+                    print(f"✅ Updated {sheet_name}: {data_row[0]}")
+                else:
+                    # Append new row
+                    result = service.spreadsheets().values().append(
+                        spreadsheetId=sheet_id,
+                        range=f"'{sheet_name}'!A2",
+                        valueInputOption='USER_ENTERED',
+                        body={'values': [data_row]}
+                    ).execute()
+                    appended_row = _row_from_updated_range(result.get('updates', {}).get('updatedRange'))
+                    if appended_row and row_key is not None:
+                        remember_row(sheet_id, sheet_name, row_key, appended_row)
+                    else:
+                        invalidate_row_index(sheet_name)
+                    print(f"✅ Appended to {sheet_name}: {data_row[0]}")
+
+                return True
+            except Exception as e:
+                print(f"⚠️ Error checking/updating row in {sheet_name}: {e}")
+                # Cached positions can no longer be trusted for this sheet
+                invalidate_row_index(sheet_name)
+                if is_missing_tab_error(e):
+                    # Tab was deleted or renamed behind our back - refresh metadata and recreate it
+                    invalidate_sheet_metadata(sheet_id)
+                    ensure_sheet_exists(service, sheet_id, sheet_name)
+                # Fallback to append if anything goes wrong
                 service.spreadsheets().values().append(
                     spreadsheetId=sheet_id,
                     range=f"'{sheet_name}'!A2",
                     valueInputOption='USER_ENTERED',
                     body={'values': [data_row]}
                 ).execute()
-                print(f"✅ Appended to {sheet_name}: {data_row[0]}")
-                
-            return True
-        except Exception as e:
-            print(f"⚠️ Error checking/updating row in {sheet_name}: {e}")
-            # Fallback to append if anything goes wrong
-            service.spreadsheets().values().append(
-                spreadsheetId=sheet_id,
-                range=f"'{sheet_name}'!A2",
-                valueInputOption='USER_ENTERED',
-                body={'values': [data_row]}
-            ).execute()
-            return True
+                return True
 
     except Exception as e:
         print(f"❌ Sync to {sheet_name} FAILED: {e}")
@@ -250,42 +611,19 @@ def sync_student(student_id, name):
         str(datetime.now())
     ])
 
-def sync_attendance(student_id, name, date, check_in, check_out, status, check_in_location=None, check_out_location=None, address=None):
-    """Sync attendance to Google Sheets with ALL 15 columns"""
+def sync_attendance(student_id, name, date, check_in, check_out, status, check_in_location=None, check_out_location=None, address=None, check_out_address=None):
+    """Sync attendance to Google Sheets with ALL 15 columns
+
+    Never calls the geocoder: addresses come from the arguments or the geocode
+    cache, and attendance_geocoder patches in any that are still missing.
+    """
+    from geocode_cache import get_cached_address
+
     try:
         service, sheet_id = get_sheets_service()
         if not service:
             return False
         
-        # Ensure sheet exists with proper headers
-        attendance_headers = [
-            'Date', 'Student ID', 'Name', 'Check-In Time', 'Check-Out Time', 'Status',
-            'Check-In Location (Lat,Lng)', 'Check-In Latitude', 'Check-In Longitude', 'Check-In Address',
-            'Check-Out Location (Lat,Lng)', 'Check-Out Latitude', 'Check-Out Longitude', 'Check-Out Address',
-            'Sync Timestamp'
-        ]
-        
-        # Ensure sheet exists
-        try:
-            spreadsheet = service.spreadsheets().get(spreadsheetId=sheet_id).execute()
-            sheets = [s['properties']['title'] for s in spreadsheet.get('sheets', [])]
-            
-            if 'Attendance' not in sheets:
-                service.spreadsheets().batchUpdate(
-                    spreadsheetId=sheet_id,
-                    body={'requests': [{'addSheet': {'properties': {'title': 'Attendance'}}}]}
-                ).execute()
-                # Add headers
-                service.spreadsheets().values().update(
-                    spreadsheetId=sheet_id,
-                    range='Attendance!A1',
-                    valueInputOption='USER_ENTERED',
-                    body={'values': [attendance_headers]}
-                ).execute()
-                print("✅ Created Attendance sheet with headers")
-        except Exception as e:
-            print(f"⚠️ Error setting up sheet: {e}")
-        
         # Parse check-in location
         check_in_lat = ''
         check_in_lng = ''
@@ -297,16 +635,16 @@ def sync_attendance(student_id, name, date, check_in, check_out, status, check_i
                 if len(parts) == 2:
                     check_in_lat = parts[0].strip()
                     check_in_lng = parts[1].strip()
-                    # Get address if not provided
+                    # Use a cached address if not provided
                     if not check_in_addr:
-                        check_in_addr = get_address_from_coordinates(check_in_lat, check_in_lng)
+                        check_in_addr = get_cached_address(check_in_lat, check_in_lng) or ''
             except Exception as e:
                 print(f"⚠️ Error parsing check-in location: {e}")
         
         # Parse check-out location
         check_out_lat = ''
         check_out_lng = ''
-        check_out_addr = ''
+        check_out_addr = check_out_address or ''
         
         if check_out_location:
             try:
@@ -314,8 +652,8 @@ def sync_attendance(student_id, name, date, check_in, check_out, status, check_i
                 if len(parts) == 2:
                     check_out_lat = parts[0].strip()
                     check_out_lng = parts[1].strip()
-                    # Get address for check-out too
-                    check_out_addr = get_address_from_coordinates(check_out_lat, check_out_lng)
+                    if not check_out_addr:
+                        check_out_addr = get_cached_address(check_out_lat, check_out_lng) or ''
             except Exception as e:
                 print(f"⚠️ Error parsing check-out location: {e}")
         
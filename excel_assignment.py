@@ -8,8 +8,9 @@ from openpyxl.utils import get_column_letter
 from io import BytesIO
 import json
 import os
-import shutil
 import re
+from collections import namedtuple
+from xlsx_reader import XlsxBook, UnsafeWorkbookError
 
 def style_header(ws, row_num, cols):
     """Style header row"""
@@ -21,34 +22,50 @@ def style_header(ws, row_num, cols):
         cell.font = font
         cell.alignment = Alignment(horizontal='center', wrap_text=True)
 
+# Read once at import; every exercise workbook is loaded from these bytes, never from a temp copy on disk
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'excel_template.xlsm')
+try:
+    with open(TEMPLATE_PATH, 'rb') as f: TEMPLATE_BYTES = f.read()
+except OSError:
+    TEMPLATE_BYTES = None
+
+def load_template_workbook():
+    """Fresh copy of the VBA template workbook, or None if there is no template"""
+    if TEMPLATE_BYTES is None: return None
+    return openpyxl.load_workbook(BytesIO(TEMPLATE_BYTES), keep_vba=True)
+
+# Bump when a create_* helper changes, so cached exercise workbooks are rebuilt
+EXERCISE_VERSION = 1
+
+def exercise_variant(assignment_title=""):
+    """Which exercise set a title gets; the workbook depends on nothing else"""
+    if "Data Validation" in assignment_title and "Manager" in assignment_title: return 'data_validation'
+    if "Data Cleaning" in assignment_title and "Power Query" in assignment_title: return 'data_cleaning'
+    if "Excel Skill 4" in assignment_title or "Advanced LOOKUP" in assignment_title: return 'lookup'
+    return 'basics'
+
 def create_excel_exercise_workbook(assignment_title=""):
     """Create workbook with anti-cheating protection"""
-    template_path = os.path.join(os.path.dirname(__file__), 'excel_template.xlsm')
-    
-    if os.path.exists(template_path):
-        import tempfile
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsm', dir=os.path.dirname(__file__))
-        shutil.copy(template_path, temp_file.name)
-        temp_file.close()
-        wb = openpyxl.load_workbook(temp_file.name, keep_vba=True)
-        os.unlink(temp_file.name)
-    else:
+    wb = load_template_workbook()
+    from_template = wb is not None
+    if not from_template:
         wb = openpyxl.Workbook()
     
     if 'Sheet' in wb.sheetnames:
         wb.remove(wb['Sheet'])
     
-    if "Data Validation" in assignment_title and "Manager" in assignment_title:
+    variant = exercise_variant(assignment_title)
+    if variant == 'data_validation':
         create_instructions_dv(wb)
         create_named_manager_exercises(wb)
         create_dropdown_basic_exercises(wb)
         create_dropdown_advanced_exercises(wb)
         create_workbook_structure_exercise(wb)
-    elif "Data Cleaning" in assignment_title and "Power Query" in assignment_title:
+    elif variant == 'data_cleaning':
         create_instructions_skill3(wb)
         create_data_cleaning_exercises(wb)
         create_power_query_exercises(wb)
-    elif "Excel Skill 4" in assignment_title or "Advanced LOOKUP" in assignment_title:
+    elif variant == 'lookup':
         create_instructions_skill4(wb)
         create_lookup_function_exercises(wb)
         create_advanced_sumifs_exercises(wb)
@@ -62,7 +79,7 @@ def create_excel_exercise_workbook(assignment_title=""):
         create_if_nested_exercises(wb)
         create_complex_challenge(wb)
     
-    if os.path.exists(template_path):
+    if from_template:
         for sheetname in wb.sheetnames:
             if sheetname != 'Instructions':
                 wb[sheetname].sheet_state = 'veryHidden'
@@ -339,130 +356,131 @@ def create_complex_challenge(wb):
 # AUTO-GRADER
 
 def grade_excel_submission(file_path, assignment_title=""):
+    # Read the zip once; only the answer cells of the graded sheets are streamed
+    try:
+        book = XlsxBook(file_path)
+    except Exception as e: return {'error': f'Cannot open file: {str(e)}', 'score': 0}
     try:
-        wb = openpyxl.load_workbook(file_path, data_only=False)
+        return _grade_book(book, file_path, assignment_title)
     except Exception as e: return {'error': f'Cannot open file: {str(e)}', 'score': 0}
+    finally:
+        book.close()
+
+def _grade_book(book, file_path, assignment_title):
     cheating_detected = False; macros_disabled = False
-    if 'Instructions' in wb.sheetnames:
-        ws = wb['Instructions']; macro_flag = ws.cell(row=99, column=26).value; cheat_flag = ws.cell(row=100, column=26).value
+    if 'Instructions' in book.sheetnames:
+        flags = book.read_cells('Instructions', ['Z99', 'Z100'], formulas=True); macro_flag = flags['Z99']; cheat_flag = flags['Z100']
         if not macro_flag or str(macro_flag).upper() != 'MACROS_OK': macros_disabled = True
         if cheat_flag and 'CHEAT' in str(cheat_flag).upper(): cheating_detected = True
     if macros_disabled: return {'score': 0, 'max': 10, 'percentage': 0, 'cheating_detected': False, 'macros_disabled': True, 'details': {'error': 'Macros not enabled'}}
     if cheating_detected: return {'score': 0, 'max': 10, 'percentage': 0, 'cheating_detected': True, 'details': {'error': 'CHEATING DETECTED'}}
     total_score = 0; details = {}
-    if "Data Validation" in assignment_title and "Manager" in assignment_title:
+    variant = exercise_variant(assignment_title)
+    if variant == 'data_validation':
+        # Data validation rules and defined names need the full openpyxl object model
+        try:
+            wb = openpyxl.load_workbook(file_path, data_only=False)
+        except Exception as e: return {'error': f'Cannot open file: {str(e)}', 'score': 0}
         nm_score, nm_detail = grade_named_manager(wb); db_score, db_detail = grade_dropdown_basic(wb); da_score, da_detail = grade_dropdown_advanced(wb); wv_score, wv_detail = grade_workbook_validation(wb)
         total_score = nm_score + db_score + da_score + wv_score
         details['Named Manager'] = {'score': nm_score, 'max': 2.5, 'details': nm_detail}
         details['Dropdown Basic'] = {'score': db_score, 'max': 2.5, 'details': db_detail}
         details['Dropdown Advanced'] = {'score': da_score, 'max': 2.5, 'details': da_detail}
         details['Workbook Validation'] = {'score': wv_score, 'max': 2.5, 'details': wv_detail}
-    elif "Data Cleaning" in assignment_title and "Power Query" in assignment_title:
-        wb_vals = openpyxl.load_workbook(file_path, data_only=True)
-        dc_score, dc_detail = grade_data_cleaning(wb_vals); pq_score, pq_detail = grade_power_query(wb_vals)
-        total_score = dc_score + pq_score
-        details['Data Cleaning'] = {'score': dc_score, 'max': 5, 'details': dc_detail}
-        details['Power Query Basics'] = {'score': pq_score, 'max': 5, 'details': pq_detail}
-    elif "Excel Skill 4" in assignment_title or "Advanced LOOKUP" in assignment_title:
-        wb_vals = openpyxl.load_workbook(file_path, data_only=True)
-        l_score, l_detail = grade_lookup_function(wb_vals); s_score, s_detail = grade_advanced_sumifs(wb_vals); r_score, r_detail = grade_countifs_relationships(wb_vals); i_score, i_detail = grade_integrated_lookup(wb_vals)
-        total_score = l_score + s_score + r_score + i_score
-        details['LOOKUP Function'] = {'score': l_score, 'max': 2.5, 'details': l_detail}
-        details['Advanced SUMIFS'] = {'score': s_score, 'max': 2.5, 'details': s_detail}
-        details['COUNTIFS & Relationships'] = {'score': r_score, 'max': 2.5, 'details': r_detail}
-        details['Integrated Challenge'] = {'score': i_score, 'max': 2.5, 'details': i_detail}
     else:
-        wb_vals = openpyxl.load_workbook(file_path, data_only=True)
-        v_score, v_detail = grade_vlookup(wb_vals); s_score, s_detail = grade_sumif_countif(wb_vals); t_score, t_detail = grade_text_functions(wb_vals); if_score, if_detail = grade_if_nested(wb_vals); c_score, c_detail = grade_complex(wb_vals)
-        total_score = v_score + s_score + t_score + if_score + c_score
-        details['VLOOKUP'] = {'score': v_score, 'max': 2, 'details': v_detail}
-        details['SUMIF/COUNTIF'] = {'score': s_score, 'max': 2, 'details': s_detail}
-        details['Text Functions'] = {'score': t_score, 'max': 2, 'details': t_detail}
-        details['Nested IF'] = {'score': if_score, 'max': 2, 'details': if_detail}
-        details['Complex'] = {'score': c_score, 'max': 2, 'details': c_detail}
+        for name in VARIANT_SECTIONS[variant]:
+            spec = GRADING_SPECS[name]; s_score, s_detail = grade_section(book, spec)
+            total_score += s_score
+            details[name] = {'score': s_score, 'max': spec['max'], 'details': s_detail}
     return {'score': round(min(total_score, 10), 2), 'max': 10, 'percentage': round((min(total_score, 10) / 10) * 100, 1), 'cheating_detected': False, 'details': details}
 
-# GRADING HELPERS FOR SKILL 4
-
-def grade_lookup_function(wb):
+# GRADING SPECS
+# Each section lists the answer cells of one sheet. A check is
+# (label, cell or cells, match, expected, points); grade_section
+# streams only those cells out of the upload and scores them in order.
+# 'detail' is the key used in the per-question feedback (None = no feedback).
+
+# Bump when a spec or grader changes, so memoized grades are not reused
+RUBRIC_VERSION = 1
+
+Check = namedtuple('Check', ['label', 'cells', 'match', 'expected', 'points'])
+
+def _products(values): return [str(p).strip().upper() for p in values if p]
+
+MATCHERS = {
+    'contains': lambda vals, exp: bool(vals[0]) and exp in str(vals[0]).lower(),
+    'number': lambda vals, exp: _is_number(vals[0], exp),
+    'text': lambda vals, exp: all(v and str(v).strip().lower() == e.lower() for v, e in zip(vals, exp)),
+    'nonempty': lambda vals, exp: bool(vals[0]),
+    'distinct': lambda vals, exp: len(_products(vals)) == exp['count'] and all(p in _products(vals) for p in exp['includes']),
+    'uppercase': lambda vals, exp: all(p.isupper() for p in _products(vals) if p),
+}
+
+def _is_number(value, expected):
+    # Exact text match as in the original graders: 42000 or 42000.0 (typed as text counts too)
+    return bool(value) and str(value).strip() in (str(expected), f'{expected}.0')
+
+PQ_CELLS = tuple(f'G{r}' for r in range(5, 11))
+
+GRADING_SPECS = {
+    # Skill 1 - yellow cells in column C (D/E for nested IF)
+    'VLOOKUP': {'sheet': 'VLOOKUP', 'max': 2, 'detail': 'q', 'checks': [
+        Check('Q1', 'C19', 'contains', 'finance', 0.5), Check('Q2', 'C20', 'number', 42000, 0.5),
+        Check('Q3', 'C21', 'contains', 'islamabad', 0.5), Check('Q4', 'C22', 'contains', 'maryam', 0.5)]},
+    'SUMIF/COUNTIF': {'sheet': 'SUMIF & COUNTIF', 'max': 2, 'detail': 'q', 'checks': [
+        Check('Q5', 'C20', 'number', 157000, 0.33), Check('Q6', 'C21', 'number', 4, 0.33), Check('Q7', 'C22', 'number', 15, 0.33),
+        Check('Q8', 'C23', 'number', 7, 0.33), Check('Q9', 'C24', 'number', 82000, 0.33), Check('Q10', 'C25', 'number', 2, 0.33)]},
+    'Text Functions': {'sheet': 'LEFT RIGHT MID', 'max': 2, 'detail': 'q', 'checks': [
+        Check('Q11', 'C15', 'text', ('ahm',), 0.33), Check('Q12', 'C16', 'contains', '1234567', 0.33), Check('Q13', 'C17', 'contains', 'ahmed', 0.33),
+        Check('Q14', 'C18', 'contains', '2024', 0.33), Check('Q15', 'C19', 'contains', 'hotmail', 0.33), Check('Q16', 'C20', 'contains', 'fatima', 0.33)]},
+    'Nested IF': {'sheet': 'IF & NESTED IF', 'max': 2, 'detail': None, 'checks': [
+        Check(f'Row {r}', (f'D{r}', f'E{r}'), 'text', (g, s), 0.2) for r, g, s in [
+            (4, 'A+', 'Pass'), (5, 'A', 'Pass'), (6, 'B', 'Pass'), (7, 'C', 'Pass'), (8, 'D', 'Pass'),
+            (9, 'F', 'Fail'), (10, 'F', 'Fail'), (11, 'A', 'Pass'), (12, 'B', 'Pass'), (13, 'A+', 'Pass')]]},
+    'Complex': {'sheet': 'COMPLEX CHALLENGE', 'max': 2, 'detail': None, 'checks': [
+        Check('C20', 'C20', 'contains', 'lap', 0.2), Check('C21', 'C21', 'number', 5, 0.2), Check('C22', 'C22', 'number', 25, 0.2),
+        Check('C23', 'C23', 'number', 4500, 0.2), Check('C24', 'C24', 'contains', 'wireless', 0.2)] +
+        # Remaining cells only need some value (lenient)
+        [Check(f'C{r}', f'C{r}', 'nonempty', None, 0.2) for r in range(25, 30)]},
+    # Skill 3
+    'Data Cleaning': {'sheet': 'DATA CLEANING', 'max': 5, 'detail': 'task', 'checks': [
+        Check(f'Clean: {exp}', f'B{4 + i}', 'text', (exp,), 0.6) for i, exp in enumerate(["Muaaz Asif", "Python Programming", "Excel Skills", "John Doe", "Karachi-Pakistan"])] + [
+        Check(f'Split: {f} {l}', (f'B{15 + i}', f'C{15 + i}'), 'text', (f, l), 0.66) for i, (f, l) in enumerate([("Ali", "Khan"), ("Sara", "Ahmed"), ("Bilal", "Sheikh")])]},
+    'Power Query Basics': {'sheet': 'POWER QUERY', 'max': 5, 'detail': 'task', 'checks': [
+        Check('Duplicates Removed', PQ_CELLS, 'distinct', {'count': 5, 'includes': ("LAPTOP", "MOUSE")}, 2.5),
+        Check('Uppercase', PQ_CELLS, 'uppercase', None, 2.5)]},
+    # Skill 4
+    'LOOKUP Function': {'sheet': 'LOOKUP FUNCTION', 'max': 2.5, 'detail': 'q', 'checks': [
+        Check('Q1', 'B4', 'contains', 'cherry', 0.8), Check('Q2', 'B5', 'number', 50, 0.8), Check('Q3', 'B6', 'contains', 'cherry', 0.9)]},
+    'Advanced SUMIFS': {'sheet': 'ADVANCED SUMIFS', 'max': 2.5, 'detail': 'q', 'checks': [
+        Check('Q4', 'G4', 'number', 11000, 1.25), Check('Q5', 'G5', 'number', 3000, 1.25)]},
+    'COUNTIFS & Relationships': {'sheet': 'COUNTIFS & RELATIONSHIPS', 'max': 2.5, 'detail': 'q', 'checks': [
+        Check('Q6', 'B12', 'number', 3, 1.25), Check('Q7', 'B13', 'contains', 'sales', 1.25)]},
+    'Integrated Challenge': {'sheet': 'INTEGRATED CHALLENGE', 'max': 2.5, 'detail': 'q', 'checks': [
+        Check('Q8', 'B5', 'number', 6000, 1.0), Check('Q9', 'B6', 'number', 1, 0.75), Check('Q10', 'B7', 'number', 40, 0.75)]},
+}
+
+VARIANT_SECTIONS = {
+    'basics': ['VLOOKUP', 'SUMIF/COUNTIF', 'Text Functions', 'Nested IF', 'Complex'],
+    'data_cleaning': ['Data Cleaning', 'Power Query Basics'],
+    'lookup': ['LOOKUP Function', 'Advanced SUMIFS', 'COUNTIFS & Relationships', 'Integrated Challenge'],
+}
+
+def grade_section(book, spec):
+    """Score one GRADING_SPECS section by streaming only its answer cells"""
     score = 0; details = []
     try:
-        ws = wb['LOOKUP FUNCTION']
-        if ws['B4'].value and 'cherry' in str(ws['B4'].value).lower(): score += 0.8; details.append({'q': 'Q1', 'correct': True})
-        else: details.append({'q': 'Q1', 'correct': False})
-        if ws['B5'].value and str(ws['B5'].value).strip() in ['50', '50.0']: score += 0.8; details.append({'q': 'Q2', 'correct': True})
-        else: details.append({'q': 'Q2', 'correct': False})
-        if ws['B6'].value and 'cherry' in str(ws['B6'].value).lower(): score += 0.9; details.append({'q': 'Q3', 'correct': True})
-        else: details.append({'q': 'Q3', 'correct': False})
-    except: pass
-    return min(score, 2.5), details
-
-def grade_advanced_sumifs(wb):
-    score = 0; details = []
-    try:
-        ws = wb['ADVANCED SUMIFS']
-        if ws['G4'].value and str(ws['G4'].value).strip() in ['11000', '11000.0']: score += 1.25; details.append({'q': 'Q4', 'correct': True})
-        else: details.append({'q': 'Q4', 'correct': False})
-        if ws['G5'].value and str(ws['G5'].value).strip() in ['3000', '3000.0']: score += 1.25; details.append({'q': 'Q5', 'correct': True})
-        else: details.append({'q': 'Q5', 'correct': False})
-    except: pass
-    return min(score, 2.5), details
-
-def grade_countifs_relationships(wb):
-    score = 0; details = []
-    try:
-        ws = wb['COUNTIFS & RELATIONSHIPS']
-        if ws['B12'].value and str(ws['B12'].value).strip() in ['3', '3.0']: score += 1.25; details.append({'q': 'Q6', 'correct': True})
-        else: details.append({'q': 'Q6', 'correct': False})
-        if ws['B13'].value and 'sales' in str(ws['B13'].value).lower(): score += 1.25; details.append({'q': 'Q7', 'correct': True})
-        else: details.append({'q': 'Q7', 'correct': False})
-    except: pass
-    return min(score, 2.5), details
-
-def grade_integrated_lookup(wb):
-    score = 0; details = []
-    try:
-        ws = wb['INTEGRATED CHALLENGE']
-        if ws['B5'].value and str(ws['B5'].value).strip() in ['6000', '6000.0']: score += 1.0; details.append({'q': 'Q8', 'correct': True})
-        else: details.append({'q': 'Q8', 'correct': False})
-        if ws['B6'].value and str(ws['B6'].value).strip() in ['1', '1.0']: score += 0.75; details.append({'q': 'Q9', 'correct': True})
-        else: details.append({'q': 'Q9', 'correct': False})
-        if ws['B7'].value and str(ws['B7'].value).strip() in ['40', '40.0']: score += 0.75; details.append({'q': 'Q10', 'correct': True})
-        else: details.append({'q': 'Q10', 'correct': False})
-    except: pass
-    return min(score, 2.5), details
-
-# OTHER GRADING HELPERS
-
-def grade_data_cleaning(wb):
-    score = 0; details = []
-    try:
-        ws = wb['DATA CLEANING']; expected = ["Muaaz Asif", "Python Programming", "Excel Skills", "John Doe", "Karachi-Pakistan"]
-        for i, exp in enumerate(expected):
-            val = ws.cell(row=4+i, column=2).value
-            if val and str(val).strip().lower() == exp.lower(): score += 0.6; details.append({'task': f'Clean: {exp}', 'correct': True})
-            else: details.append({'task': f'Clean: {exp}', 'correct': False})
-        names = [("Ali", "Khan"), ("Sara", "Ahmed"), ("Bilal", "Sheikh")]
-        for i, (f, l) in enumerate(names):
-            fv = ws.cell(row=15+i, column=2).value; lv = ws.cell(row=15+i, column=3).value
-            if fv and str(fv).strip().lower() == f.lower() and lv and str(lv).strip().lower() == l.lower(): score += 0.66; details.append({'task': f'Split: {f} {l}', 'correct': True})
-            else: details.append({'task': f'Split: {f} {l}', 'correct': False})
-    except: pass
-    return min(score, 5), details
-
-def grade_power_query(wb):
-    score = 0; details = []
-    try:
-        ws = wb['POWER QUERY']; products = []
-        for r in range(5, 11):
-            p = ws.cell(row=r, column=7).value
-            if p: products.append(str(p).strip().upper())
-        if len(products) == 5 and "LAPTOP" in products and "MOUSE" in products: score += 2.5; details.append({'task': 'Duplicates Removed', 'correct': True})
-        else: details.append({'task': 'Duplicates Removed', 'correct': False})
-        if all(p.isupper() for p in products if p): score += 2.5; details.append({'task': 'Uppercase', 'correct': True})
-        else: details.append({'task': 'Uppercase', 'correct': False})
-    except: pass
-    return min(score, 5), details
+        checks = [(c, (c.cells,) if isinstance(c.cells, str) else c.cells) for c in spec['checks']]
+        values = book.read_cells(spec['sheet'], {cell for _, cells in checks for cell in cells})
+        for check, cells in checks:
+            correct = MATCHERS[check.match]([values[cell] for cell in cells], check.expected)
+            if correct: score += check.points
+            if spec['detail']: details.append({spec['detail']: check.label, 'correct': correct})
+    except UnsafeWorkbookError: raise
+    except Exception: pass
+    return min(score, spec['max']), details
+
+# DATA VALIDATION GRADERS (need the openpyxl object model)
 
 def grade_named_manager(wb):
     score = 0; details = []
@@ -521,88 +539,3 @@ def grade_workbook_validation(wb):
         else: details.append({'task': 'C9', 'correct': False})
     except: pass
     return min(score, 2.5), details
-
-def grade_vlookup(wb):
-    score = 0; details = []
-    try:
-        ws = wb['VLOOKUP']
-        # Yellow cells are in Column C (3), Rows 19, 20, 21, 22
-        if ws['C19'].value and 'finance' in str(ws['C19'].value).lower(): score += 0.5; details.append({'q': 'Q1', 'correct': True})
-        else: details.append({'q': 'Q1', 'correct': False})
-        if ws['C20'].value and str(ws['C20'].value).strip() in ['42000', '42000.0']: score += 0.5; details.append({'q': 'Q2', 'correct': True})
-        else: details.append({'q': 'Q2', 'correct': False})
-        if ws['C21'].value and 'islamabad' in str(ws['C21'].value).lower(): score += 0.5; details.append({'q': 'Q3', 'correct': True})
-        else: details.append({'q': 'Q3', 'correct': False})
-        if ws['C22'].value and 'maryam' in str(ws['C22'].value).lower(): score += 0.5; details.append({'q': 'Q4', 'correct': True})
-        else: details.append({'q': 'Q4', 'correct': False})
-    except: pass
-    return score, details
-
-def grade_sumif_countif(wb):
-    score = 0; details = []
-    try:
-        ws = wb['SUMIF & COUNTIF']
-        # Yellow cells are in Column C (3), Rows 20, 21, 22, 23, 24, 25
-        if ws['C20'].value and str(ws['C20'].value).strip() in ['157000', '157000.0']: score += 0.33; details.append({'q': 'Q5', 'correct': True})
-        else: details.append({'q': 'Q5', 'correct': False})
-        if ws['C21'].value and str(ws['C21'].value).strip() in ['4', '4.0']: score += 0.33; details.append({'q': 'Q6', 'correct': True})
-        else: details.append({'q': 'Q6', 'correct': False})
-        if ws['C22'].value and str(ws['C22'].value).strip() in ['15', '15.0']: score += 0.33; details.append({'q': 'Q7', 'correct': True})
-        else: details.append({'q': 'Q7', 'correct': False})
-        if ws['C23'].value and str(ws['C23'].value).strip() in ['7', '7.0']: score += 0.33; details.append({'q': 'Q8', 'correct': True})
-        else: details.append({'q': 'Q8', 'correct': False})
-        if ws['C24'].value and str(ws['C24'].value).strip() in ['82000', '82000.0']: score += 0.33; details.append({'q': 'Q9', 'correct': True})
-        else: details.append({'q': 'Q9', 'correct': False})
-        if ws['C25'].value and str(ws['C25'].value).strip() in ['2', '2.0']: score += 0.33; details.append({'q': 'Q10', 'correct': True})
-        else: details.append({'q': 'Q10', 'correct': False})
-    except: pass
-    return min(score, 2), details
-
-def grade_text_functions(wb):
-    score = 0; details = []
-    try:
-        ws = wb['LEFT RIGHT MID']
-        # Yellow cells are in Column C (3), Rows 15, 16, 17, 18, 19, 20
-        if ws['C15'].value and str(ws['C15'].value).strip().lower() == 'ahm': score += 0.33; details.append({'q': 'Q11', 'correct': True})
-        else: details.append({'q': 'Q11', 'correct': False})
-        if ws['C16'].value and '1234567' in str(ws['C16'].value): score += 0.33; details.append({'q': 'Q12', 'correct': True})
-        else: details.append({'q': 'Q12', 'correct': False})
-        if ws['C17'].value and 'ahmed' in str(ws['C17'].value).lower(): score += 0.33; details.append({'q': 'Q13', 'correct': True})
-        else: details.append({'q': 'Q13', 'correct': False})
-        if ws['C18'].value and '2024' in str(ws['C18'].value): score += 0.33; details.append({'q': 'Q14', 'correct': True})
-        else: details.append({'q': 'Q14', 'correct': False})
-        if ws['C19'].value and 'hotmail' in str(ws['C19'].value).lower(): score += 0.33; details.append({'q': 'Q15', 'correct': True})
-        else: details.append({'q': 'Q15', 'correct': False})
-        if ws['C20'].value and 'fatima' in str(ws['C20'].value).lower(): score += 0.33; details.append({'q': 'Q16', 'correct': True})
-        else: details.append({'q': 'Q16', 'correct': False})
-    except: pass
-    return min(score, 2), details
-
-def grade_if_nested(wb):
-    score = 0; details = []
-    try:
-        ws = wb['IF & NESTED IF']
-        # Yellow cells are in Column D (4) and E (5), Rows 4 to 13
-        students = [{'row': 4, 'g': 'A+', 's': 'Pass'}, {'row': 5, 'g': 'A', 's': 'Pass'}, {'row': 6, 'g': 'B', 's': 'Pass'}, {'row': 7, 'g': 'C', 's': 'Pass'}, {'row': 8, 'g': 'D', 's': 'Pass'}, {'row': 9, 'g': 'F', 's': 'Fail'}, {'row': 10, 'g': 'F', 's': 'Fail'}, {'row': 11, 'g': 'A', 's': 'Pass'}, {'row': 12, 'g': 'B', 's': 'Pass'}, {'row': 13, 'g': 'A+', 's': 'Pass'}]
-        for std in students:
-            g = str(ws.cell(row=std['row'], column=4).value or "").strip().upper()
-            s = str(ws.cell(row=std['row'], column=5).value or "").strip().lower()
-            if g == std['g'] and s == std['s'].lower(): score += 0.2
-    except: pass
-    return min(score, 2), details
-
-def grade_complex(wb):
-    score = 0; details = []
-    try:
-        ws = wb['COMPLEX CHALLENGE']
-        # Yellow cells are in Column C (3), Rows 20 to 29
-        if ws['C20'].value and 'lap' in str(ws['C20'].value).lower(): score += 0.2
-        if ws['C21'].value and str(ws['C21'].value).strip() in ['5', '5.0']: score += 0.2
-        if ws['C22'].value and str(ws['C22'].value).strip() in ['25', '25.0']: score += 0.2
-        if ws['C23'].value and str(ws['C23'].value).strip() in ['4500', '4500.0']: score += 0.2
-        if ws['C24'].value and 'wireless' in str(ws['C24'].value).lower(): score += 0.2
-        # Check remaining cells for some value (lenient)
-        for i in range(5):
-            if ws.cell(row=25+i, column=3).value: score += 0.2
-    except: pass
-    return min(score, 2), details
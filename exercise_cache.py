@@ -0,0 +1,107 @@
+"""
+Pre-built Excel exercise workbooks
+A generated exercise workbook depends only on the exercise variant picked
+by the assignment title, the VBA template and the generator code. Each one
+is built once, kept as immutable bytes in memory and on disk, and served
+with an ETag, so downloads cost no openpyxl work.
+
+Run `python exercise_cache.py` (startup.sh does) to build them before the
+first request; otherwise each is built on first download.
+"""
+import os
+import sys
+import hashlib
+import threading
+
+# Add the application directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+EXERCISE_CACHE_DIR = os.getenv(
+    'EXERCISE_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'exercise_cache')
+)
+
+_workbooks = {}  # cache key -> (bytes, etag)
+_template_digest = {'digest': None}
+_lock = threading.Lock()
+
+
+def _get_template_digest():
+    """Hash of the template bytes excel_assignment loaded at import"""
+    if _template_digest['digest'] is None:
+        from excel_assignment import TEMPLATE_BYTES
+        _template_digest['digest'] = hashlib.sha256(TEMPLATE_BYTES).hexdigest()[:16] if TEMPLATE_BYTES else 'none'
+    return _template_digest['digest']
+
+
+def cache_key(assignment_title):
+    from excel_assignment import exercise_variant, EXERCISE_VERSION
+
+    return f"{exercise_variant(assignment_title)}-{_get_template_digest()}-v{EXERCISE_VERSION}"
+
+
+def _build(assignment_title):
+    from io import BytesIO
+    from excel_assignment import create_excel_exercise_workbook
+
+    wb = create_excel_exercise_workbook(assignment_title=assignment_title)
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def _disk_path(key):
+    return os.path.join(EXERCISE_CACHE_DIR, f"{key}.xlsm")
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def get_exercise_workbook(assignment_title):
+    """(workbook bytes, etag) for an assignment title"""
+    key = cache_key(assignment_title)
+    cached = _workbooks.get(key)
+    if cached is not None:
+        return cached
+
+    with _lock:
+        cached = _workbooks.get(key)
+        if cached is not None:
+            return cached
+
+        path = _disk_path(key)
+        data = None
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            pass
+
+        if data is None:
+            data = _build(assignment_title)
+            try:
+                write_atomic(path, data)
+            except OSError as e:
+                print(f"⚠️ Could not write exercise workbook cache: {e}")
+            print(f"✅ Built exercise workbook {key}")
+
+        cached = (data, hashlib.sha256(data).hexdigest()[:32])
+        _workbooks[key] = cached
+        return cached
+
+
+def warm_exercise_cache():
+    """Build every exercise variant"""
+    # One title per variant of excel_assignment.exercise_variant
+    for title in ("Excel Skill 1", "Excel Skill 2: Data Validation & Name Manager",
+                  "Excel Skill 3: Data Cleaning & Power Query", "Excel Skill 4: Advanced LOOKUP"):
+        get_exercise_workbook(title)
+
+
+if __name__ == "__main__":
+    warm_exercise_cache()
@@ -0,0 +1,111 @@
+"""
+Reverse-geocoding cache for attendance locations
+Students check in from the same few places, so addresses are cached by
+rounded lat/lng: an in-memory LRU in front of a small SQLite file that
+survives restarts. Entries expire after a TTL.
+"""
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+GEOCODE_PRECISION = int(os.getenv('GEOCODE_PRECISION', '4'))  # decimals kept; 4 ~= 11 m
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', str(30 * 24 * 3600)))  # seconds
+GEOCODE_LRU_SIZE = int(os.getenv('GEOCODE_LRU_SIZE', '1024'))
+GEOCODE_CACHE_DB = os.getenv(
+    'GEOCODE_CACHE_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'geocode_cache.db')
+)
+
+_lru = OrderedDict()  # key -> (address, stored_at)
+_lock = threading.Lock()
+_db_ready = False
+
+
+def quantize(lat, lng, precision=None):
+    """Round coordinates to the cache grid. Returns a string key, or None if not numeric."""
+    if precision is None:
+        precision = GEOCODE_PRECISION
+    try:
+        return f"{float(lat):.{precision}f},{float(lng):.{precision}f}"
+    except (TypeError, ValueError):
+        return None
+
+
+def _connect():
+    global _db_ready
+    if not _db_ready:
+        os.makedirs(os.path.dirname(GEOCODE_CACHE_DB) or '.', exist_ok=True)
+    conn = sqlite3.connect(GEOCODE_CACHE_DB, timeout=5)
+    if not _db_ready:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode_cache ("
+            "coord_key TEXT PRIMARY KEY, address TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        conn.commit()
+        _db_ready = True
+    return conn
+
+
+def _remember(key, address, stored_at):
+    _lru[key] = (address, stored_at)
+    _lru.move_to_end(key)
+    while len(_lru) > GEOCODE_LRU_SIZE:
+        _lru.popitem(last=False)
+
+
+def get_cached_address(lat, lng):
+    """Cached address for the rounded coordinates, or None"""
+    key = quantize(lat, lng)
+    if key is None:
+        return None
+    now = time.time()
+
+    with _lock:
+        entry = _lru.get(key)
+        if entry and now - entry[1] < GEOCODE_CACHE_TTL:
+            _lru.move_to_end(key)
+            return entry[0]
+
+        try:
+            conn = _connect()
+            try:
+                row = conn.execute(
+                    "SELECT address, stored_at FROM geocode_cache WHERE coord_key = ?", (key,)
+                ).fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"⚠️ Geocode cache read error: {e}")
+            row = None
+
+        if row and now - row[1] < GEOCODE_CACHE_TTL:
+            _remember(key, row[0], row[1])
+            return row[0]
+
+        return None
+
+
+def store_address(lat, lng, address):
+    """Cache a successfully resolved address for the rounded coordinates"""
+    key = quantize(lat, lng)
+    if key is None or not address:
+        return
+    now = time.time()
+
+    with _lock:
+        _remember(key, address, now)
+        try:
+            conn = _connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO geocode_cache (coord_key, address, stored_at) VALUES (?, ?, ?)",
+                    (key, address, now)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"⚠️ Geocode cache write error: {e}")
+
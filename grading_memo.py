@@ -0,0 +1,59 @@
+"""
+Content-hash memo of grading results
+A result is stored under (SHA-256 of the submission, grader, rubric
+version), so an identical resubmission - a re-upload after a failed
+network attempt, or the same queries typed again - gets its grade back
+without parsing anything. The rubric version includes the assignment's
+rubric_version column, so bumping it invalidates that assignment only.
+"""
+import json
+import hashlib
+
+
+def content_hash(data):
+    """SHA-256 hex digest of the submitted bytes (or text)"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def rubric_key(assignment, code_version, *extra):
+    """Rubric version string: grader code version, assignment id and its rubric_version"""
+    parts = [f"v{code_version}", f"a{assignment.id}", f"r{assignment.rubric_version or 0}"]
+    parts.extend(str(e) for e in extra)
+    return '.'.join(parts)
+
+
+def get_memo(digest, grader, rubric_version):
+    """Stored result for this submission and rubric, or None"""
+    from app import GradingMemo
+
+    memo = GradingMemo.query.filter_by(
+        content_hash=digest, grader=grader, rubric_version=rubric_version
+    ).first()
+    if memo is None:
+        return None
+    try:
+        return json.loads(memo.result_json)
+    except ValueError:
+        return None
+
+
+def store_memo(digest, grader, rubric_version, result):
+    """Remember a result. Never raises: the grade itself is already saved."""
+    from app import db, GradingMemo
+    from sqlalchemy.exc import IntegrityError
+
+    try:
+        db.session.add(GradingMemo(
+            content_hash=digest,
+            grader=grader,
+            rubric_version=rubric_version,
+            result_json=json.dumps(result, default=str)
+        ))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # Same file graded twice at once; the first copy wins
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Could not store grading memo: {e}")
@@ -0,0 +1,256 @@
+"""
+Process-pool grading service
+Excel and midterm grading are CPU-bound openpyxl parses; run on a request
+thread they hold the GIL and stall the other gunicorn threads. Routes
+submit a grading job here and get a job id back; the file is graded in a
+worker process and a registered finisher writes the result to the
+database (inside an app context) when it is done. The status page polls
+the job.
+
+Jobs are kept in memory for JOB_RETENTION seconds; the pool, the queue
+bound, the per-job timeout and the per-worker memory limit are all
+configurable through the environment.
+"""
+import os
+import time
+import uuid
+import signal
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Each worker can take GRADING_MEMORY_MB, so the default stays small whatever the host reports
+GRADING_WORKERS = int(os.getenv('GRADING_WORKERS', str(min(2, os.cpu_count() or 1))))
+GRADING_QUEUE_PER_WORKER = 10
+GRADING_QUEUE_MAX = int(os.getenv('GRADING_QUEUE_MAX', str(GRADING_WORKERS * GRADING_QUEUE_PER_WORKER)))  # queued + running jobs
+GRADING_TIMEOUT = int(os.getenv('GRADING_TIMEOUT_SECONDS', '60'))
+GRADING_MEMORY_MB = int(os.getenv('GRADING_MEMORY_MB', '512'))  # address space per worker, 0 = no limit
+JOB_RETENTION = 3600  # seconds a finished job stays pollable
+
+# kind -> callable(context, result, error) run in an app context; returns (message, category)
+FINISHERS = {}
+
+_jobs = {}  # job id -> job dict
+_jobs_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class GradingQueueFull(Exception):
+    """Too many grading jobs are already waiting"""
+
+
+class GradingTimeout(Exception):
+    """A grading job ran longer than its timeout"""
+
+
+def register_finisher(kind):
+    """Decorator: register the function that stores a finished job's result"""
+    def decorator(func):
+        FINISHERS[kind] = func
+        return func
+    return decorator
+
+
+# ---- worker process side ----
+
+def _init_worker(memory_mb):
+    # Let gunicorn handle Ctrl+C; the pool shuts down with the parent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_mb:
+        try:
+            import resource
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            print(f"⚠️ Could not set grading worker memory limit: {e}")
+
+
+_alarm_timeout = {'seconds': GRADING_TIMEOUT}  # limit of the job this worker is running
+
+
+def _on_alarm(signum, frame):
+    raise GradingTimeout(f"Grading took longer than {_alarm_timeout['seconds']}s")
+
+
+def _run_job(func, args, timeout):
+    """Runs in the worker: call the grader under an alarm"""
+    use_alarm = hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        _alarm_timeout['seconds'] = timeout
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.alarm(timeout)
+    try:
+        return func(*args)
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+
+
+# ---- web process side ----
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: forking a process that already runs threads is not safe
+            _executor = ProcessPoolExecutor(
+                max_workers=GRADING_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(GRADING_MEMORY_MB,)
+            )
+            print(f"✅ Grading pool started ({GRADING_WORKERS} workers)")
+        return _executor
+
+
+def _reset_executor(broken):
+    """Drop a pool whose worker died (e.g. killed for memory) so the next job gets a new one"""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    try:
+        broken.shutdown(wait=False)
+    except Exception:
+        pass
+
+
+def _prune_jobs(now):
+    for job_id in [j for j, job in _jobs.items()
+                   if job['finished_at'] and now - job['finished_at'] > JOB_RETENTION]:
+        del _jobs[job_id]
+
+
+def _active_count():
+    return sum(1 for job in _jobs.values() if job['status'] in ('queued', 'running'))
+
+
+def _new_job(kind, context, owner, next_url, timeout, now):
+    return {
+        'id': uuid.uuid4().hex,
+        'kind': kind,
+        'owner': owner,
+        'context': context,
+        'next_url': next_url,
+        'timeout': timeout,
+        'status': 'queued',
+        'message': None,
+        'category': None,
+        'created_at': now,
+        'started_at': None,
+        'finished_at': None,
+    }
+
+
+def _start_job(job, func, args):
+    executor = _get_executor()
+    try:
+        future = executor.submit(_run_job, func, args, job['timeout'])
+    except (BrokenProcessPool, RuntimeError):
+        _reset_executor(executor)
+        executor = _get_executor()  # _finish must reset this pool, not the dead one
+        future = executor.submit(_run_job, func, args, job['timeout'])
+    job['future'] = future
+    future.add_done_callback(lambda f: _finish(job, f, executor))
+
+
+def submit_job(kind, func, args, context, owner=None, next_url=None, timeout=None):
+    """Queue func(*args) for a worker process and return the job id.
+
+    func must be a module-level function (it is pickled by reference).
+    When it is done, FINISHERS[kind](context, result, error) stores the
+    result (error is the exception if grading failed or timed out).
+    timeout defaults to GRADING_TIMEOUT; batch jobs pass their own.
+    Raises GradingQueueFull when GRADING_QUEUE_MAX jobs are pending.
+    """
+    return submit_jobs(kind, func, [args], context, owner, next_url, timeout)[0]
+
+
+def submit_jobs(kind, func, args_list, context, owner=None, next_url=None, timeout=None, contexts=None):
+    """Queue func(*args) for each args in args_list, all or none; returns the job ids.
+
+    Every job gets the same context, unless contexts gives one per args.
+    Raises GradingQueueFull (and queues nothing) if they do not all fit
+    under GRADING_QUEUE_MAX.
+    """
+    if kind not in FINISHERS:
+        raise ValueError(f"No grading finisher registered for '{kind}'")
+    if contexts is None:
+        contexts = [context] * len(args_list)
+
+    now = time.time()
+    jobs = [_new_job(kind, job_context, owner, next_url, timeout or GRADING_TIMEOUT, now) for job_context in contexts]
+    with _jobs_lock:
+        _prune_jobs(now)
+        if _active_count() + len(jobs) > GRADING_QUEUE_MAX:
+            raise GradingQueueFull(f"{GRADING_QUEUE_MAX} grading jobs are already waiting")
+        for job in jobs:
+            _jobs[job['id']] = job
+
+    for job, args in zip(jobs, args_list):
+        _start_job(job, func, args)
+    return [job['id'] for job in jobs]
+
+
+def free_slots():
+    """How many more jobs fit in the queue right now"""
+    with _jobs_lock:
+        _prune_jobs(time.time())
+        return max(0, GRADING_QUEUE_MAX - _active_count())
+
+
+def _finish(job, future, executor):
+    """Done callback (runs on the pool's management thread)"""
+    from app import app, db
+
+    try:
+        result = future.result()
+        error = None
+    except BrokenProcessPool as e:
+        _reset_executor(executor)
+        result, error = None, e
+    except Exception as e:
+        result, error = None, e
+
+    if error is not None:
+        print(f"❌ Grading job {job['id']} ({job['kind']}) failed: {error}")
+    message, category = 'Grading failed, please contact the admin.', 'error'
+    try:
+        with app.app_context():
+            try:
+                message, category = FINISHERS[job['kind']](job['context'], result, error)
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Could not store grading result for job {job['id']}: {e}")
+                traceback.print_exc()
+    finally:
+        with _jobs_lock:
+            if job['status'] != 'failed':  # get_job may already have given up on it
+                job['status'] = 'failed' if error is not None else 'done'
+                job['message'] = message
+                job['category'] = category
+            job['finished_at'] = time.time()
+
+
+def get_job(job_id):
+    """Snapshot of a job for the status page, or None if unknown/expired"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        if job['status'] in ('queued', 'running'):
+            future = job.get('future')
+            if future is not None and future.running() and job['started_at'] is None:
+                job['status'] = 'running'
+                job['started_at'] = time.time()
+            # The worker alarm never fired (stuck in C code): stop the status page waiting for it
+            if job['started_at'] and time.time() - job['started_at'] > job['timeout'] * 2:
+                job['status'] = 'failed'
+                job['message'] = 'Grading timed out, please contact the admin.'
+                job['category'] = 'error'
+                job['finished_at'] = time.time()
+        return {k: job[k] for k in ('id', 'kind', 'owner', 'status', 'message', 'category', 'next_url')}
+
@@ -3,6 +3,12 @@ from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 import random
 import re
+import hashlib
+import zipfile
+import threading
+from io import BytesIO
+from xml.sax.saxutils import escape as xml_escape
+from types import MappingProxyType
 
 # ============================================
 # MASTER TASK BANK (100 TASKS) - EASY/MEDIUM MODE
@@ -30,8 +36,8 @@ def style_header(ws, row, col_start, cols, color="1F4E79"):
         cell.font = font
         cell.alignment = Alignment(horizontal='center', wrap_text=True)
 
-def get_task_bank():
-    """Returns 100 tasks with HIGH visual and logical variety"""
+def _build_task_bank_v1():
+    """100 tasks with HIGH visual and logical variety"""
     bank = {}
     
     problems = {
@@ -153,6 +159,65 @@ def get_task_bank():
         }
     return bank
 
+# ============================================
+# TASK BANK REGISTRY
+# ============================================
+# Each bank version is built once and never mutated. A MidTermAssignment
+# records the bank_version its workbook was generated from, and grading
+# uses that same version. To change a task, register a new builder under a
+# new version and keep the old one while assignments still use it.
+
+BANK_BUILDERS = {1: _build_task_bank_v1}
+CURRENT_BANK_VERSION = 1
+
+_banks = {}  # version -> TaskBank
+_banks_lock = threading.Lock()
+
+class TaskBank:
+    """Read-only task registry with lookup by task id and by topic"""
+
+    def __init__(self, version, tasks):
+        self.version = version
+        self._tasks = MappingProxyType({tid: MappingProxyType(dict(task)) for tid, task in tasks.items()})
+        topics = {}
+        for tid in sorted(tasks):
+            topics.setdefault(tasks[tid]['topic'], []).append(tid)
+        self._by_topic = MappingProxyType({topic: tuple(ids) for topic, ids in topics.items()})
+
+    def __getitem__(self, tid): return self._tasks[tid]
+    def __contains__(self, tid): return tid in self._tasks
+    def __iter__(self): return iter(self._tasks)
+    def __len__(self): return len(self._tasks)
+    def get(self, tid, default=None): return self._tasks.get(tid, default)
+    def items(self): return self._tasks.items()
+
+    @property
+    def topics(self): return tuple(self._by_topic)
+
+    def by_topic(self, topic):
+        """Task ids for a topic (e.g. 'SQL_MEDIUM'), in id order"""
+        return self._by_topic.get(topic, ())
+
+def get_task_bank(version=None):
+    """The task bank for a version (default: current), built once per process.
+
+    Raises KeyError for a version that is no longer in BANK_BUILDERS: an
+    assignment stamped with it must not be built or graded against another
+    bank's tasks.
+    """
+    if version is None:
+        version = CURRENT_BANK_VERSION
+    if version not in BANK_BUILDERS:
+        raise KeyError(f"Task bank version {version} is no longer available")
+    bank = _banks.get(version)
+    if bank is None:
+        with _banks_lock:
+            bank = _banks.get(version)
+            if bank is None:
+                bank = TaskBank(version, BANK_BUILDERS[version]())
+                _banks[version] = bank
+    return bank
+
 def make_basic_grader(tid):
     """Creates a grader that checks if the yellow cells are filled for a specific task"""
     def grade(wb, sheet_name):
@@ -219,9 +284,23 @@ def get_topic_name(i):
 # ---------------------------------------------------------
 # UNIQUE LAYOUT GENERATORS (HIGH VARIETY)
 # ---------------------------------------------------------
+# Generators write every random value through RandomCells, so the same
+# seed gives the same sheet and the fragment cache knows which cells vary.
+
+class RandomCells:
+    """Writes a task sheet's random values and remembers where they went"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.cells = []  # (row, column, make) in the order the rng is used
+
+    def put(self, ws, row, column, make):
+        self.cells.append((row, column, make))
+        return ws.cell(row=row, column=column, value=make(self.rng))
 
 def make_excel_logic_gen(tid, instruction):
-    def generate(ws):
+    def generate(ws, rc=None):
+        rc = rc or RandomCells(random)
         style = get_unique_style(tid)
         r_start = 2 + style['row_offset']
         c_start = 1 + style['col_offset']
@@ -265,27 +344,27 @@ def make_excel_logic_gen(tid, instruction):
             if data_type == 'email':
                 names = ['muaaz', 'sara', 'ali', 'fatima', 'zain', 'hina', 'taha']
                 domains = ['gmail.com', 'yahoo.pk', 'outlook.org', 'company.com']
-                ws.cell(row=r_start+4+i, column=c_start, value=f"{names[i-1]}@{domains[random.randint(0,3)]}")
-                ws.cell(row=r_start+4+i, column=c_start+1, value=random.choice(['Work', 'Personal']))
+                rc.put(ws, r_start+4+i, c_start, lambda rng, name=names[i-1]: f"{name}@{domains[rng.randint(0,3)]}")
+                rc.put(ws, r_start+4+i, c_start+1, lambda rng: rng.choice(['Work', 'Personal']))
             elif data_type == 'date':
-                ws.cell(row=r_start+4+i, column=c_start, value=f"2024-{random.randint(1,12):02d}-{random.randint(10,28)}")
-                ws.cell(row=r_start+4+i, column=c_start+1, value=random.randint(1, 365))
+                rc.put(ws, r_start+4+i, c_start, lambda rng: f"2024-{rng.randint(1,12):02d}-{rng.randint(10,28)}")
+                rc.put(ws, r_start+4+i, c_start+1, lambda rng: rng.randint(1, 365))
             elif data_type == 'currency':
-                ws.cell(row=r_start+4+i, column=c_start, value=random.randint(5000, 500000))
-                ws.cell(row=r_start+4+i, column=c_start+1, value=random.randint(1000, 4000))
+                rc.put(ws, r_start+4+i, c_start, lambda rng: rng.randint(5000, 500000))
+                rc.put(ws, r_start+4+i, c_start+1, lambda rng: rng.randint(1000, 4000))
             elif data_type == 'grades':
                 ws.cell(row=r_start+4+i, column=c_start, value=f"S-{100+i}")
-                ws.cell(row=r_start+4+i, column=c_start+1, value=random.randint(20, 100))
+                rc.put(ws, r_start+4+i, c_start+1, lambda rng: rng.randint(20, 100))
             elif data_type == 'text_clean':
                 dirty = [ "  muAAZ ASIF  ", "kArachI_pk ", "  -EXCEL- ", "  99_ID_##", "   sara-khan ", " p-r-o ", "  test  " ]
                 ws.cell(row=r_start+4+i, column=c_start, value=dirty[i-1])
                 ws.cell(row=r_start+4+i, column=c_start+1, value="Dirty")
             elif data_type == 'finance':
-                ws.cell(row=r_start+4+i, column=c_start, value=random.randint(100000, 10000000))
-                ws.cell(row=r_start+4+i, column=c_start+1, value=f"{random.uniform(5, 15):.2f}%")
+                rc.put(ws, r_start+4+i, c_start, lambda rng: rng.randint(100000, 10000000))
+                rc.put(ws, r_start+4+i, c_start+1, lambda rng: f"{rng.uniform(5, 15):.2f}%")
             else:
                 ws.cell(row=r_start+4+i, column=c_start, value=f"Item_{tid}_{i}")
-                ws.cell(row=r_start+4+i, column=c_start+1, value=random.randint(100, 999))
+                rc.put(ws, r_start+4+i, c_start+1, lambda rng: rng.randint(100, 999))
             
             # Target yellow cell
             ws.cell(row=r_start+4+i, column=c_start+2).fill = PatternFill(start_color="FFFF00", fill_type="solid")
@@ -296,7 +375,8 @@ def make_excel_logic_gen(tid, instruction):
     return generate
 
 def make_excel_advanced_gen(tid, instruction):
-    def generate(ws):
+    def generate(ws, rc=None):
+        rc = rc or RandomCells(random)
         style = get_unique_style(tid)
         r_start = 3 + style['row_offset']
         c_start = 1 + style['col_offset']
@@ -318,8 +398,8 @@ def make_excel_advanced_gen(tid, instruction):
         
         for r in range(1, 10):
             ws.cell(row=r_start+4+r, column=c_start+4, value=f"Ref_{tid}_{r}")
-            ws.cell(row=r_start+4+r, column=c_start+5, value=random.randint(1,1000))
-            ws.cell(row=r_start+4+r, column=c_start+6, value=random.choice(['A','B','C']))
+            rc.put(ws, r_start+4+r, c_start+5, lambda rng: rng.randint(1,1000))
+            rc.put(ws, r_start+4+r, c_start+6, lambda rng: rng.choice(['A','B','C']))
         
         ws.cell(row=r_start+4, column=c_start, value="EXECUTION AREA").font = Font(bold=True)
         
@@ -337,7 +417,7 @@ def make_excel_advanced_gen(tid, instruction):
             s_label = "Returned Value"
             
         ws.cell(row=r_start+5, column=c_start, value=p_label)
-        ws.cell(row=r_start+5, column=c_start+1, value=f"Key_{random.randint(1,9)}")
+        rc.put(ws, r_start+5, c_start+1, lambda rng: f"Key_{rng.randint(1,9)}")
         ws.cell(row=r_start+6, column=c_start, value=s_label)
         ws.cell(row=r_start+6, column=c_start+1).fill = PatternFill(start_color="FFFF00", fill_type="solid")
         
@@ -347,7 +427,7 @@ def make_excel_advanced_gen(tid, instruction):
     return generate
 
 def make_sql_gen(tid, instruction):
-    def generate(ws):
+    def generate(ws, rc=None):
         style = get_unique_style(tid)
         r_start = 2 + style['row_offset']
         c_start = 1 + style['col_offset']
@@ -376,7 +456,8 @@ def make_sql_gen(tid, instruction):
     return generate
 
 def make_power_query_gen(tid, instruction):
-    def generate(ws):
+    def generate(ws, rc=None):
+        rc = rc or RandomCells(random)
         style = get_unique_style(tid)
         r_start = 2 + style['row_offset']
         c_start = 1 + style['col_offset']
@@ -395,9 +476,9 @@ def make_power_query_gen(tid, instruction):
         ws.cell(row=r_start+5, column=c_start+3, value="Timestamp")
         
         for r in range(1, rows):
-            ws.cell(row=r_start+5+r, column=c_start, value=f"  RAW_{random.randint(100,999)}  ")
+            rc.put(ws, r_start+5+r, c_start, lambda rng: f"  RAW_{rng.randint(100,999)}  ")
             ws.cell(row=r_start+5+r, column=c_start+1, value=f"data_val_{r}")
-            ws.cell(row=r_start+5+r, column=c_start+2, value=random.choice(['ERR','OK','NULL','-']))
+            rc.put(ws, r_start+5+r, c_start+2, lambda rng: rng.choice(['ERR','OK','NULL','-']))
             ws.cell(row=r_start+5+r, column=c_start+3, value="2024/01/01")
         
         ws.cell(row=r_start+5, column=c_start+cols+1, value="CLEAN DESTINATION").font = Font(bold=True)
@@ -409,7 +490,7 @@ def make_power_query_gen(tid, instruction):
     return generate
 
 def make_vba_gen(tid, instruction):
-    def generate(ws):
+    def generate(ws, rc=None):
         style = get_unique_style(tid)
         r_start = 2 + style['row_offset']
         c_start = 1 + style['col_offset']
@@ -432,7 +513,20 @@ def make_vba_gen(tid, instruction):
 # WORKBOOK ORCHESTRATION
 # ============================================
 
-def create_randomized_midterm(task_ids):
+def task_rng(seed, tid):
+    """Random source for one task of one student's exam.
+
+    The same (seed, task) always gives the same numbers, so a re-download
+    shows the student the data they already worked on. No seed = fresh
+    randomness on every call.
+    """
+    if seed is None:
+        return random.Random()
+    digest = hashlib.sha256(f"{seed}:{tid}".encode('utf-8')).digest()
+    return random.Random(int.from_bytes(digest[:8], 'big'))
+
+def _render_midterm(task_ids, bank_version, seed):
+    """openpyxl build of a midterm workbook; returns (wb, {tid: RandomCells})"""
     from excel_assignment import create_excel_exercise_workbook
     wb = create_excel_exercise_workbook("Midterm_Final_Medium")
     
@@ -455,13 +549,15 @@ def create_randomized_midterm(task_ids):
             try: wb.remove(wb[sheetname])
             except: pass
             
-    bank = get_task_bank()
+    bank = get_task_bank(bank_version)
+    random_cells = {}
     for tid in task_ids:
         if tid in bank:
             # High unique sheet name
             # We must use a predictable pattern so the grader can find it
             new_ws = wb.create_sheet(title=f"Task_{tid}")
-            bank[tid]['generate'](new_ws)
+            random_cells[tid] = RandomCells(task_rng(seed, tid))
+            bank[tid]['generate'](new_ws, random_cells[tid])
             
     ws['A1'] = "📊 RANDOMIZED MIDTERM EXAM - 100% UNIQUE & EASY"
     ws['A1'].font = Font(size=22, bold=True, color="C00000")
@@ -472,13 +568,207 @@ def create_randomized_midterm(task_ids):
     
     ws.column_dimensions['A'].width = 80
     wb.active = ws
+    return wb, random_cells
+
+def create_randomized_midterm(task_ids, bank_version=None, seed=None):
+    """Midterm workbook as an openpyxl object (see build_midterm_workbook for the fast path)"""
+    wb, _ = _render_midterm(task_ids, bank_version, seed)
     return wb
 
-def grade_randomized_midterm(file_path, task_ids):
+# ---------------------------------------------------------
+# SHEET FRAGMENT CACHE
+# ---------------------------------------------------------
+# Every task sheet of a bank version is rendered once, into one master
+# workbook, so all of them share its styles and shared strings. A student's
+# workbook is then spliced from the master's zip parts: the workbook part
+# lists only their sheets, and the cells RandomCells recorded are
+# overwritten with values from their (seed, task) rng.
+
+_CELL_XML = '<c r="{ref}"{style} t="{type}">{body}</c>'
+_SHEET_ENTRY_RE = re.compile(r'<sheet [^>]*?/>')
+_RELATIONSHIP_RE = re.compile(r'<Relationship [^>]*?/>')
+_OVERRIDE_RE = re.compile(r'<Override [^>]*?/>')
+_ATTR_RE = re.compile(r'([\w:]+)="([^"]*)"')
+
+_fragments = {}  # bank version -> MidtermFragments
+_fragments_lock = threading.Lock()
+
+def _drop_if(match, predicate):
+    """re.sub helper: remove an XML element when predicate(its attributes) holds"""
+    return '' if predicate(dict(_ATTR_RE.findall(match.group(0)))) else match.group(0)
+
+def _pin_modified_time(core_xml):
+    """core.xml with the modified time set to the (template's) created time"""
+    created = re.search(rb'<dcterms:created[^>]*>([^<]*)<', core_xml)
+    if created is None:
+        return core_xml
+    return re.sub(rb'(<dcterms:modified[^>]*>)[^<]*', lambda m: m.group(1) + created.group(1), core_xml)
+
+def _cell_xml(ref, style, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        body = f'<is><t xml:space="preserve">{xml_escape(str(value))}</t></is>'
+        return _CELL_XML.format(ref=ref, style=style, type='inlineStr', body=body)
+    return _CELL_XML.format(ref=ref, style=style, type='n', body=f'<v>{value!r}</v>')
+
+class _SheetFragment:
+    """A rendered worksheet part with holes where its random cells go"""
+
+    def __init__(self, xml, refs):
+        # refs: cell references in the order their values will be supplied
+        self.chunks, self.slots = [], []
+        cells = {}
+        for m in re.finditer(r'<c r="([A-Z]+[0-9]+)"([^>]*?)(?:/>|>.*?</c>)', xml, re.S):
+            cells[m.group(1)] = m
+        spans = []
+        for ref in refs:
+            m = cells[ref]
+            style = re.search(r' s="\d+"', m.group(2))
+            spans.append((m.start(), m.end(), ref, style.group(0) if style else ''))
+        pos = 0
+        for start, end, ref, style in sorted(spans):
+            self.chunks.append(xml[pos:start])
+            self.slots.append((ref, style))
+            pos = end
+        self.chunks.append(xml[pos:])
+        self.order = sorted(range(len(spans)), key=lambda i: spans[i][0])
+
+    def render(self, values):
+        """Sheet XML bytes with values (in refs order) filled in"""
+        values = [values[i] for i in self.order]
+        parts = [self.chunks[0]]
+        for (ref, style), value, chunk in zip(self.slots, values, self.chunks[1:]):
+            parts.append(_cell_xml(ref, style, value))
+            parts.append(chunk)
+        return ''.join(parts).encode('utf-8')
+
+class MidtermFragments:
+    """The master workbook of one bank version, split into reusable parts"""
+
+    def __init__(self, bank_version):
+        bank = get_task_bank(bank_version)
+        self.task_ids = sorted(bank)
+        wb, random_cells = _render_midterm(self.task_ids, bank_version, seed=0)
+        sheet_ids = {ws.title: tid for tid, ws in zip(self.task_ids, wb.worksheets[1:])}
+        output = BytesIO()
+        wb.save(output)
+
+        with zipfile.ZipFile(BytesIO(output.getvalue())) as zf:
+            self.parts = [(info, zf.read(info.filename)) for info in zf.infolist()]
+        # Same bytes from every process (pool workers pre-generate), so ETags agree:
+        # pin the zip timestamps and the save time openpyxl stamps into core.xml
+        for info, _ in self.parts:
+            info.date_time = (1980, 1, 1, 0, 0, 0)
+        self.parts = [(info, _pin_modified_time(data) if info.filename == 'docProps/core.xml' else data)
+                      for info, data in self.parts]
+        parts = {info.filename: data for info, data in self.parts}
+
+        # Sheet name -> part path, through workbook.xml and its rels
+        workbook_xml = parts['xl/workbook.xml'].decode('utf-8')
+        rels_xml = parts['xl/_rels/workbook.xml.rels'].decode('utf-8')
+        targets = {}
+        for rel in _RELATIONSHIP_RE.findall(rels_xml):
+            attrs = dict(_ATTR_RE.findall(rel))
+            targets[attrs['Id']] = 'xl/' + attrs['Target'].lstrip('/').replace('xl/', '', 1)
+        self.sheet_entries = {}  # tid (0 = Instructions) -> (<sheet .../>, rel id, part path)
+        for entry in _SHEET_ENTRY_RE.findall(workbook_xml):
+            attrs = dict(_ATTR_RE.findall(entry))
+            tid = 0 if attrs['name'] == 'Instructions' else sheet_ids[attrs['name']]
+            self.sheet_entries[tid] = (entry, attrs['r:id'], targets[attrs['r:id']])
+
+        # Task sheets: holes at the recorded random cells; Instructions: a hole at A7
+        self.random_cells = {tid: [(row, col, make) for row, col, make in rc.cells]
+                             for tid, rc in random_cells.items()}
+        self.sheets = {}
+        for tid, (_, _, path) in self.sheet_entries.items():
+            refs = ['A7'] if tid == 0 else [f"{get_column_letter(col)}{row}"
+                                           for row, col, _ in self.random_cells[tid]]
+            self.sheets[tid] = _SheetFragment(parts[path].decode('utf-8'), refs)
+
+        sheet_paths = {path for _, _, path in self.sheet_entries.values()}
+        self.sheet_paths = sheet_paths | {self._sheet_rels_path(p) for p in sheet_paths}
+        self.workbook_xml = workbook_xml
+        self.rels_xml = rels_xml
+        self.content_types = parts['[Content_Types].xml'].decode('utf-8')
+
+    @staticmethod
+    def _sheet_rels_path(path):
+        folder, name = path.rsplit('/', 1)
+        return f"{folder}/_rels/{name}.rels"
+
+    def build(self, task_ids, seed=None):
+        """xlsm bytes for a student's tasks, identical to create_randomized_midterm's"""
+        chosen = [0] + [tid for tid in task_ids if tid in self.sheet_entries]
+        keep_paths = {self.sheet_entries[tid][2] for tid in chosen}
+        keep_paths |= {self._sheet_rels_path(p) for p in keep_paths}
+        keep_rels = {self.sheet_entries[tid][1] for tid in chosen}
+        drop_parts = {'/' + p for p in self.sheet_paths - keep_paths}
+
+        # Sheets in the student's task order, numbered like openpyxl would
+        entries = []
+        for n, tid in enumerate(chosen, start=1):
+            entry = self.sheet_entries[tid][0]
+            entries.append(re.sub(r'sheetId="\d+"', f'sheetId="{n}"', entry))
+        workbook_xml = re.sub(r'<sheets>.*?</sheets>', lambda m: f"<sheets>{''.join(entries)}</sheets>",
+                              self.workbook_xml, flags=re.S)
+        rels_xml = _RELATIONSHIP_RE.sub(lambda m: _drop_if(
+            m, lambda a: a['Type'].endswith('/worksheet') and a['Id'] not in keep_rels), self.rels_xml)
+        content_types = _OVERRIDE_RE.sub(lambda m: _drop_if(
+            m, lambda a: a['PartName'] in drop_parts), self.content_types)
+
+        rendered = {self.sheet_entries[0][2]: self.sheets[0].render(
+            [f"Tasks Assigned: {', '.join(map(str, task_ids))}"])}
+        for tid in chosen[1:]:
+            rng = task_rng(seed, tid)
+            values = [make(rng) for _, _, make in self.random_cells[tid]]
+            rendered[self.sheet_entries[tid][2]] = self.sheets[tid].render(values)
+
+        output = BytesIO()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for info, data in self.parts:
+                name = info.filename
+                if name in self.sheet_paths and name not in keep_paths:
+                    continue
+                if name == 'xl/workbook.xml':
+                    data = workbook_xml.encode('utf-8')
+                elif name == 'xl/_rels/workbook.xml.rels':
+                    data = rels_xml.encode('utf-8')
+                elif name == '[Content_Types].xml':
+                    data = content_types.encode('utf-8')
+                elif name in rendered:
+                    data = rendered[name]
+                zf.writestr(info, data)
+        return output.getvalue()
+
+def get_midterm_fragments(bank_version=None):
+    """MidtermFragments for a bank version, rendered on first use"""
+    version = get_task_bank(bank_version).version
+    fragments = _fragments.get(version)
+    if fragments is None:
+        with _fragments_lock:
+            fragments = _fragments.get(version)
+            if fragments is None:
+                fragments = MidtermFragments(version)
+                _fragments[version] = fragments
+                print(f"✅ Midterm sheet fragments ready (bank v{version})")
+    return fragments
+
+def build_midterm_workbook(task_ids, bank_version=None, seed=None):
+    """xlsm bytes of a student's midterm, spliced from the fragment cache"""
+    return get_midterm_fragments(bank_version).build(task_ids, seed)
+
+# Bump when a task grader changes, so memoized grades are not reused
+RUBRIC_VERSION = 1
+
+def grade_randomized_midterm(file_path, task_ids, bank_version=None):
     try:
         wb = openpyxl.load_workbook(file_path, data_only=True)
     except: return 0, "Error"
-    bank = get_task_bank(); total_score = 0; details = []
+    try:
+        bank = get_task_bank(bank_version)
+    except KeyError as e:
+        print(f"❌ Cannot grade midterm: {e}")
+        return 0, "Error"
+    total_score = 0; details = []
     for tid in task_ids:
         if tid in bank:
             try:
@@ -0,0 +1,101 @@
+"""
+Per-student randomized midterm workbooks
+Randomized midterm workbooks are per student. They are kept in a bounded
+in-memory LRU keyed by (midterm, student) and on disk under
+MIDTERM_CACHE_DIR, both checked against a fingerprint of what they were
+built from (bank version, assigned tasks, seed), so a repeat download is a
+dict lookup and a reassignment rebuilds. assign_midterm pre-generates the
+whole class in a few parallel grading-pool jobs
+(pregenerate_midterm_workbooks), so the exam-start rush only reads files.
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from exercise_cache import EXERCISE_CACHE_DIR, write_atomic
+
+MIDTERM_CACHE_DIR = os.getenv('MIDTERM_CACHE_DIR', os.path.join(EXERCISE_CACHE_DIR, 'midterms'))
+MIDTERM_CACHE_MAX = int(os.getenv('MIDTERM_CACHE_MAX', '1000'))  # workbooks, ~20KB each
+PREGEN_SECONDS_PER_WORKBOOK = 2  # time budget per workbook for the pre-generation job
+
+_midterm_workbooks = OrderedDict()  # (midterm id, student id) -> (fingerprint, bytes, etag)
+_midterm_lock = threading.Lock()
+
+
+def midterm_spec(assignment):
+    """What a student's midterm workbook is built from, as a plain (picklable) tuple"""
+    return (assignment.mid_term_id, assignment.student_id, assignment.id,
+            assignment.bank_version or 1, assignment.assigned_sheets)
+
+
+def midterm_fingerprint(spec):
+    _, _, seed, bank_version, assigned_sheets = spec
+    return f"b{bank_version}-t{assigned_sheets}-s{seed}"
+
+
+def _midterm_disk_path(spec, fingerprint):
+    # Hashed name: student ids are free text, and a stale fingerprint never matches
+    digest = hashlib.sha256(f"{spec[0]}:{spec[1]}:{fingerprint}".encode('utf-8')).hexdigest()[:32]
+    return os.path.join(MIDTERM_CACHE_DIR, str(spec[0]), f"{digest}.xlsm")
+
+
+def _load_or_build_midterm(spec, fingerprint):
+    """Workbook bytes from disk, or built and written there"""
+    from midterm_bank import build_midterm_workbook
+
+    path = _midterm_disk_path(spec, fingerprint)
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        pass
+
+    task_ids = [int(tid.strip()) for tid in spec[4].split(',') if tid.strip()]
+    data = build_midterm_workbook(task_ids, spec[3], seed=spec[2])
+    try:
+        write_atomic(path, data)
+    except OSError as e:
+        print(f"⚠️ Could not write midterm workbook cache: {e}")
+    return data
+
+
+def get_midterm_workbook(assignment):
+    """(workbook bytes, etag) for a MidTermAssignment with assigned_sheets"""
+    spec = midterm_spec(assignment)
+    key = (spec[0], spec[1])
+    fingerprint = midterm_fingerprint(spec)
+    with _midterm_lock:
+        cached = _midterm_workbooks.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            _midterm_workbooks.move_to_end(key)
+            return cached[1], cached[2]
+
+    # Built outside the lock: a duplicate build on a race is cheaper than serializing downloads
+    data = _load_or_build_midterm(spec, fingerprint)
+    etag = hashlib.sha256(data).hexdigest()[:32]
+
+    with _midterm_lock:
+        _midterm_workbooks[key] = (fingerprint, data, etag)
+        _midterm_workbooks.move_to_end(key)
+        while len(_midterm_workbooks) > MIDTERM_CACHE_MAX:
+            _midterm_workbooks.popitem(last=False)
+    return data, etag
+
+
+def pregenerate_midterm_workbooks(specs):
+    """Grading-pool job: write each spec's workbook to disk.
+
+    Returns [(assignment id, fingerprint)] for the ones that are stored.
+    """
+    ready = []
+    for spec in specs:
+        fingerprint = midterm_fingerprint(spec)
+        try:
+            _load_or_build_midterm(spec, fingerprint)
+        except Exception as e:
+            print(f"⚠️ Could not pre-generate midterm workbook for {spec[1]}: {e}")
+            continue
+        if os.path.exists(_midterm_disk_path(spec, fingerprint)):
+            ready.append((spec[2], fingerprint))
+    return ready
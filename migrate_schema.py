@@ -0,0 +1,114 @@
+"""
+Bring an existing database up to date with the models in app.py
+Works for SQLite and PostgreSQL. Creates missing tables, adds missing
+(nullable) columns and creates missing indexes; never drops or rewrites
+anything. Safe to run on every start.
+"""
+import sys
+import os
+
+# Add the application directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_missing_columns(db):
+    """ALTER TABLE ... ADD COLUMN for model columns the database does not have yet"""
+    from sqlalchemy import inspect, text
+
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'))
+            added.append(f"{table.name}.{column.name}")
+
+    db.session.commit()
+    return added
+
+
+def find_duplicates(db, index):
+    """Key values that appear more than once for a unique index's columns"""
+    from sqlalchemy import select, func
+
+    columns = list(index.columns)
+    query = select(*columns, func.count().label('copies')) \
+        .group_by(*columns) \
+        .having(func.count() > 1)
+    return db.session.execute(query).fetchall()
+
+
+def add_missing_indexes(db):
+    """CREATE INDEX for model indexes the database does not have yet.
+
+    A unique index is skipped (and the offending keys reported) while the
+    table still holds duplicate rows, so the admin can clean them up first.
+    Returns (created, skipped) lists of index names.
+    """
+    from sqlalchemy import inspect
+
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    created, skipped = [], []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name in existing:
+                continue
+            if index.unique:
+                duplicates = find_duplicates(db, index)
+                if duplicates:
+                    cols = ', '.join(c.name for c in index.columns)
+                    print(f"⚠️ Not creating {index.name}: {len(duplicates)} duplicate ({cols}) keys in {table.name}")
+                    for row in duplicates[:20]:
+                        print(f"   {tuple(row[:-1])} x{row[-1]}")
+                    skipped.append(index.name)
+                    continue
+            index.create(db.engine)
+            created.append(index.name)
+
+    return created, skipped
+
+
+def migrate_database():
+    from app import app, db
+
+    print("Starting schema migration...")
+    with app.app_context():
+        try:
+            # New tables
+            db.create_all()
+
+            # New columns on existing tables
+            added = add_missing_columns(db)
+            for name in added:
+                print(f"Added column {name}")
+            if not added:
+                print("No missing columns")
+
+            # Indexes and unique constraints on existing tables
+            created, skipped = add_missing_indexes(db)
+            for name in created:
+                print(f"Created index {name}")
+            if skipped:
+                print(f"Skipped {len(skipped)} unique indexes - remove the duplicate rows above and run again")
+
+            print("Schema migration completed successfully!")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error during migration: {e}")
+            raise
+
+
+if __name__ == "__main__":
+    migrate_database()
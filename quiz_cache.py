@@ -0,0 +1,79 @@
+"""
+Per-quiz cache of questions, options and the answer key
+Quizzes are read-mostly once created, so take_quiz, view_quiz_result and
+quiz_report read question data from here instead of the database. Each
+entry is stamped with Quiz.revision; routes that change a quiz bump the
+revision, so a stale entry is never served.
+"""
+import threading
+from collections import namedtuple
+
+# Same attribute names as the models, so templates work with either
+CachedOption = namedtuple('CachedOption', ['id', 'question_id', 'option_text', 'is_correct'])
+CachedQuestion = namedtuple('CachedQuestion', ['id', 'quiz_id', 'question_number', 'question_text', 'options'])
+
+
+class CompiledQuiz:
+    """Immutable snapshot of one quiz revision"""
+
+    def __init__(self, quiz_id, revision, questions):
+        self.quiz_id = quiz_id
+        self.revision = revision
+        self.questions = tuple(questions)  # ordered by question_number
+        self.question_count = len(self.questions)
+        self.options_by_id = {o.id: o for q in self.questions for o in q.options}
+        # option id -> (question id, is_correct), used for grading
+        self.answer_key = {o.id: (o.question_id, bool(o.is_correct)) for o in self.options_by_id.values()}
+        # question id -> correct CachedOption (first one, like the old .first() query)
+        self.correct_options = {}
+        for q in self.questions:
+            correct = next((o for o in q.options if o.is_correct), None)
+            if correct is not None:
+                self.correct_options[q.id] = correct
+
+
+_cache = {}  # quiz_id -> CompiledQuiz
+_lock = threading.Lock()
+
+
+def _compile(quiz):
+    from app import QuizQuestion, QuizOption
+
+    questions = QuizQuestion.query.filter_by(quiz_id=quiz.id).order_by(QuizQuestion.question_number).all()
+    options = {}
+    if questions:
+        rows = QuizOption.query.filter(QuizOption.question_id.in_([q.id for q in questions])) \
+            .order_by(QuizOption.id).all()
+        for o in rows:
+            options.setdefault(o.question_id, []).append(
+                CachedOption(o.id, o.question_id, o.option_text, o.is_correct)
+            )
+
+    return CompiledQuiz(quiz.id, quiz.revision or 0, [
+        CachedQuestion(q.id, q.quiz_id, q.question_number, q.question_text, tuple(options.get(q.id, ())))
+        for q in questions
+    ])
+
+
+def get_compiled_quiz(quiz):
+    """Cached question data for a Quiz row, rebuilt if the quiz revision moved on"""
+    revision = quiz.revision or 0
+    compiled = _cache.get(quiz.id)
+    if compiled is not None and compiled.revision == revision:
+        return compiled
+
+    compiled = _compile(quiz)
+    with _lock:
+        _cache[quiz.id] = compiled
+    return compiled
+
+
+def bump_quiz_revision(quiz):
+    """Mark a quiz as changed. Call before committing the change."""
+    quiz.revision = (quiz.revision or 0) + 1
+    invalidate_quiz(quiz.id)
+
+
+def invalidate_quiz(quiz_id):
+    with _lock:
+        _cache.pop(quiz_id, None)
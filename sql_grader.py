@@ -1,8 +1,12 @@
+import os
 import sqlite3
-import pandas as pd
 import json
 import re
+import time
+import hashlib
+import threading
 from io import BytesIO
+from collections import namedtuple, Counter
 
 def get_sample_data_sql():
     """Returns the SQL to initialize the sample database"""
@@ -105,24 +109,83 @@ def get_sql_assignment_questions():
         }
     ]
 
+DIFF_SAMPLE_ROWS = 5  # rows of each kind listed in a task's diff
+
+def _normalize_value(value):
+    # SQLite hands back 3 and 3.0 for the same number depending on the
+    # expression; float sums can differ in the last bits with the order
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else round(value, 9)
+    return value
+
+def _sort_key(row):
+    # NULLs, then numbers, then text, then blobs (SQLite's own ordering)
+    return tuple(
+        (0, 0) if v is None else (1, v) if isinstance(v, (int, float))
+        else (2, v) if isinstance(v, str) else (3, bytes(v))
+        for v in row
+    )
+
+def _json_row(row):
+    return [v.hex() if isinstance(v, (bytes, memoryview)) else v for v in row]
+
+def compare_results(reference, columns, rows):
+    """Compare a student's result with a ReferenceResult.
+
+    Rows are compared in order when the expected query has an ORDER BY and
+    as a multiset otherwise; column names are compared case-insensitively.
+    Returns (correct, error message, diff) where diff is a JSON-ready dict
+    describing the mismatch (None when correct).
+    """
+    expected_columns = [c.lower() for c in reference.columns]
+    if len(columns) != len(reference.columns):
+        return False, f"Column mismatch. Expected {len(reference.columns)}, got {len(columns)}.", {
+            "expected_columns": list(reference.columns), "got_columns": list(columns)}
+    if [c.lower() for c in columns] != expected_columns:
+        return False, "Column names do not match expected output.", {
+            "expected_columns": list(reference.columns), "got_columns": list(columns)}
+
+    expected = [tuple(_normalize_value(v) for v in row) for row in reference.rows]
+    got = [tuple(_normalize_value(v) for v in row) for row in rows]
+    if expected == got:
+        return True, None, None
+
+    missing = Counter(expected) - Counter(got)
+    extra = Counter(got) - Counter(expected)
+    if not missing and not extra:
+        if not reference.ordered:
+            return True, None, None
+        first = next(n for n, (a, b) in enumerate(zip(expected, got)) if a != b)
+        return False, "Results do not match (Ordering matters).", {
+            "first_out_of_order_row": first, "expected_row": _json_row(expected[first]), "got_row": _json_row(got[first])}
+
+    missing_rows = sorted(missing.elements(), key=_sort_key)
+    extra_rows = sorted(extra.elements(), key=_sort_key)
+    error = "Results do not match (Ordering matters)." if reference.ordered else "Results do not match expected output."
+    return False, error, {
+        "expected_row_count": len(expected),
+        "got_row_count": len(got),
+        "missing_row_count": len(missing_rows),
+        "extra_row_count": len(extra_rows),
+        "missing_rows": [_json_row(r) for r in missing_rows[:DIFF_SAMPLE_ROWS]],
+        "extra_rows": [_json_row(r) for r in extra_rows[:DIFF_SAMPLE_ROWS]],
+    }
+
 def get_sample_data_as_excel(sample_sql=None):
     """Returns an Excel file as BytesIO containing all sample tables"""
     if not sample_sql:
         sample_sql = get_sample_data_sql()
         
-    conn = sqlite3.connect(':memory:')
+    conn = open_sandbox(sample_sql)
     cursor = conn.cursor()
     
     try:
-        # Initialize schema and data
-        cursor.executescript(sample_sql)
-        conn.commit()
-        
         # Get list of all tables in the database
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
         tables = [row[0] for row in cursor.fetchall() if row[0] != 'sqlite_sequence']
         
-        # Create Excel in memory
+        # Create Excel in memory (pandas only for this export; grading does not need it)
+        import pandas as pd
         output = BytesIO()
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
             for table_name in tables:
@@ -134,12 +197,203 @@ def get_sample_data_as_excel(sample_sql=None):
     finally:
         conn.close()
 
-def grade_sql_submission(student_queries, questions, sample_sql=None):
+# Bump when the comparison logic changes, so memoized grades are not reused
+RUBRIC_VERSION = 2
+
+# Result of one expected_query: column names, rows as tuples, whether the
+# query fixes the row order, or the error it raised
+ReferenceResult = namedtuple('ReferenceResult', 'columns rows ordered error')
+
+# Limits on student SQL, so a cartesian join or a runaway recursive CTE
+# cannot hold a request thread
+SQL_QUERY_TIMEOUT = float(os.getenv('SQL_QUERY_TIMEOUT_SECONDS', '2'))  # per query
+SQL_SUBMISSION_TIMEOUT = float(os.getenv('SQL_SUBMISSION_TIMEOUT_SECONDS', '10'))  # all queries of a submission
+SQL_MAX_ROWS = int(os.getenv('SQL_MAX_ROWS', '10000'))  # rows a query may return
+SQL_MAX_MEMORY_MB = int(os.getenv('SQL_MAX_MEMORY_MB', '64'))  # result size + tables/views the student creates
+PROGRESS_STEPS = 10000  # SQLite VM instructions between deadline checks
+
+REFERENCE_CACHE_MAX = 64  # distinct (sample_sql, questions) pairs kept
+SAMPLE_DB_CACHE_MAX = 16  # distinct sample_sql scripts kept as built databases
+
+_reference_results = {}  # (sample_sql hash, questions hash) -> [ReferenceResult]
+_reference_lock = threading.Lock()
+_sample_databases = {}  # sample_sql hash -> connection holding the built sample database
+_sample_lock = threading.Lock()
+
+def _sample_sql_hash(sample_sql):
+    return hashlib.sha256(sample_sql.encode('utf-8')).hexdigest()
+
+def open_sandbox(sample_sql=None):
+    """New in-memory database holding the sample data.
+
+    The script runs once per distinct sample_sql; every sandbox after that
+    is a page copy of the built database (Connection.backup), so its cost
+    does not depend on how long the script is.
+    """
+    if not sample_sql:
+        sample_sql = get_sample_data_sql()
+    key = _sample_sql_hash(sample_sql)
+    conn = sqlite3.connect(':memory:')
+    with _sample_lock:  # a connection must not be used by two threads at once
+        snapshot = _sample_databases.get(key)
+        if snapshot is None:
+            snapshot = sqlite3.connect(':memory:', check_same_thread=False)
+            try:
+                snapshot.executescript(sample_sql)
+            except Exception:
+                snapshot.close()
+                conn.close()
+                raise
+            if len(_sample_databases) >= SAMPLE_DB_CACHE_MAX:
+                _sample_databases.pop(next(iter(_sample_databases))).close()
+            _sample_databases[key] = snapshot
+        snapshot.backup(conn)
+    return conn
+
+class QueryBudgetExceeded(Exception):
+    """A student query ran out of time, rows or memory"""
+
+# Student SQL may not lift the page cap (PRAGMA), open other database files
+# (ATTACH, VACUUM INTO) or write to the uncapped temp database
+_DENIED_ACTIONS = {
+    sqlite3.SQLITE_PRAGMA, sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH,
+    sqlite3.SQLITE_CREATE_TEMP_TABLE, sqlite3.SQLITE_CREATE_TEMP_INDEX,
+    sqlite3.SQLITE_CREATE_TEMP_VIEW, sqlite3.SQLITE_CREATE_TEMP_TRIGGER,
+}
+_CREATE_ACTIONS = {  # denied in the temp schema ("CREATE TABLE temp.x")
+    sqlite3.SQLITE_CREATE_TABLE, sqlite3.SQLITE_CREATE_INDEX,
+    sqlite3.SQLITE_CREATE_VIEW, sqlite3.SQLITE_CREATE_TRIGGER,
+}
+
+def _authorize(action, arg1, arg2, db_name, trigger):
+    if action in _DENIED_ACTIONS or (action in _CREATE_ACTIONS and db_name == 'temp'):
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+class QueryBudget:
+    """Time, row and memory limits for one submission's sandbox connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.submission_deadline = time.monotonic() + SQL_SUBMISSION_TIMEOUT
+        self.deadline = None
+        self.timed_out = False
+        self.any_timed_out = False  # timing depends on load, so the grade should not be memoized
+        conn.set_progress_handler(self._check_deadline, PROGRESS_STEPS)
+        # Cap what the student can add to the database (CREATE TABLE ... AS, INSERT ...)
+        page_size, page_count = conn.execute('PRAGMA page_size').fetchone()[0], conn.execute('PRAGMA page_count').fetchone()[0]
+        conn.execute(f'PRAGMA max_page_count = {page_count + SQL_MAX_MEMORY_MB * 1024 * 1024 // page_size}')
+        conn.set_authorizer(_authorize)  # after our own PRAGMAs
+
+    def _check_deadline(self):
+        # Non-zero return makes SQLite abort the statement with "interrupted"
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.timed_out = True
+            return 1
+        return 0
+
+    @property
+    def exhausted(self):
+        return time.monotonic() >= self.submission_deadline
+
+    def start_query(self):
+        self.started = time.monotonic()
+        self.deadline = min(self.started + SQL_QUERY_TIMEOUT, self.submission_deadline)
+        self.timed_out = False
+
+    def timeout_error(self):
+        self.any_timed_out = True
+        return QueryBudgetExceeded(
+            f"Time limit exceeded: the query was stopped after {self.deadline - self.started:.1f}s.")
+
+def _estimate_size(row):
+    return sum(len(v) if isinstance(v, (str, bytes)) else 8 for v in row)
+
+def _fetch_limited(cursor, budget):
+    """fetchall with the budget's row and memory caps"""
+    rows, size = [], 0
+    max_bytes = SQL_MAX_MEMORY_MB * 1024 * 1024
+    while True:
+        chunk = cursor.fetchmany(500)
+        if not chunk:
+            return rows
+        rows.extend(chunk)
+        if len(rows) > SQL_MAX_ROWS:
+            raise QueryBudgetExceeded(f"Row limit exceeded: the query returned more than {SQL_MAX_ROWS} rows.")
+        size += sum(_estimate_size(row) for row in chunk)
+        if size > max_bytes:
+            raise QueryBudgetExceeded(f"Memory limit exceeded: the result is larger than {SQL_MAX_MEMORY_MB}MB.")
+
+def _run_task_query(conn, sql, budget=None):
+    """Execute a task query and return (columns, rows).
+
+    A CREATE VIEW is executed and its view selected from, so later tasks
+    can use it. With a budget, the query is stopped at its deadline and its
+    result capped (QueryBudgetExceeded).
+    """
+    if budget is not None:
+        budget.start_query()
+    try:
+        if re.search(r"CREATE\s+VIEW", sql, re.IGNORECASE):
+            conn.execute(sql)
+            conn.commit()
+            view_match = re.search(r"CREATE\s+VIEW\s+(\w+)", sql, re.IGNORECASE)
+            if not view_match:
+                return [], []
+            sql = f"SELECT * FROM {view_match.group(1)}"
+        cursor = conn.execute(sql)
+        columns = [d[0] for d in cursor.description] if cursor.description else []
+        rows = cursor.fetchall() if budget is None else _fetch_limited(cursor, budget)
+        return columns, rows
+    except sqlite3.OperationalError as e:
+        if budget is not None and budget.timed_out:
+            raise budget.timeout_error() from e
+        if 'database or disk is full' in str(e):
+            raise QueryBudgetExceeded(f"Memory limit exceeded: the query stored more than {SQL_MAX_MEMORY_MB}MB.") from e
+        raise
+
+def _build_reference_results(questions, sample_sql):
+    conn = open_sandbox(sample_sql)
+    try:
+        results = []
+        for q in questions:
+            expected_sql = q['expected_query']
+            ordered = "ORDER BY" in expected_sql.upper()
+            try:
+                columns, rows = _run_task_query(conn, expected_sql)
+                results.append(ReferenceResult(columns, rows, ordered, None))
+            except Exception as e:
+                results.append(ReferenceResult([], [], ordered, str(e)))
+        return results
+    finally:
+        conn.close()
+
+def get_reference_results(questions, sample_sql=None):
+    """Expected results for each question, computed once per (sample_sql, questions)"""
+    if not sample_sql:
+        sample_sql = get_sample_data_sql()
+    key = (
+        _sample_sql_hash(sample_sql),
+        hashlib.sha256(json.dumps([q['expected_query'] for q in questions]).encode('utf-8')).hexdigest()
+    )
+    results = _reference_results.get(key)
+    if results is None:
+        with _reference_lock:
+            results = _reference_results.get(key)
+            if results is None:
+                results = _build_reference_results(questions, sample_sql)
+                if len(_reference_results) >= REFERENCE_CACHE_MAX:
+                    _reference_results.pop(next(iter(_reference_results)))
+                _reference_results[key] = results
+    return results
+
+def grade_sql_submission(student_queries, questions, sample_sql=None, references=None):
     """
     Grades a student's SQL submission.
     student_queries: list of strings (queries for each task)
     questions: list of dicts with 'id', 'task', 'expected_query'
     sample_sql: SQL to initialize the database
+    references: get_reference_results(questions, sample_sql), if already computed
     """
     if not sample_sql:
         sample_sql = get_sample_data_sql()
@@ -148,18 +402,17 @@ def grade_sql_submission(student_queries, questions, sample_sql=None):
     max_score = len(questions)
     details = []
     
-    # Student's database (persists across tasks in case of VIEW creation)
-    conn_std = sqlite3.connect(':memory:')
-    conn_std.executescript(sample_sql)
+    # Expected results are the same for every student: computed once and cached
+    if references is None:
+        references = get_reference_results(questions, sample_sql)
     
-    # Reference database (for baseline results)
-    conn_ref = sqlite3.connect(':memory:')
-    conn_ref.executescript(sample_sql)
+    # Student's database (persists across tasks in case of VIEW creation)
+    conn_std = open_sandbox(sample_sql)
+    budget = QueryBudget(conn_std)
     
     try:
         for i, q in enumerate(questions):
             task_id = q['id']
-            expected_sql = q['expected_query']
             student_sql = student_queries[i] if i < len(student_queries) else ""
             
             task_result = {
@@ -174,66 +427,32 @@ def grade_sql_submission(student_queries, questions, sample_sql=None):
                 details.append(task_result)
                 continue
             
+            if budget.exhausted:
+                budget.any_timed_out = True
+                task_result["error"] = f"Not run: the submission's {SQL_SUBMISSION_TIMEOUT:g}s time limit was used up."
+                details.append(task_result)
+                continue
+            
             try:
-                # 1. Handle non-SELECT queries (CREATE VIEW, etc.)
-                is_create_view = bool(re.search(r"CREATE\s+VIEW", student_sql, re.IGNORECASE))
+                # 1. Run the student's query (a CREATE VIEW is created, then selected from)
+                student_columns, student_rows = _run_task_query(conn_std, student_sql, budget)
                 
-                if is_create_view:
-                    # Execute student's CREATE VIEW
-                    conn_std.execute(student_sql)
-                    conn_std.commit()
-                    
-                    # Extract view name
-                    view_match = re.search(r"CREATE\s+VIEW\s+(\w+)", student_sql, re.IGNORECASE)
-                    if view_match:
-                        view_name = view_match.group(1)
-                        student_df = pd.read_sql_query(f"SELECT * FROM {view_name}", conn_std)
-                    else:
-                        student_df = pd.DataFrame() # Fallback
-                else:
-                    # Regular SELECT query
-                    student_df = pd.read_sql_query(student_sql, conn_std)
-                
-                # 2. Get expected result
-                # If expected_sql is a CREATE VIEW, we execute it on ref DB first
-                if bool(re.search(r"CREATE\s+VIEW", expected_sql, re.IGNORECASE)):
-                    conn_ref.execute(expected_sql)
-                    conn_ref.commit()
-                    view_match_ref = re.search(r"CREATE\s+VIEW\s+(\w+)", expected_sql, re.IGNORECASE)
-                    if view_match_ref:
-                        view_name_ref = view_match_ref.group(1)
-                        expected_df = pd.read_sql_query(f"SELECT * FROM {view_name_ref}", conn_ref)
-                    else:
-                        expected_df = pd.DataFrame()
-                else:
-                    expected_df = pd.read_sql_query(expected_sql, conn_ref)
+                # 2. Get expected result (precomputed)
+                reference = references[i]
+                if reference.error is not None:
+                    raise sqlite3.Error(reference.error)
                 
                 # 3. Compare
-                if expected_df.equals(student_df):
+                correct, error, diff = compare_results(reference, student_columns, student_rows)
+                if correct:
                     task_result["correct"] = True
                     total_score += 1
                 else:
-                    # Normalize and compare
-                    if not expected_df.empty and not student_df.empty:
-                        # Check column count
-                        if len(expected_df.columns) == len(student_df.columns):
-                            # Sort for comparison if no ORDER BY
-                            if "ORDER BY" not in expected_sql.upper():
-                                # Try sorting by all columns
-                                exp_sorted = expected_df.sort_values(by=list(expected_df.columns)).reset_index(drop=True)
-                                std_sorted = student_df.sort_values(by=list(student_df.columns)).reset_index(drop=True)
-                                if exp_sorted.equals(std_sorted):
-                                    task_result["correct"] = True
-                                    total_score += 1
-                                else:
-                                    task_result["error"] = "Results do not match expected output."
-                            else:
-                                task_result["error"] = "Results do not match (Ordering matters)."
-                        else:
-                            task_result["error"] = f"Column mismatch. Expected {len(expected_df.columns)}, got {len(student_df.columns)}."
-                    else:
-                        task_result["error"] = "Results do not match expected output."
+                    task_result["error"] = error
+                    task_result["diff"] = diff
             
+            except QueryBudgetExceeded as e:
+                task_result["error"] = str(e)
             except Exception as e:
                 task_result["error"] = f"SQL Error: {str(e)}"
             
@@ -241,11 +460,21 @@ def grade_sql_submission(student_queries, questions, sample_sql=None):
             
     finally:
         conn_std.close()
-        conn_ref.close()
         
     return {
         "score": total_score,
         "max": max_score,
         "percentage": (total_score / max_score) * 100 if max_score > 0 else 0,
-        "details": details
+        "details": details,
+        "timed_out": budget.any_timed_out
     }
+
+def regrade_sql_batch(submissions, questions, sample_sql, references):
+    """Grading-pool job: grade [(submission id, queries)] against shared reference results.
+
+    Returns [(submission id, result)].
+    """
+    return [
+        (submission_id, grade_sql_submission(queries, questions, sample_sql, references))
+        for submission_id, queries in submissions
+    ]
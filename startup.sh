@@ -19,6 +19,12 @@ else
     echo "✅ SQLite database already exists."
 fi
 
+# Add any tables/columns introduced since the database was created
+python migrate_schema.py || echo "⚠️ migrate_schema.py failed, but continuing..."
+
+# Build the Excel exercise workbooks once so downloads are served from cache
+python exercise_cache.py || echo "⚠️ exercise_cache.py failed, workbooks will be built on first download"
+
 # Start the application with the arguments passed to this script
 echo "🎬 Starting application with: $@"
 exec "$@"
\ No newline at end of file
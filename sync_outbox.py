@@ -0,0 +1,247 @@
+"""
+Durable outbox for Google Sheets sync
+Routes enqueue a sync event and return right away; a background
+dispatcher thread drains the queue. Events live in the app database
+(SyncOutbox table) so they survive restarts.
+
+An event is added to the caller's transaction, so it exists exactly when
+the change it reports was committed. Dispatchers claim events (status
+'processing' plus a claim token) before running them, so several gunicorn
+workers never send the same event twice.
+"""
+import os
+import json
+import threading
+import time
+import uuid
+import traceback
+from datetime import datetime, timedelta
+
+# event_type -> callable(**payload) returning True on success
+HANDLERS = {}
+
+POLL_INTERVAL = int(os.getenv('SYNC_OUTBOX_POLL_SECONDS', '5'))
+BATCH_LIMIT = int(os.getenv('SYNC_OUTBOX_BATCH', '50'))
+BATCH_LINGER = float(os.getenv('SYNC_OUTBOX_LINGER_SECONDS', '1'))
+MAX_ATTEMPTS = 10  # Same give-up point as sync_utils.retry_failed_syncs
+CLAIM_TIMEOUT = 600  # seconds before a claim from a dead worker can be taken over
+
+_wake = threading.Event()
+_dispatcher_thread = None
+_dispatcher_lock = threading.Lock()
+_last_dispatch = {'at': None, 'processed': 0}
+_commit_listener = {'installed': False}
+
+
+def register_handler(event_type):
+    """Decorator: register the function that performs a sync event"""
+    def decorator(func):
+        HANDLERS[event_type] = func
+        return func
+    return decorator
+
+
+def _on_commit(session):
+    if session.info.pop('sync_outbox_pending', False):
+        _wake.set()
+
+
+def _install_commit_listener(db):
+    """Wake the dispatcher when a transaction holding outbox events commits"""
+    if _commit_listener['installed']:
+        return
+    from sqlalchemy import event as sa_event
+    with _dispatcher_lock:
+        if not _commit_listener['installed']:
+            sa_event.listen(db.session, 'after_commit', _on_commit)
+            _commit_listener['installed'] = True
+
+
+def enqueue_sync(event_type, **payload):
+    """Add a sync event to the caller's transaction.
+
+    Nothing is committed here: the event is stored when the caller commits
+    (and dropped with a rollback), and the dispatcher is woken then.
+    """
+    from app import db, SyncOutbox
+
+    if event_type not in HANDLERS:
+        raise ValueError(f"No sync handler registered for '{event_type}'")
+
+    event = SyncOutbox(
+        event_type=event_type,
+        payload=json.dumps(payload, default=str)
+    )
+    db.session.add(event)
+    db.session.info['sync_outbox_pending'] = True
+    _install_commit_listener(db)
+
+    start_dispatcher()
+    return event
+
+
+def _retry_delay(attempts):
+    """Exponential backoff: 10s, 20s, 40s ... capped at 10 minutes"""
+    return timedelta(seconds=min(600, 5 * (2 ** attempts)))
+
+
+def _mark_failed(event, error):
+    event.last_error = error
+    event.locked_by = None
+    event.locked_at = None
+    if event.attempts >= MAX_ATTEMPTS:
+        event.status = 'failed'
+        print(f"❌ Outbox event {event.id} ({event.event_type}) failed permanently: {error}")
+    else:
+        event.status = 'pending'
+        event.next_attempt_at = datetime.utcnow() + _retry_delay(event.attempts)
+
+
+def _claim_events(limit):
+    """Mark due events as ours and return them. A row claimed by another worker is skipped."""
+    from app import db, SyncOutbox
+
+    now = datetime.utcnow()
+    due = db.or_(
+        db.and_(SyncOutbox.status == 'pending', SyncOutbox.next_attempt_at <= now),
+        # Claimed by a worker that died mid-dispatch
+        db.and_(SyncOutbox.status == 'processing', SyncOutbox.locked_at < now - timedelta(seconds=CLAIM_TIMEOUT))
+    )
+    ids = [row.id for row in db.session.query(SyncOutbox.id).filter(due).order_by(SyncOutbox.id).limit(limit)]
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    # The status/locked_at condition is re-checked per row, so only one worker's update matches
+    SyncOutbox.query.filter(SyncOutbox.id.in_(ids), due).update(
+        {'status': 'processing', 'locked_by': token, 'locked_at': now}, synchronize_session=False)
+    db.session.commit()
+    return SyncOutbox.query.filter_by(locked_by=token).order_by(SyncOutbox.id).all()
+
+
+def dispatch_pending(limit=BATCH_LIMIT):
+    """Run due outbox events. Must be called inside an app context.
+
+    Handlers run inside a SheetsBatch, so their row upserts are coalesced and
+    written with one values.batchUpdate plus one append per sheet. An event is
+    only marked done once the batch holding its rows has been flushed.
+    """
+    from app import db, SyncOutbox
+    from clean_sheets_sync import get_sheets_service, SheetsBatch
+
+    service, _ = get_sheets_service()
+    if not service:
+        # Not configured (or credentials broken) - keep events pending instead of burning retries
+        return 0
+
+    events = _claim_events(limit)
+
+    processed = 0
+    batch = SheetsBatch()
+    queued = []  # events whose rows are waiting in the batch
+
+    def flush_queued():
+        nonlocal processed, queued
+        if batch.flush():
+            for event in queued:
+                event.status = 'done'
+                event.processed_at = datetime.utcnow()
+                event.last_error = None
+                event.locked_by = None
+            processed += len(queued)
+        else:
+            for event in queued:
+                _mark_failed(event, 'Batch flush failed')
+            batch.clear()
+        queued = []
+        db.session.commit()
+
+    for event in events:
+        handler = HANDLERS.get(event.event_type)
+        savepoint = batch.savepoint()
+        try:
+            if handler is None:
+                raise ValueError(f"No sync handler registered for '{event.event_type}'")
+            with batch.collecting():
+                success = handler(**json.loads(event.payload))
+            error = None if success else 'Handler reported failure'
+        except Exception as e:
+            success = False
+            error = str(e)
+            traceback.print_exc()
+
+        event.attempts = (event.attempts or 0) + 1
+        if success:
+            queued.append(event)
+        else:
+            # Rows the handler queued before failing would be sent now and again on retry
+            batch.rollback(savepoint)
+            _mark_failed(event, error)
+
+        if batch.should_flush():
+            flush_queued()
+
+    flush_queued()
+
+    _last_dispatch['at'] = datetime.utcnow()
+    _last_dispatch['processed'] = processed
+    return processed
+
+
+def _dispatcher_loop():
+    from app import app, db, SyncOutbox
+
+    with app.app_context():
+        try:
+            # Existing SQLite deployments skip init_db.py, so create the table on demand
+            SyncOutbox.__table__.create(db.engine, checkfirst=True)
+        except Exception as e:
+            print(f"⚠️ Could not ensure sync_outbox table: {e}")
+
+    while True:
+        if _wake.wait(POLL_INTERVAL):
+            # Linger briefly so a burst of submissions lands in one batch
+            time.sleep(BATCH_LINGER)
+        _wake.clear()
+        try:
+            with app.app_context():
+                while dispatch_pending() >= BATCH_LIMIT:
+                    pass  # Keep draining while full batches come back
+        except Exception as e:
+            print(f"❌ Sync outbox dispatcher error: {e}")
+            traceback.print_exc()
+
+
+def start_dispatcher():
+    """Start the background dispatcher thread once per process"""
+    global _dispatcher_thread
+    if _dispatcher_thread is not None and _dispatcher_thread.is_alive():
+        return
+    with _dispatcher_lock:
+        if _dispatcher_thread is not None and _dispatcher_thread.is_alive():
+            return
+        _dispatcher_thread = threading.Thread(target=_dispatcher_loop, name='sync-outbox', daemon=True)
+        _dispatcher_thread.start()
+        print("✅ Sync outbox dispatcher started")
+
+
+def get_outbox_stats():
+    """Queue depth and lag for the admin sync status page"""
+    from app import db, SyncOutbox
+
+    depth = SyncOutbox.query.filter(SyncOutbox.status.in_(['pending', 'processing'])).count()
+    failed = SyncOutbox.query.filter_by(status='failed').count()
+    oldest = db.session.query(db.func.min(SyncOutbox.created_at)).filter(
+        SyncOutbox.status.in_(['pending', 'processing'])
+    ).scalar()
+    lag_seconds = int((datetime.utcnow() - oldest).total_seconds()) if oldest else 0
+
+    return {
+        'depth': depth,
+        'failed': failed,
+        'oldest_pending': oldest,
+        'lag_seconds': lag_seconds,
+        'last_dispatch_at': _last_dispatch['at'],
+        'last_dispatch_processed': _last_dispatch['processed'],
+        'dispatcher_running': _dispatcher_thread is not None and _dispatcher_thread.is_alive()
+    }
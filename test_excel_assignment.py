@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for the Excel assignment grader (excel_assignment.py)
+Run with `python -m pytest test_excel_assignment.py` or directly as a script.
+"""
+
+import os
+import sys
+import zipfile
+from io import BytesIO
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from excel_assignment import (
+    GRADING_SPECS, VARIANT_SECTIONS, create_excel_exercise_workbook, grade_excel_submission, _is_number
+)
+from xlsx_reader import UnsafeWorkbookError, XlsxBook, _LimitedStream
+
+TITLE = 'Excel Skills Basics'
+
+
+def _answer(check):
+    # A correct answer for one check of the basics variant
+    if check.match == 'contains': return check.expected.title()
+    if check.match == 'number': return check.expected
+    if check.match == 'text': return check.expected
+    return 'x'
+
+
+def _filled_workbook(overrides=None):
+    wb = create_excel_exercise_workbook(TITLE)
+    if 'Instructions' not in wb.sheetnames: wb.create_sheet('Instructions')
+    wb['Instructions']['Z99'] = 'MACROS_OK'
+    for name in VARIANT_SECTIONS['basics']:
+        spec = GRADING_SPECS[name]; ws = wb[spec['sheet']]
+        for check in spec['checks']:
+            cells = (check.cells,) if isinstance(check.cells, str) else check.cells
+            values = _answer(check)
+            values = values if isinstance(values, tuple) else (values,)
+            for cell, value in zip(cells, values): ws[cell] = value
+    for (sheet, cell), value in (overrides or {}).items(): wb[sheet][cell] = value
+    output = BytesIO()
+    wb.save(output)
+    return BytesIO(output.getvalue())
+
+
+def test_number_match_is_exact():
+    assert _is_number(42000, 42000) and _is_number('42000', 42000) and _is_number(42000.0, 42000)
+    assert _is_number(' 42000.0 ', 42000)
+    assert not _is_number('42000.00', 42000)
+    assert not _is_number(42000.4, 42000)
+    assert not _is_number(None, 42000) and not _is_number('', 42000)
+
+
+def test_filled_workbook_gets_full_marks():
+    expected = sum(min(sum(c.points for c in GRADING_SPECS[n]['checks']), GRADING_SPECS[n]['max'])
+                   for n in VARIANT_SECTIONS['basics'])
+    result = grade_excel_submission(_filled_workbook(), TITLE)
+    assert result['score'] == round(expected, 2), result
+    assert all(d['correct'] for d in result['details']['VLOOKUP']['details'])
+
+
+def test_near_miss_number_loses_the_point():
+    result = grade_excel_submission(_filled_workbook({('VLOOKUP', 'C20'): '42000.00'}), TITLE)
+    q2 = [d for d in result['details']['VLOOKUP']['details'] if d['q'] == 'Q2'][0]
+    assert not q2['correct']
+    assert result['details']['VLOOKUP']['score'] == 1.5
+
+
+def test_macros_flag_required():
+    result = grade_excel_submission(_filled_workbook({('Instructions', 'Z99'): None}), TITLE)
+    assert result['score'] == 0 and result['macros_disabled']
+
+
+def _read_all(stream, size):
+    while stream.read(size):
+        pass
+
+
+def test_dtd_split_across_chunks_is_rejected():
+    data = b'<?xml version="1.0"?>' + b' ' * 10 + b'<!DOCTYPE x [<!ENTITY a "b">]><x/>'
+    split = data.index(b'<!DOCTYPE') + 4  # the marker straddles the first read
+    for size in (split, 1, 3, 7, len(data)):
+        try:
+            _read_all(_LimitedStream(BytesIO(data), 'xl/worksheets/sheet1.xml'), size)
+        except UnsafeWorkbookError as e:
+            assert 'DTD' in str(e)
+        else:
+            raise AssertionError(f'DTD not caught with {size}-byte reads')
+    _read_all(_LimitedStream(BytesIO(b'<x>' + b'<!-- DOC TYPE -->' * 100 + b'</x>'), 'p'), 5)
+
+
+def test_dtd_in_worksheet_fails_grading():
+    source = _filled_workbook().getvalue()
+    output = BytesIO()
+    with zipfile.ZipFile(BytesIO(source)) as zin, zipfile.ZipFile(output, 'w') as zout:
+        for info in zin.infolist():
+            data = zin.read(info.filename)
+            if info.filename.startswith('xl/worksheets/'):
+                data = b'<!DOCTYPE worksheet [<!ENTITY e "x">]>' + data
+            zout.writestr(info, data)
+    with XlsxBook(BytesIO(output.getvalue())) as book:
+        try:
+            book.read_cells(GRADING_SPECS['VLOOKUP']['sheet'], ['C19'])
+        except UnsafeWorkbookError:
+            pass
+        else:
+            raise AssertionError('DTD in a worksheet was not rejected')
+    result = grade_excel_submission(BytesIO(output.getvalue()), TITLE)
+    assert 'error' in result and result['score'] == 0
+
+
+if __name__ == '__main__':
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'✅ {name}')
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for the midterm task bank and the spliced workbook builder (midterm_bank.py)
+Run with `python -m pytest test_midterm_bank.py` or directly as a script.
+"""
+
+import os
+import sys
+from io import BytesIO
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import openpyxl
+from midterm_bank import (
+    BANK_BUILDERS, build_midterm_workbook, create_randomized_midterm, get_task_bank, grade_randomized_midterm
+)
+
+
+def _task_sets():
+    # One task of every topic, plus a run of consecutive ids in a shuffled order
+    bank = get_task_bank()
+    yield [bank.by_topic(topic)[0] for topic in bank.topics]
+    ids = sorted(bank)
+    yield [ids[i] for i in (7, 2, 11, 5, 0, 9, 3, 10, 1, 8) if i < len(ids)]
+
+
+def _cells(wb):
+    return {name: {(c.coordinate, c.value, c.number_format, c.font.b, c.fill.fgColor.rgb)
+                   for row in wb[name].iter_rows() for c in row if c.value is not None}
+            for name in wb.sheetnames}
+
+
+def _as_saved(wb):
+    output = BytesIO()
+    wb.save(output)
+    return openpyxl.load_workbook(BytesIO(output.getvalue()))
+
+
+def test_spliced_workbook_matches_full_render():
+    for task_ids in _task_sets():
+        for seed in (1, 4242):
+            spliced = openpyxl.load_workbook(BytesIO(build_midterm_workbook(task_ids, seed=seed)))
+            full = _as_saved(create_randomized_midterm(task_ids, seed=seed))
+            assert spliced.sheetnames == full.sheetnames
+            assert len(spliced.sheetnames) == len(task_ids) + 1
+            assert _cells(spliced) == _cells(full), (task_ids, seed)
+            assert spliced.active.title == 'Instructions'
+
+
+def test_build_is_deterministic_per_seed():
+    task_ids = next(_task_sets())
+    first = build_midterm_workbook(task_ids, seed=7)
+    assert build_midterm_workbook(task_ids, seed=7) == first
+    assert build_midterm_workbook(task_ids, seed=8) != first
+
+
+def test_unknown_task_ids_are_left_out():
+    bank = get_task_bank()
+    known = sorted(bank)[0]
+    wb = openpyxl.load_workbook(BytesIO(build_midterm_workbook([known, max(bank) + 1000], seed=1)))
+    assert len(wb.sheetnames) == 2 and wb.sheetnames[1].endswith(f'_{known}')
+
+
+def test_unknown_bank_version_is_an_error():
+    removed = max(BANK_BUILDERS) + 1
+    for build in (lambda: get_task_bank(removed), lambda: build_midterm_workbook([1], removed, seed=1)):
+        try:
+            build()
+        except KeyError:
+            pass
+        else:
+            raise AssertionError('a removed bank version fell back to another bank')
+    workbook = BytesIO(build_midterm_workbook([1], seed=1))
+    assert grade_randomized_midterm(workbook, [1], removed) == (0, "Error")
+
+
+if __name__ == '__main__':
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'✅ {name}')
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for bringing an old database up to date (migrate_schema.py)
+Run with `python -m pytest test_migrate_schema.py` or directly as a script.
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
+
+from migrate_schema import add_missing_columns, add_missing_indexes, find_duplicates
+
+
+def _make_app():
+    """Fresh in-memory database whose table predates the model's new column and indexes"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db = SQLAlchemy(app)
+
+    class Submission(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        quiz_id = db.Column(db.Integer, nullable=False, index=True)
+        student_id = db.Column(db.String(20), nullable=False)
+        feedback = db.Column(db.Text)  # added after the table was created
+        __table_args__ = (db.Index('uq_submission_quiz_student', 'quiz_id', 'student_id', unique=True),)
+
+    with app.app_context():
+        db.session.execute(text('CREATE TABLE submission (id INTEGER PRIMARY KEY, quiz_id INTEGER NOT NULL, '
+                                'student_id VARCHAR(20) NOT NULL)'))
+        db.session.commit()
+    return app, db, Submission
+
+
+def _index_names(db):
+    return {ix['name'] for ix in inspect(db.engine).get_indexes('submission')}
+
+
+def test_adds_missing_column():
+    app, db, _ = _make_app()
+    with app.app_context():
+        assert add_missing_columns(db) == ['submission.feedback']
+        assert 'feedback' in {c['name'] for c in inspect(db.engine).get_columns('submission')}
+        assert add_missing_columns(db) == []
+
+
+def test_unique_index_waits_for_duplicates_to_be_removed():
+    app, db, Submission = _make_app()
+    with app.app_context():
+        db.session.execute(text("INSERT INTO submission (quiz_id, student_id) VALUES "
+                                "(1, 'S1'), (1, 'S1'), (1, 'S2'), (2, 'S1')"))
+        db.session.commit()
+
+        index = next(ix for ix in Submission.__table__.indexes if ix.unique)
+        assert [tuple(row) for row in find_duplicates(db, index)] == [(1, 'S1', 2)]
+
+        created, skipped = add_missing_indexes(db)
+        assert skipped == ['uq_submission_quiz_student']
+        assert created == ['ix_submission_quiz_id']
+        assert _index_names(db) == {'ix_submission_quiz_id'}
+
+        db.session.execute(text("DELETE FROM submission WHERE id = 2"))
+        db.session.commit()
+        assert add_missing_indexes(db) == (['uq_submission_quiz_student'], [])
+        assert add_missing_indexes(db) == ([], [])
+
+
+if __name__ == '__main__':
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'✅ {name}')
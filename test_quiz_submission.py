@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for quiz submission (take_quiz in app.py) on a throwaway SQLite database
+Run with `python -m pytest test_quiz_submission.py` or directly as a script.
+"""
+
+import os
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+_db_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'test_quiz.db')}"
+
+import app as erp
+from app import app, db, Quiz, QuizAnswer, QuizAssignment, QuizOption, QuizQuestion, QuizSubmission, Student
+
+
+def _setup_quiz(student_id):
+    erp.init_app_data()
+    with app.app_context():
+        student = Student(student_id=student_id, name=f'Student {student_id}')
+        student.set_password('pw')
+        db.session.add(student)
+        quiz = Quiz(title=f'Quiz for {student_id}', created_by='admin')
+        db.session.add(quiz)
+        db.session.flush()
+        question = QuizQuestion(quiz_id=quiz.id, question_text='2 + 2?', question_number=1)
+        db.session.add(question)
+        db.session.flush()
+        right = QuizOption(question_id=question.id, option_text='4', is_correct=True)
+        db.session.add_all([right, QuizOption(question_id=question.id, option_text='5')])
+        db.session.add(QuizAssignment(quiz_id=quiz.id, student_id=student_id))
+        db.session.commit()
+        return quiz.id, {f'question_{question.id}': str(right.id)}
+
+
+def _client(student_id):
+    client = app.test_client()
+    client.post('/login', data={'username': student_id, 'password': 'pw', 'user_type': 'student'})
+    return client
+
+
+def _submissions(quiz_id):
+    with app.app_context():
+        return QuizSubmission.query.filter_by(quiz_id=quiz_id).all()
+
+
+def test_submitting_twice_keeps_the_first_submission():
+    quiz_id, answers = _setup_quiz('QS1')
+    client = _client('QS1')
+    first = client.post(f'/student/quizzes/{quiz_id}/take', data=answers)
+    second = client.post(f'/student/quizzes/{quiz_id}/take', data=answers)
+    assert first.status_code == second.status_code == 302
+    assert second.headers['Location'].endswith(f'/student/quizzes/{quiz_id}/result')
+    submissions = _submissions(quiz_id)
+    assert len(submissions) == 1 and submissions[0].score == 1
+
+
+def test_concurrent_submission_is_not_a_server_error():
+    # The other request inserts its submission after this one's "already taken?" check
+    quiz_id, answers = _setup_quiz('QS2')
+    original = erp.get_compiled_quiz
+
+    def racing_compiled_quiz(quiz):
+        with db.engine.begin() as conn:
+            conn.execute(db.insert(QuizSubmission), {'quiz_id': quiz_id, 'student_id': 'QS2', 'score': 0})
+        return original(quiz)
+
+    erp.get_compiled_quiz = racing_compiled_quiz
+    try:
+        response = _client('QS2').post(f'/student/quizzes/{quiz_id}/take', data=answers)
+    finally:
+        erp.get_compiled_quiz = original
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith(f'/student/quizzes/{quiz_id}/result')
+    submissions = _submissions(quiz_id)
+    assert len(submissions) == 1 and submissions[0].score == 0
+    with app.app_context():
+        assert QuizAnswer.query.filter_by(submission_id=submissions[0].id).count() == 0
+
+
+if __name__ == '__main__':
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'✅ {name}')
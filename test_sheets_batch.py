@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tests for batched Google Sheets writes (clean_sheets_sync.SheetsBatch) against an in-memory fake service
+Run with `python -m pytest test_sheets_batch.py` or directly as a script.
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import clean_sheets_sync as css
+from clean_sheets_sync import SheetsBatch
+
+SHEET_ID = 'test-sheet'
+_ROW_INDEX_FILE = css.ROW_INDEX_FILE
+
+
+class _Call:
+    def __init__(self, result): self._result = result
+    def execute(self): return self._result
+
+
+class FakeSheets:
+    """Just enough of the Sheets v4 client for SheetsBatch; records every write call"""
+
+    def __init__(self, tabs):
+        self.tabs = {name: [list(r) for r in rows] for name, rows in tabs.items()}
+        self.calls = []
+
+    def spreadsheets(self): return self
+    def values(self): return self
+
+    def get(self, spreadsheetId, range=None, fields=None):
+        if fields:  # spreadsheet metadata
+            return _Call({'sheets': [{'properties': {'title': t, 'sheetId': i}} for i, t in enumerate(self.tabs)]})
+        return _Call({'values': [list(r) for r in self.tabs[self._tab(range)]]})
+
+    def batchUpdate(self, spreadsheetId, body):
+        if 'requests' in body:  # addSheet
+            title = body['requests'][0]['addSheet']['properties']['title']
+            self.tabs[title] = []
+            return _Call({'replies': [{'addSheet': {'properties': {'sheetId': len(self.tabs)}}}]})
+        self.calls.append(('batchUpdate', len(body['data'])))
+        for update in body['data']:
+            self._put(update['range'], update['values'][0])
+        return _Call({})
+
+    def update(self, spreadsheetId, range, valueInputOption, body):
+        self._put(range, body['values'][0])
+        return _Call({})
+
+    def append(self, spreadsheetId, range, valueInputOption, body):
+        tab = self._tab(range)
+        self.calls.append(('append', tab, len(body['values'])))
+        first = len(self.tabs[tab]) + 1
+        self.tabs[tab].extend(list(r) for r in body['values'])
+        return _Call({'updates': {'updatedRange': f"'{tab}'!A{first}:Z{len(self.tabs[tab])}"}})
+
+    def _tab(self, a1):
+        return a1.split('!')[0].strip("'")
+
+    def _put(self, a1, row):
+        rows = self.tabs[self._tab(a1)]
+        number = int(a1.split('!A')[1])
+        while len(rows) < number:
+            rows.append([])
+        rows[number - 1] = list(row)
+
+
+def _use(fake):
+    css._google_service, css._google_sheet_id = fake, SHEET_ID
+    css.ROW_INDEX_FILE = None
+    css.invalidate_sheet_metadata()
+    css.invalidate_row_index()
+
+
+def teardown_module(module=None):
+    css._google_service, css._google_sheet_id = None, None
+    css.invalidate_sheet_metadata()
+    css.invalidate_row_index()
+    css.ROW_INDEX_FILE = _ROW_INDEX_FILE
+
+
+def _quiz(student_id, title, score):
+    return [student_id, f'Name {student_id}', title, score, 10, '2024-01-01 10:00:00']
+
+
+def test_existing_rows_are_updated_and_new_rows_appended():
+    header = css.SHEET_HEADERS['Quiz Results']
+    fake = FakeSheets({'Quiz Results': [header, _quiz('S1', 'Quiz 1', 3), _quiz('S2', 'Quiz 1', 4)]})
+    _use(fake)
+    batch = SheetsBatch()
+    batch.add('Quiz Results', _quiz('S2', 'Quiz 1', 9))
+    batch.add('Quiz Results', _quiz('S3', 'Quiz 1', 5))
+    batch.add('Quiz Results', _quiz('S3', 'Quiz 1', 6))  # same key: last write wins
+    batch.add('Quiz Results', _quiz('S4', 'Quiz 1', 7))
+    assert len(batch) == 3
+    assert batch.flush() and len(batch) == 0
+
+    assert fake.calls == [('batchUpdate', 1), ('append', 'Quiz Results', 2)]
+    rows = fake.tabs['Quiz Results']
+    assert [r[0] for r in rows[1:]] == ['S1', 'S2', 'S3', 'S4']
+    assert rows[2][3] == 9 and rows[3][3] == 6
+
+
+def test_appended_rows_are_updated_in_place_next_time():
+    fake = FakeSheets({'Quiz Results': [css.SHEET_HEADERS['Quiz Results']]})
+    _use(fake)
+    batch = SheetsBatch()
+    batch.add('Quiz Results', _quiz('S1', 'Quiz 1', 1))
+    batch.flush()
+    batch.add('Quiz Results', _quiz('S1', 'Quiz 1', 8))
+    batch.flush()
+    assert fake.calls == [('append', 'Quiz Results', 1), ('batchUpdate', 1)]
+    assert len(fake.tabs['Quiz Results']) == 2 and fake.tabs['Quiz Results'][1][3] == 8
+
+
+def test_missing_tab_is_created_with_headers():
+    fake = FakeSheets({})
+    _use(fake)
+    batch = SheetsBatch()
+    batch.add('Students', ['S1', 'Ali'])
+    assert batch.flush()
+    assert fake.tabs['Students'] == [css.SHEET_HEADERS['Students'], ['S1', 'Ali']]
+
+
+def test_rollback_drops_rows_added_after_savepoint():
+    batch = SheetsBatch()
+    batch.add('Quiz Results', _quiz('S1', 'Quiz 1', 1))
+    savepoint = batch.savepoint()
+    batch.add('Quiz Results', _quiz('S1', 'Quiz 1', 2))
+    batch.add('Students', ['S9', 'Bad'])
+    batch.rollback(savepoint)
+    assert len(batch) == 1
+    assert list(batch.pending) == ['Quiz Results']
+    assert list(batch.pending['Quiz Results'].values()) == [_quiz('S1', 'Quiz 1', 1)]
+
+
+if __name__ == '__main__':
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'✅ {name}')
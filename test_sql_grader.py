@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQL assignment grader (sql_grader.py)
+Run with `python -m pytest test_sql_grader.py` or directly as a script.
+"""
+
+import os
+import sys
+import sqlite3
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import sql_grader
+from sql_grader import (
+    ReferenceResult, QueryBudget, QueryBudgetExceeded, compare_results, open_sandbox, _run_task_query
+)
+
+ROWS = [(1, 'Ali', 'Karachi'), (2, 'Sara', 'Lahore'), (3, 'Omar', 'Karachi')]
+
+
+def _reference(rows=ROWS, ordered=False, columns=('id', 'name', 'city')):
+    return ReferenceResult(list(columns), list(rows), ordered, None)
+
+
+def test_compare_unordered_accepts_any_row_order():
+    correct, error, diff = compare_results(_reference(), ['id', 'name', 'city'], list(reversed(ROWS)))
+    assert correct and error is None and diff is None
+
+
+def test_compare_ordered_rejects_wrong_order():
+    correct, error, diff = compare_results(_reference(ordered=True), ['id', 'name', 'city'], list(reversed(ROWS)))
+    assert not correct
+    assert error == "Results do not match (Ordering matters)."
+    assert diff['first_out_of_order_row'] == 0
+
+
+def test_compare_is_a_multiset_not_a_set():
+    # A duplicated row is an extra row, not the same result
+    correct, _, diff = compare_results(_reference(), ['id', 'name', 'city'], ROWS + [ROWS[0]])
+    assert not correct
+    assert diff['extra_row_count'] == 1 and diff['missing_row_count'] == 0
+    assert diff['extra_rows'] == [list(ROWS[0])]
+
+
+def test_compare_reports_missing_rows():
+    correct, error, diff = compare_results(_reference(), ['id', 'name', 'city'], ROWS[:1])
+    assert not correct
+    assert error == "Results do not match expected output."
+    assert diff['expected_row_count'] == 3 and diff['got_row_count'] == 1
+    assert diff['missing_rows'] == [[2, 'Sara', 'Lahore'], [3, 'Omar', 'Karachi']]
+
+
+def test_compare_column_names_ignore_case():
+    correct, _, _ = compare_results(_reference(), ['ID', 'Name', 'CITY'], ROWS)
+    assert correct
+
+
+def test_compare_column_count_mismatch():
+    correct, error, diff = compare_results(_reference(), ['id', 'name'], [r[:2] for r in ROWS])
+    assert not correct
+    assert error == "Column mismatch. Expected 3, got 2."
+    assert diff['got_columns'] == ['id', 'name']
+
+
+def test_compare_numbers_are_normalized():
+    # SUM() may give 3.0 where the reference gives 3, or differ in the last float bits
+    reference = _reference(rows=[('a', 3), ('b', 0.3)], columns=('k', 'v'))
+    correct, _, _ = compare_results(reference, ['k', 'v'], [('a', 3.0), ('b', 0.1 + 0.2)])
+    assert correct
+
+
+COUNT_TO = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < {n}) "
+
+
+def _run_budgeted(sql):
+    conn = open_sandbox()
+    try:
+        return _run_task_query(conn, sql, QueryBudget(conn))
+    finally:
+        conn.close()
+
+
+def _expect_error(sql, exc_type, message):
+    try:
+        _run_budgeted(sql)
+    except exc_type as e:
+        assert message in str(e), str(e)
+    else:
+        raise AssertionError(f"{sql!r} was not stopped")
+
+
+def test_budget_stops_runaway_query():
+    old = sql_grader.SQL_QUERY_TIMEOUT
+    sql_grader.SQL_QUERY_TIMEOUT = 0.2
+    try:
+        _expect_error("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c",
+                      QueryBudgetExceeded, "Time limit exceeded")
+    finally:
+        sql_grader.SQL_QUERY_TIMEOUT = old
+
+
+def test_budget_caps_returned_rows():
+    _expect_error(COUNT_TO.format(n=sql_grader.SQL_MAX_ROWS + 1) + "SELECT x FROM c",
+                  QueryBudgetExceeded, "Row limit exceeded")
+    columns, rows = _run_budgeted(COUNT_TO.format(n=sql_grader.SQL_MAX_ROWS) + "SELECT x FROM c")
+    assert columns == ['x'] and len(rows) == sql_grader.SQL_MAX_ROWS
+
+
+def test_budget_caps_stored_data():
+    old = sql_grader.SQL_MAX_MEMORY_MB
+    sql_grader.SQL_MAX_MEMORY_MB = 1
+    try:
+        _expect_error("CREATE TABLE big AS " + COUNT_TO.format(n=4000) + "SELECT randomblob(1000) AS b FROM c",
+                      QueryBudgetExceeded, "Memory limit exceeded")
+    finally:
+        sql_grader.SQL_MAX_MEMORY_MB = old
+
+
+def test_budget_denies_pragma_attach_and_temp_tables():
+    for sql in ("PRAGMA max_page_count = 1000000000",
+                "SELECT * FROM pragma_table_info('Students')",
+                "ATTACH DATABASE ':memory:' AS other",
+                "VACUUM INTO ':memory:'",
+                "CREATE TEMP TABLE t AS SELECT 1",
+                "CREATE TABLE temp.t AS SELECT 1"):
+        _expect_error(sql, sqlite3.DatabaseError, "authoriz")  # "not authorized" / "authorization denied"
+
+
+def test_budget_allows_views_for_later_tasks():
+    conn = open_sandbox()
+    try:
+        budget = QueryBudget(conn)
+        _run_task_query(conn, "CREATE VIEW karachi AS SELECT * FROM Students WHERE city = 'Karachi'", budget)
+        columns, rows = _run_task_query(conn, "SELECT count(*) FROM karachi", budget)
+        assert rows[0][0] > 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'✅ {name}')
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming workbook reader used by the Excel grader (xlsx_reader.py)
+Run with `python -m pytest test_xlsx_reader.py` or directly as a script.
+"""
+
+import os
+import sys
+from datetime import datetime
+from io import BytesIO
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import openpyxl
+from xlsx_reader import XlsxBook
+
+CELLS = ['A1', 'A2', 'A3', 'A4', 'A5', 'A6', 'B1', 'B2', 'B3', 'C1', 'Z99']
+
+
+def _sample_workbook():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'Answers'
+    ws['A1'] = 'Finance'
+    ws['A2'] = 42000
+    ws['A3'] = 42000.5
+    ws['A4'] = True
+    ws['A5'] = datetime(2024, 3, 1, 9, 30)
+    ws['A6'] = ' 157000 '
+    ws['B1'] = '=SUM(A2:A3)'
+    ws['B2'] = '=A1'
+    ws['B3'] = 'Finance'  # repeated shared string
+    wb.create_sheet('Instructions')['Z99'] = 'MACROS_OK'
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def _openpyxl_values(data, sheet, data_only):
+    ws = openpyxl.load_workbook(BytesIO(data), data_only=data_only)[sheet]
+    return {c: ws[c].value for c in CELLS}
+
+
+def test_read_cells_matches_openpyxl():
+    data = _sample_workbook()
+    with XlsxBook(BytesIO(data)) as book:
+        assert book.read_cells('Answers', CELLS) == _openpyxl_values(data, 'Answers', True)
+        assert book.read_cells('Answers', CELLS, formulas=True) == _openpyxl_values(data, 'Answers', False)
+        assert book.read_cells('Instructions', ['Z99']) == {'Z99': 'MACROS_OK'}
+
+
+def test_read_cells_accepts_absolute_and_partial_sets():
+    data = _sample_workbook()
+    expected = _openpyxl_values(data, 'Answers', True)
+    with XlsxBook(BytesIO(data)) as book:
+        assert book.read_cells('Answers', ['$A$2', 'B3']) == {'$A$2': expected['A2'], 'B3': expected['B3']}
+        assert book.read_cells('Answers', ['A1']) == {'A1': expected['A1']}
+
+
+def test_sheetnames_and_missing_sheet():
+    with XlsxBook(BytesIO(_sample_workbook())) as book:
+        assert book.sheetnames == ['Answers', 'Instructions']
+        try:
+            book.read_cells('Missing', ['A1'])
+        except KeyError:
+            pass
+        else:
+            raise AssertionError('missing sheet was not reported')
+
+
+if __name__ == '__main__':
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'✅ {name}')